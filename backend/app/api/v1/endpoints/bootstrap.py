@@ -0,0 +1,90 @@
+# backend/app/api/v1/endpoints/bootstrap.py
+import asyncio
+import logging
+from fastapi import APIRouter, Depends, Query, Request
+from typing import Dict, Optional
+
+from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
+from app.services.stock import StockCache
+from app.services.product_index import ProductIndex
+from app.dependencies import get_woocommerce_service, get_stock_cache, get_fallback_catalog
+from app.api.v1.endpoints.stock import _parse_ids
+from app.utils.compression import PrecompressedJSONResponse, precompress
+from app.utils.fast_json import dumps as json_dumps
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get(
+    "/",
+    summary="Данные для первого экрана Mini App",
+    description=(
+        "Одним ответом возвращает все, что нужно Mini App при открытии: категории, первую страницу товаров "
+        "и остатки товаров корзины. Запросы к кэшу и WooCommerce выполняются на сервере параллельно. "
+        "Раздел, который не удалось получить, равен null, а причина записана в errors."
+    ),
+)
+async def get_bootstrap(
+    request: Request,
+    per_page: int = Query(10, ge=1, le=100, description="Количество товаров на первой странице"),
+    category: Optional[str] = Query(None, description="ID или slug категории первой страницы"),
+    cart: Optional[str] = Query(None, description="ID товаров корзины через запятую (для остатков)"),
+    wc_service: WooCommerceService = Depends(get_woocommerce_service),
+    stock_cache: StockCache = Depends(get_stock_cache),
+    fallback_catalog: Optional[ProductIndex] = Depends(get_fallback_catalog),
+):
+    cart_ids = _parse_ids(cart) if cart else []
+    snapshot_sections = []
+
+    # Те же параметры, что у /categories и /products по умолчанию: записи кэша общие с этими эндпоинтами
+    async def load_categories() -> bytes:
+        try:
+            entry = await wc_service.get_categories_entry(hide_empty=True)
+            return entry.body if entry is not None else b"[]"
+        except WooCommerceServiceError as e:
+            if e.is_unavailable and fallback_catalog is not None and fallback_catalog.categories:
+                snapshot_sections.append("categories")
+                return json_dumps(fallback_catalog.query_categories(hide_empty=True))
+            raise
+
+    async def load_products() -> bytes:
+        try:
+            entry = await wc_service.get_products_entry(page=1, per_page=per_page, category=category)
+            return entry.body if entry is not None else b"[]"
+        except WooCommerceServiceError as e:
+            if e.is_unavailable and fallback_catalog is not None:
+                body = fallback_catalog.render_products(fallback_catalog.query(category=category, limit=per_page))
+                if body is not None:
+                    snapshot_sections.append("products")
+                    return body
+            raise
+
+    async def load_stock() -> bytes:
+        if not cart_ids:
+            return b"{}"
+        stock = await stock_cache.get_stock(cart_ids)
+        return json_dumps({str(product_id): data for product_id, data in stock.items()})
+
+    sections = ("categories", "products", "stock")
+    results = await asyncio.gather(load_categories(), load_products(), load_stock(), return_exceptions=True)
+
+    # Тело собирается из готовых JSON-тел кэша без повторной сериализации
+    errors: Dict[str, str] = {}
+    parts = []
+    for name, result in zip(sections, results):
+        if isinstance(result, BaseException):
+            if isinstance(result, WooCommerceServiceError):
+                errors[name] = result.message
+            else:
+                logger.error(f"Bootstrap section '{name}' failed: {result}", exc_info=result)
+                errors[name] = "Внутренняя ошибка сервера."
+            result = b"null"
+        parts.append(b'"' + name.encode() + b'":' + result)
+    parts.append(b'"errors":' + json_dumps(errors))
+
+    headers = {"X-Catalog-Source": "snapshot"} if snapshot_sections else None
+    # Самый большой ответ при открытии Mini App: собранное тело сжимается один раз на запрос
+    body = b"{" + b",".join(parts) + b"}"
+    return PrecompressedJSONResponse(request, body, precompress(body), headers=headers)
@@ -1,13 +1,19 @@
 # backend/app/api/v1/endpoints/categories.py
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, status
 from typing import List, Optional, Dict
 
+import logging
+
 from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
-from app.dependencies import get_woocommerce_service
+from app.services.product_index import ProductIndex
+from app.dependencies import get_woocommerce_service, get_fallback_catalog
+from app.utils.compression import PrecompressedJSONResponse
+from app.utils.fast_json import FastJSONResponse
 # from app.models.product import Category # Для response_model
 
 # Создаем отдельный роутер для категорий
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.get(
     "/", # Путь "/" относительно префикса "/categories"
@@ -16,16 +22,25 @@ router = APIRouter()
     description="Получает список категорий товаров из WooCommerce.",
 )
 async def get_categories_list_endpoint( # Даем другое имя функции для ясности
+    request: Request,
     parent: Optional[int] = Query(None, description="ID родительской категории"),
     hide_empty: bool = Query(True, description="Скрыть пустые категории"),
     wc_service: WooCommerceService = Depends(get_woocommerce_service),
+    fallback_catalog: Optional[ProductIndex] = Depends(get_fallback_catalog),
 ):
     try:
-        categories = await wc_service.get_categories(parent=parent, hide_empty=hide_empty)
+        categories = await wc_service.get_categories_entry(parent=parent, hide_empty=hide_empty)
         if categories is None:
              raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Категории не найдены.")
-        return categories
+        return PrecompressedJSONResponse(request, categories.body, categories.variants)
     except WooCommerceServiceError as e:
+        # WooCommerce недоступен: отдаем категории из индекса каталога (поднятого из снимка или последней загрузки)
+        if e.is_unavailable and fallback_catalog is not None and fallback_catalog.categories:
+            logger.warning(f"WooCommerce unavailable ({e.message}). Serving categories from catalog snapshot.")
+            return FastJSONResponse(
+                fallback_catalog.query_categories(parent=parent, hide_empty=hide_empty),
+                headers={"X-Catalog-Source": "snapshot"},
+            )
         raise HTTPException(status_code=e.status_code or 503, detail=e.message)
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Внутренняя ошибка сервера при получении категорий.")
\ No newline at end of file
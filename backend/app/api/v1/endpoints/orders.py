@@ -1,15 +1,23 @@
 # backend/app/api/v1/endpoints/orders.py
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status, Body, BackgroundTasks
-from typing import List, Optional, Dict, Annotated
+import os
+from datetime import date, timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Body, BackgroundTasks, Query
+from fastapi.responses import StreamingResponse, FileResponse
+from starlette.background import BackgroundTask
+from typing import List, Literal, Optional, Dict, Annotated
 
 from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
 from app.services.telegram import TelegramService, TelegramNotificationError
 from app.models.order import OrderCreateWooCommerce, LineItemCreate, MetaData, OrderWooCommerce, BillingAddress
 from app.models.common import MetaData as CommonMetaData # Используем общую модель
-from app.dependencies import get_woocommerce_service, get_telegram_service, validate_telegram_data
+from app.services.stock import StockCache
+from app.services.order_index import OrderIndex
+from app.services.order_export import stream_orders_csv, build_orders_xlsx, ExportFormatUnavailableError, ExportTooLargeError
+from app.dependencies import get_woocommerce_service, get_telegram_service, get_stock_cache, get_order_index, get_local_order_index, validate_telegram_data, require_manager, rate_limit
 from app.core.config import settings
-from pydantic import BaseModel, Field # Импорт BaseModel и Field
+from app.utils.fast_json import FastJSONResponse, RawJSONResponse
+from pydantic import BaseModel, Field, ValidationError # Импорт BaseModel и Field
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +34,7 @@ class OrderPayload(BaseModel):
     summary="Создать новый заказ",
     description="Принимает данные корзины из Mini App, валидирует пользователя Telegram, создает заказ в WooCommerce и уведомляет менеджеров.",
     status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(rate_limit("orders"))],
 )
 async def create_new_order(
     payload: OrderPayload,
@@ -33,6 +42,8 @@ async def create_new_order(
     telegram_data: Annotated[Dict, Depends(validate_telegram_data)], # Зависимость для валидации TG
     wc_service: WooCommerceService = Depends(get_woocommerce_service),
     tg_service: TelegramService = Depends(get_telegram_service),
+    stock_cache: StockCache = Depends(get_stock_cache),
+    order_index: Optional[OrderIndex] = Depends(get_local_order_index),
 ):
     """
     Создает заказ в WooCommerce и ставит задачу отправки уведомления менеджерам в фон.
@@ -86,6 +97,8 @@ async def create_new_order(
 
         order_id = created_order.get("id")
         logger.info(f"Order ID {order_id} created successfully in WooCommerce for user {tg_user_id}.")
+        # Заказ списал остатки: следующий опрос /stock должен увидеть актуальные значения
+        stock_cache.invalidate(item.product_id for item in payload.line_items)
 
     except WooCommerceServiceError as e:
         logger.error(f"Failed to create order in WooCommerce for user {tg_user_id}: {e}")
@@ -94,7 +107,16 @@ async def create_new_order(
          logger.exception(f"Unexpected error during order creation for user {tg_user_id}: {e}")
          raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Непредвиденная ошибка при создании заказа.")
 
-    # 5. Отправка уведомления менеджерам в фоновом режиме
+    # 5. Добавляем заказ в локальный индекс, чтобы он сразу появился в "Моих заказах"
+    # (индекс ведется только для основного магазина)
+    if order_index is not None:
+        try:
+            await order_index.upsert_order(created_order)
+        except Exception as e:
+            # Периодическая синхронизация все равно подтянет заказ
+            logger.exception(f"Failed to add order {order_id} to local order index: {e}")
+
+    # 6. Отправка уведомления менеджерам в фоновом режиме
     # Используем BackgroundTasks, чтобы не задерживать ответ клиенту
     try:
         background_tasks.add_task(
@@ -107,11 +129,91 @@ async def create_new_order(
          # Логируем ошибку добавления задачи, но не прерываем процесс
          logger.exception(f"Failed to add notification task for order {order_id}: {e}")
 
-    # 6. Возвращаем данные созданного заказа (валидированные через Pydantic)
+    # 7. Возвращаем данные созданного заказа, провалидированные один раз.
+    # Готовый Response минует повторную валидацию по response_model и jsonable_encoder FastAPI.
     try:
-         validated_order_response = OrderWooCommerce.model_validate(created_order)
-         return validated_order_response
-    except Exception as e:
+        validated_order = OrderWooCommerce.model_validate(created_order)
+        return RawJSONResponse(
+            validated_order.model_dump_json().encode("utf-8"), status_code=status.HTTP_201_CREATED
+        )
+    except ValidationError as e:
         logger.error(f"Failed to validate WooCommerce order response for order {order_id}: {e}. Returning raw data.")
-        # Возвращаем "сырой" ответ, если валидация Pydantic не удалась
-        return created_order
\ No newline at end of file
+        # Заказ уже создан: возвращаем "сырой" ответ, а не ошибку, чтобы клиент не повторил заказ
+        return FastJSONResponse(created_order, status_code=status.HTTP_201_CREATED)
+
+
+@router.get(
+    "/me",
+    summary="Мои заказы",
+    description="Возвращает историю заказов текущего пользователя Telegram из локального индекса (новые сверху).",
+    dependencies=[Depends(rate_limit("catalog"))],
+)
+async def get_my_orders(
+    telegram_data: Annotated[Dict, Depends(validate_telegram_data)],
+    limit: int = Query(20, ge=1, le=100, description="Количество заказов"),
+    offset: int = Query(0, ge=0, description="Смещение"),
+    order_index: OrderIndex = Depends(get_order_index),
+):
+    tg_user_id = int(telegram_data['user']['id'])
+    try:
+        return await order_index.get_user_orders(tg_user_id, limit=limit, offset=offset)
+    except Exception as e:
+        logger.exception(f"Failed to read order history for user {tg_user_id}: {e}")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Не удалось получить историю заказов.")
+
+
+@router.get(
+    "/export",
+    summary="Выгрузка заказов для менеджеров",
+    description=(
+        "Выгружает заказы, созданные через Telegram Mini App, в CSV или XLSX. Доступно только менеджерам. "
+        "CSV отдается потоково; XLSX собирается целиком перед отправкой и ограничен EXPORT_XLSX_MAX_ROWS заказами."
+    ),
+    dependencies=[Depends(rate_limit("orders"))],
+)
+async def export_orders(
+    manager_data: Annotated[Dict, Depends(require_manager)],
+    format: Literal["csv", "xlsx"] = Query("csv", description="Формат файла"),
+    date_from: Optional[date] = Query(None, description="Начало периода (включительно)"),
+    date_to: Optional[date] = Query(None, description="Конец периода (включительно)"),
+    wc_service: WooCommerceService = Depends(get_woocommerce_service),
+):
+    after = f"{date_from.isoformat()}T00:00:00" if date_from else None
+    before = f"{(date_to + timedelta(days=1)).isoformat()}T00:00:00" if date_to else None
+    period = f"{date_from or 'start'}_{date_to or 'now'}"
+    logger.info(f"Manager {manager_data['user']['id']} requested {format} order export for {period}.")
+
+    if format == "csv":
+        stream = stream_orders_csv(wc_service, after=after, before=before)
+        # Первый фрагмент (после первой страницы заказов) получаем до ответа: ошибка WooCommerce здесь — обычный HTTP-ответ
+        try:
+            first_chunk = await stream.__anext__()
+        except WooCommerceServiceError as e:
+            await stream.aclose()
+            raise HTTPException(status_code=e.status_code or 503, detail=e.message)
+
+        async def body():
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+
+        return StreamingResponse(
+            body(),
+            media_type="text/csv; charset=utf-8",
+            headers={"Content-Disposition": f'attachment; filename="orders_{period}.csv"'},
+        )
+
+    try:
+        path = await build_orders_xlsx(wc_service, after=after, before=before)
+    except ExportFormatUnavailableError as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    except ExportTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except WooCommerceServiceError as e:
+        raise HTTPException(status_code=e.status_code or 503, detail=e.message)
+    return FileResponse(
+        path,
+        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        filename=f"orders_{period}.xlsx",
+        background=BackgroundTask(os.remove, path), # Удаляем временный файл после отправки
+    )
@@ -1,14 +1,31 @@
 # backend/app/api/v1/endpoints/products.py
-from fastapi import APIRouter, Depends, Query, HTTPException, status
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, status
 from typing import List, Optional, Dict
 
+import logging
+
 from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
-from app.dependencies import get_woocommerce_service
+from app.services.product_index import ProductIndex
+from app.services.facets import FacetIndex, FacetFilter
+from app.services.recommendations import CoPurchaseIndex
+from app.services.suggest import SuggestIndex
+from app.core.config import settings
+from app.dependencies import (
+    get_woocommerce_service, get_fallback_catalog, get_facet_index, get_product_index, get_co_purchase_index,
+    get_suggest_index,
+)
+from app.utils.compression import PrecompressedJSONResponse
+from app.utils.fast_json import FastJSONResponse, RawJSONResponse
 # Можно импортировать модели Pydantic для response_model, если нужно
 # from app.models.product import Product, Category
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
+# Ответы из снимка каталога помечаются заголовком, чтобы их было видно в логах прокси и на фронтенде
+SNAPSHOT_HEADERS = {"X-Catalog-Source": "snapshot"}
+
 @router.get(
     "/",
     # response_model=List[Product],
@@ -16,6 +33,7 @@ router = APIRouter()
     description="Получает список товаров из WooCommerce с пагинацией, фильтрацией и сортировкой.",
 )
 async def get_products_list(
+    request: Request,
     page: int = Query(1, ge=1, description="Номер страницы"),
     per_page: int = Query(10, ge=1, le=100, description="Количество товаров на странице"),
     category: Optional[str] = Query(None, description="ID или slug категории"),
@@ -25,9 +43,10 @@ async def get_products_list(
     orderby: str = Query('date', description="Поле сортировки"),
     order: str = Query('desc', description="Направление сортировки (asc, desc)"),
     wc_service: WooCommerceService = Depends(get_woocommerce_service),
+    fallback_catalog: Optional[ProductIndex] = Depends(get_fallback_catalog),
 ):
     try:
-        products = await wc_service.get_products(
+        products = await wc_service.get_products_entry(
             page=page,
             per_page=per_page,
             category=category,
@@ -41,8 +60,19 @@ async def get_products_list(
         if products is None:
              # Эта ветка маловероятна при использовании исключений, но оставим для надежности
              raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Товары не найдены.")
-        return products
+        # Отдаем JSON-тело из кэша как есть (или его заранее сжатый вариант): данные проверены при заполнении кэша
+        return PrecompressedJSONResponse(request, products.body, products.variants)
     except WooCommerceServiceError as e:
+        # WooCommerce недоступен: отдаем каталог из снимка (только чтение)
+        if e.is_unavailable and fallback_catalog is not None:
+            matched = fallback_catalog.query(
+                category=category, search=search, featured=featured, on_sale=on_sale, orderby=orderby, order=order,
+                limit=per_page, offset=(page - 1) * per_page,
+            )
+            body = fallback_catalog.render_products(matched)
+            if body is not None:
+                logger.warning(f"WooCommerce unavailable ({e.message}). Serving products list from catalog snapshot.")
+                return RawJSONResponse(body, headers=SNAPSHOT_HEADERS)
         # Ловим ошибку от нашего сервиса
         raise HTTPException(status_code=e.status_code or 503, detail=e.message)
     except Exception as e:
@@ -51,6 +81,72 @@ async def get_products_list(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Внутренняя ошибка сервера при получении товаров.")
 
 
+@router.get(
+    "/filter",
+    summary="Фасетный фильтр товаров",
+    description=(
+        "Фильтрует каталог по категориям, атрибутам, наличию, скидке и цене в любых сочетаниях "
+        "и возвращает страницу товаров (компактное представление из индекса) со счетчиками по фасетам. "
+        "Работает по локальному индексу, без запросов к WooCommerce."
+    ),
+)
+async def filter_products(
+    category: List[int] = Query([], description="ID категорий (любая из; с подкатегориями)"),
+    attr: List[str] = Query([], description="Значения атрибутов в виде slug:значение, например pa_color:Красный"),
+    in_stock: Optional[bool] = Query(None, description="Только в наличии / только нет в наличии"),
+    on_sale: Optional[bool] = Query(None, description="Фильтр по товарам со скидкой"),
+    min_price: Optional[float] = Query(None, ge=0, description="Минимальная цена (включительно)"),
+    max_price: Optional[float] = Query(None, ge=0, description="Максимальная цена (включительно)"),
+    search: Optional[str] = Query(None, description="Поисковый запрос"),
+    orderby: str = Query('popularity', description="Поле сортировки (date, id, title, price, popularity, rating, menu_order)"),
+    order: str = Query('desc', description="Направление сортировки (asc, desc)"),
+    page: int = Query(1, ge=1, description="Номер страницы"),
+    per_page: int = Query(10, ge=1, le=100, description="Количество товаров на странице"),
+    facet_index: FacetIndex = Depends(get_facet_index),
+):
+    attributes: Dict[str, List[str]] = {}
+    for item in attr:
+        slug, separator, value = item.partition(":")
+        if not separator or not slug or not value:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Некорректный фильтр атрибута: {item}")
+        attributes.setdefault(slug, []).append(value)
+
+    facet_filter = FacetFilter(
+        categories=category,
+        attributes=attributes,
+        in_stock=in_stock,
+        on_sale=on_sale,
+        min_price=min_price,
+        max_price=max_price,
+        search=search,
+    )
+    result = facet_index.query(facet_filter, orderby=orderby, order=order, limit=per_page, offset=(page - 1) * per_page)
+    return FastJSONResponse(result)
+
+
+# Поля товара в подсказках: только то, что нужно выпадающему списку
+SUGGEST_PRODUCT_FIELDS = ("id", "name", "image", "price", "regular_price", "sale_price", "on_sale")
+
+@router.get(
+    "/suggest",
+    summary="Подсказки поиска",
+    description=(
+        "Подсказки по мере ввода: товары и категории, в названии (артикуле, категории) которых есть слово, "
+        "начинающееся с последнего слова запроса. Популярные товары выше. Работает по локальному индексу."
+    ),
+)
+async def suggest_products(
+    q: str = Query(..., min_length=1, max_length=100, description="Введенный текст"),
+    limit: int = Query(8, ge=1, le=20, description="Количество товаров в подсказках"),
+    suggest_index: SuggestIndex = Depends(get_suggest_index),
+):
+    products = suggest_index.suggest_products(q, limit=limit)
+    return FastJSONResponse({
+        "products": [{field: product.get(field) for field in SUGGEST_PRODUCT_FIELDS} for product in products],
+        "categories": suggest_index.suggest_categories(q),
+    })
+
+
 @router.get(
     "/{product_id}",
     # response_model=Product,
@@ -58,16 +154,23 @@ async def get_products_list(
     description="Получает детальную информацию о конкретном товаре.",
 )
 async def get_product_details(
+    request: Request,
     product_id: int,
     wc_service: WooCommerceService = Depends(get_woocommerce_service),
+    fallback_catalog: Optional[ProductIndex] = Depends(get_fallback_catalog),
 ):
     try:
-        product = await wc_service.get_product(product_id)
+        product = await wc_service.get_product_entry(product_id)
         if product is None:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Товар с ID {product_id} не найден.")
-        return product
+        return PrecompressedJSONResponse(request, product.body, product.variants)
     except WooCommerceServiceError as e:
         # Если get_product вернул ошибку 404 от WC, она будет перехвачена здесь
+        if e.is_unavailable and fallback_catalog is not None:
+            body = fallback_catalog.get_product_body(product_id)
+            if body is not None:
+                logger.warning(f"WooCommerce unavailable ({e.message}). Serving product {product_id} from catalog snapshot.")
+                return RawJSONResponse(body, headers=SNAPSHOT_HEADERS)
         status_code = e.status_code or 503
         if status_code == 404:
              raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=f"Товар с ID {product_id} не найден.") from e
@@ -76,3 +179,41 @@ async def get_product_details(
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Внутренняя ошибка сервера при получении товара.")
 
+
+
+@router.get(
+    "/{product_id}/related",
+    summary="С этим товаром покупают",
+    description=(
+        "Товары, которые чаще всего покупали вместе с данным (по заказам из Mini App), "
+        "дополненные популярными товарами той же категории. Компактное представление из индекса товаров."
+    ),
+)
+async def get_related_products(
+    product_id: int,
+    limit: int = Query(settings.RECOMMENDATIONS_LIMIT, ge=1, le=settings.RECOMMENDATIONS_MAX_RELATED, description="Количество товаров"),
+    product_index: ProductIndex = Depends(get_product_index),
+    co_purchase_index: CoPurchaseIndex = Depends(get_co_purchase_index),
+):
+    items = []
+    seen = {product_id}
+
+    def take(related_id: int) -> bool:
+        """Добавляет товар в выдачу; True, когда выдача заполнена."""
+        product = product_index.get(related_id)
+        if product is not None and related_id not in seen and product.get("stock_status") != "outofstock":
+            seen.add(related_id)
+            items.append(product)
+        return len(items) >= limit
+
+    for related_id, _ in await co_purchase_index.get_related(product_id):
+        if take(related_id):
+            return FastJSONResponse(items)
+
+    # Для новых товаров совместных покупок еще нет: дополняем популярными из тех же категорий
+    product = product_index.get(product_id)
+    for category in product["categories"] if product else []:
+        for related_id in product_index.ordered_ids("popularity", "desc", category["id"]):
+            if take(related_id):
+                return FastJSONResponse(items)
+    return FastJSONResponse(items)
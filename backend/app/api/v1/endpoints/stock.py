@@ -0,0 +1,42 @@
+# backend/app/api/v1/endpoints/stock.py
+from fastapi import APIRouter, Depends, Query, HTTPException, status
+from typing import List
+
+from app.services.woocommerce import WooCommerceServiceError
+from app.services.stock import StockCache
+from app.dependencies import get_stock_cache
+from app.core.config import settings
+
+router = APIRouter()
+
+def _parse_ids(ids: str) -> List[int]:
+    """Разбирает строку вида '12,34,56' в список ID товаров."""
+    try:
+        parsed = [int(part) for part in ids.split(',') if part.strip()]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Параметр ids должен содержать ID товаров через запятую.")
+    if not parsed:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Не переданы ID товаров.")
+    if len(parsed) > settings.STOCK_MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Можно запросить не более {settings.STOCK_MAX_IDS} товаров за раз.")
+    return parsed
+
+@router.get(
+    "/",
+    summary="Получить остатки товаров",
+    description="Возвращает stock_status и stock_quantity для списка товаров (и их вариаций). "
+                "Данные кэшируются на короткое время, поэтому эндпоинт подходит для частого опроса из корзины.",
+)
+async def get_stock_levels(
+    ids: str = Query(..., description="ID товаров через запятую, например 12,34,56"),
+    stock_cache: StockCache = Depends(get_stock_cache),
+):
+    product_ids = _parse_ids(ids)
+    try:
+        stock = await stock_cache.get_stock(product_ids)
+    except WooCommerceServiceError as e:
+        raise HTTPException(status_code=e.status_code or 503, detail=e.message)
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Внутренняя ошибка сервера при получении остатков.")
+    # Ключи JSON-объекта — строки
+    return {str(product_id): data for product_id, data in stock.items()}
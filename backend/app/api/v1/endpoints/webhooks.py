@@ -0,0 +1,102 @@
+# backend/app/api/v1/endpoints/webhooks.py
+import base64
+import hashlib
+import hmac
+import json
+import logging
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
+from typing import Annotated, Dict, Optional
+
+from app.services.order_index import OrderIndex
+from app.services.product_index import ProductIndex
+from app.services.woocommerce import WooCommerceService
+from app.dependencies import get_order_index, get_woocommerce_service
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+def _is_valid_signature(body: bytes, signature: Optional[str]) -> bool:
+    """Проверяет X-WC-Webhook-Signature: base64(HMAC-SHA256(secret, тело запроса))."""
+    if not signature:
+        return False
+    expected = base64.b64encode(
+        hmac.new(settings.WOOCOMMERCE_WEBHOOK_SECRET.encode(), body, hashlib.sha256).digest()
+    ).decode()
+    return hmac.compare_digest(expected, signature)
+
+async def _read_webhook_payload(request: Request, signature: Optional[str], entity: str) -> Optional[Dict]:
+    """
+    Проверяет подпись и возвращает JSON вебхука.
+    None — проверочный запрос WooCommerce при создании вебхука, на который нужно просто ответить 200.
+    """
+    if not settings.WOOCOMMERCE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Вебхуки не настроены.")
+
+    body = await request.body()
+    # При создании вебхука WooCommerce шлет проверочный запрос "webhook_id=..." без подписи
+    if body.startswith(b"webhook_id="):
+        return None
+
+    if not _is_valid_signature(body, signature):
+        logger.warning("Rejected WooCommerce webhook with invalid signature.")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Неверная подпись вебхука.")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Ожидался JSON {entity}.")
+    return payload if isinstance(payload, dict) else {}
+
+@router.post(
+    "/woocommerce/orders",
+    summary="Вебхук WooCommerce для заказов",
+    description="Принимает события order.created / order.updated и обновляет локальный индекс заказов. "
+                "Смены статуса рассылаются покупателям так же, как при периодической синхронизации.",
+)
+async def woocommerce_order_webhook(
+    request: Request,
+    x_wc_webhook_signature: Annotated[Optional[str], Header()] = None,
+    order_index: OrderIndex = Depends(get_order_index),
+):
+    order = await _read_webhook_payload(request, x_wc_webhook_signature, "заказа")
+    if order is None:
+        return {"status": "ok"}
+    if not order.get("id"):
+        return {"status": "ignored"}
+
+    events = await order_index.upsert_order(order)
+    logger.info(f"WooCommerce webhook for order {order.get('id')} processed ({events} events).")
+    return {"status": "ok"}
+
+
+@router.post(
+    "/woocommerce/products",
+    summary="Вебхук WooCommerce для товаров",
+    description="Принимает события product.created / product.updated / product.deleted: точечно обновляет "
+                "индекс товаров (включая предсортированные списки) и сбрасывает кэш карточки и списков товаров.",
+)
+async def woocommerce_product_webhook(
+    request: Request,
+    x_wc_webhook_signature: Annotated[Optional[str], Header()] = None,
+    x_wc_webhook_topic: Annotated[Optional[str], Header()] = None,
+    wc_service: WooCommerceService = Depends(get_woocommerce_service),
+):
+    product = await _read_webhook_payload(request, x_wc_webhook_signature, "товара")
+    if product is None:
+        return {"status": "ok"}
+    product_id = product.get("id")
+    if not product_id:
+        return {"status": "ignored"}
+
+    product_index = getattr(request.app.state, "product_index", None)
+    if isinstance(product_index, ProductIndex) and product_index.ready:
+        # При удалении WooCommerce присылает только {"id": ...}
+        if x_wc_webhook_topic == "product.deleted":
+            product_index.remove_product(product_id)
+        else:
+            product_index.upsert_product(product)
+    await wc_service.invalidate_product(product_id)
+    logger.info(f"WooCommerce webhook {x_wc_webhook_topic or 'product'} for product {product_id} processed.")
+    return {"status": "ok"}
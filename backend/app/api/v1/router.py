@@ -1,12 +1,23 @@
 # backend/app/api/v1/router.py
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
 # Импортируем все роутеры эндпоинтов
-from app.api.v1.endpoints import products, orders, categories # Добавляем categories
+from app.api.v1.endpoints import products, orders, categories, stock, webhooks, bootstrap # Добавляем categories
+
+from app.dependencies import rate_limit, require_main_shop
 
 api_router_v1 = APIRouter()
 
+# Лимиты частоты: чтение каталога ограничивается на уровне роутеров,
+# у заказов лимиты заданы по эндпоинтам (создание и выгрузка — строже, чем история)
+catalog_rate_limit = [Depends(rate_limit("catalog"))]
+
 # Подключаем роутеры из эндпоинтов с префиксами
-api_router_v1.include_router(products.router, prefix="/products", tags=["Products"])
+api_router_v1.include_router(products.router, prefix="/products", tags=["Products"], dependencies=catalog_rate_limit)
 api_router_v1.include_router(orders.router, prefix="/orders", tags=["Orders"])
 # >>>>> ДОБАВЛЯЕМ ПОДКЛЮЧЕНИЕ РОУТЕРА КАТЕГОРИЙ <<<<<
-api_router_v1.include_router(categories.router, prefix="/categories", tags=["Categories"])
\ No newline at end of file
+api_router_v1.include_router(categories.router, prefix="/categories", tags=["Categories"], dependencies=catalog_rate_limit)
+api_router_v1.include_router(stock.router, prefix="/stock", tags=["Stock"], dependencies=catalog_rate_limit)
+# Все данные для первого экрана Mini App одним запросом
+api_router_v1.include_router(bootstrap.router, prefix="/bootstrap", tags=["Bootstrap"], dependencies=catalog_rate_limit)
+# Вебхуки обновляют индексы основного магазина
+api_router_v1.include_router(webhooks.router, prefix="/webhooks", tags=["Webhooks"], dependencies=[Depends(require_main_shop)])
\ No newline at end of file
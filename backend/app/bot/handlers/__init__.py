@@ -4,7 +4,8 @@ import logging
 
 # Импортируем роутеры из других модулей
 from .user import user_router
-# from .admin import admin_router # Если будут команды для админов
+from .manager import manager_router # Команды менеджеров (/stats, /orders, /broadcast)
+from .inline import inline_router # Поиск товаров в inline-режиме
 # from .other import other_router # И т.д.
 
 logger = logging.getLogger(__name__)
@@ -18,7 +19,8 @@ def register_handlers(dp: Dispatcher):
 
     # Подключаем дочерние роутеры к главному роутеру
     main_router.include_router(user_router)
-    # main_router.include_router(admin_router) # << Пример для будущего
+    main_router.include_router(manager_router)
+    main_router.include_router(inline_router)
     # main_router.include_router(other_router) # << Пример для будущего
 
     # >>>>> ИЗМЕНЕНИЕ ЗДЕСЬ: Регистрируем ТОЛЬКО главный роутер в диспетчере <<<<<
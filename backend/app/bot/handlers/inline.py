@@ -0,0 +1,48 @@
+# backend/app/bot/handlers/inline.py
+import logging
+from aiogram import Router, types
+
+from app.bot.inline_results import InlineArticleCache
+from app.core.config import settings
+from app.services.product_index import ProductIndex
+
+# Роутер для inline-режима (@bot запрос в любом чате)
+inline_router = Router(name="inline_handlers")
+logger = logging.getLogger(__name__)
+
+# Telegram принимает не больше 50 результатов за ответ
+INLINE_PAGE_SIZE = 20
+
+
+@inline_router.inline_query()
+async def handle_inline_query(
+    inline_query: types.InlineQuery,
+    product_index: ProductIndex,
+    inline_articles: InlineArticleCache,
+):
+    """
+    Поиск товаров в inline-режиме.
+    Отвечает только из индекса в памяти: Telegram ждет ответ за сотни миллисекунд.
+    """
+    try:
+        offset = int(inline_query.offset or 0)
+    except ValueError:
+        offset = 0
+
+    if not product_index.ready:
+        # Индекс еще загружается: короткий cache_time, чтобы не закэшировать пустой ответ надолго
+        await inline_query.answer([], cache_time=5, is_personal=False)
+        return
+
+    products = product_index.search(inline_query.query, limit=INLINE_PAGE_SIZE, offset=offset)
+    results = inline_articles.get_many(products)
+    next_offset = str(offset + INLINE_PAGE_SIZE) if len(products) == INLINE_PAGE_SIZE else ""
+
+    # Результаты не зависят от пользователя, поэтому Telegram может отдавать их из своего кэша всем
+    await inline_query.answer(
+        results,
+        cache_time=settings.INLINE_QUERY_CACHE_TIME,
+        is_personal=False,
+        next_offset=next_offset,
+    )
+    logger.debug(f"Inline query '{inline_query.query}' (offset {offset}): {len(results)} results.")
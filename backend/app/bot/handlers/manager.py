@@ -0,0 +1,160 @@
+# backend/app/bot/handlers/manager.py
+import logging
+from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.utils.markdown import hbold, hcode, hlink
+
+from app.core.config import settings
+from app.services.order_stats import OrderStats
+from app.services.broadcast import BroadcastError, BroadcastService
+
+# Роутер для команд менеджеров магазина
+manager_router = Router(name="manager_handlers")
+# Все хендлеры роутера доступны только пользователям из TELEGRAM_MANAGER_IDS
+manager_router.message.filter(F.from_user.id.in_(settings.TELEGRAM_MANAGER_IDS))
+logger = logging.getLogger(__name__)
+
+# Периоды для /stats: название -> количество дней, включая сегодня
+STATS_PERIODS = {"today": 1, "week": 7, "month": 30}
+
+# Группы статусов для /orders
+ORDER_STATUS_GROUPS = {
+    "pending": ("pending", "on-hold"), # Ждут решения менеджера
+    "processing": ("processing",),
+    "completed": ("completed",),
+    "cancelled": ("cancelled",),
+}
+ORDERS_LIST_LIMIT = 15
+
+
+def _format_revenue(revenue: dict) -> str:
+    if not revenue:
+        return "0"
+    return ", ".join(f"{amount:.2f} {currency}".strip() for currency, amount in sorted(revenue.items()))
+
+
+@manager_router.message(Command("stats"))
+async def handle_stats(message: types.Message, command: CommandObject, order_stats: OrderStats):
+    """
+    /stats [today|week|month] — количество заказов и выручка за период.
+    Отвечает из инкрементально поддерживаемых агрегатов, без запросов к WooCommerce.
+    """
+    period = (command.args or "today").strip().lower()
+    days = STATS_PERIODS.get(period)
+    if days is None:
+        await message.answer(f"Использование: {hcode('/stats today|week|month')}")
+        return
+
+    stats = await order_stats.get_period(days)
+    period_str = stats["start"].strftime('%d.%m.%Y')
+    if days > 1:
+        period_str += f" – {stats['end'].strftime('%d.%m.%Y')}"
+
+    await message.answer(
+        f"📊 {hbold('Статистика заказов из Mini App')}\n"
+        f"🗓️ {period_str}\n\n"
+        f"🛒 {hbold('Заказов:')} {stats['orders']}\n"
+        f"💰 {hbold('Выручка:')} {_format_revenue(stats['revenue'])}"
+    )
+    logger.info(f"Manager {message.from_user.id} requested stats for '{period}'.")
+
+
+@manager_router.message(Command("orders"))
+async def handle_orders(message: types.Message, command: CommandObject, order_stats: OrderStats):
+    """/orders [pending|processing|completed|cancelled] — последние заказы в статусе."""
+    group = (command.args or "pending").strip().lower()
+    statuses = ORDER_STATUS_GROUPS.get(group)
+    if statuses is None:
+        await message.answer(f"Использование: {hcode('/orders ' + '|'.join(ORDER_STATUS_GROUPS))}")
+        return
+
+    total, orders = await order_stats.get_orders_by_status(statuses, limit=ORDERS_LIST_LIMIT)
+    if not orders:
+        await message.answer(f"Заказов в статусе {hcode(group)} нет.")
+        return
+
+    admin_base = f"{settings.WOOCOMMERCE_URL.rstrip('/')}/wp-admin/post.php"
+    lines = []
+    for order in orders:
+        admin_url = f"{admin_base}?post={order['id']}&action=edit"
+        created = (order.get('date_created') or '')[:16].replace('T', ' ')
+        lines.append(
+            f"• {hlink('№' + str(order['number']), admin_url)} — "
+            f"{order.get('total')} {order.get('currency') or ''} ({order.get('status')}, {created})"
+        )
+    header = f"📋 {hbold(f'Заказы ({group}):')} {total}"
+    if total > len(orders):
+        header += f" (показаны последние {len(orders)})"
+    await message.answer(header + "\n\n" + "\n".join(lines), disable_web_page_preview=True)
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}ч {minutes:02d}м" if hours else f"{minutes}м {seconds:02d}с"
+
+
+@manager_router.message(Command("broadcast"))
+async def handle_broadcast(message: types.Message, command: CommandObject, broadcast_service: BroadcastService):
+    """
+    /broadcast <текст> — рассылка всем, кто запускал бота.
+    Можно отправить команду ответом на сообщение: тогда рассылается его текст (с форматированием).
+    """
+    text = command.args
+    if message.reply_to_message and message.reply_to_message.html_text:
+        text = message.reply_to_message.html_text
+    if not text:
+        await message.answer(
+            f"Использование: {hcode('/broadcast текст')} или ответ командой {hcode('/broadcast')} на сообщение."
+        )
+        return
+
+    try:
+        broadcast_id = await broadcast_service.start_broadcast(text, created_by=message.from_user.id)
+    except BroadcastError as e:
+        await message.answer(str(e))
+        return
+    status = await broadcast_service.get_status(broadcast_id)
+    await message.answer(
+        f"📣 Рассылка #{broadcast_id} запущена, получателей: {status['total']}.\n"
+        f"Прогресс: {hcode('/broadcast_status')}, отмена: {hcode(f'/broadcast_cancel {broadcast_id}')}"
+    )
+    logger.info(f"Manager {message.from_user.id} started broadcast {broadcast_id}.")
+
+
+@manager_router.message(Command("broadcast_status"))
+async def handle_broadcast_status(message: types.Message, command: CommandObject, broadcast_service: BroadcastService):
+    """/broadcast_status [id] — прогресс рассылки, скорость и оставшееся время."""
+    broadcast_id = int(command.args) if command.args and command.args.strip().isdigit() else None
+    status = await broadcast_service.get_status(broadcast_id)
+    if not status:
+        await message.answer("Рассылок еще не было.")
+        return
+
+    lines = [
+        f"📣 {hbold('Рассылка #' + str(status['id']))} — {status['status']}",
+        f"Обработано: {status['processed']} из {status['total']}",
+        f"✅ Отправлено: {status['sent']}",
+        f"🚫 Заблокировали бота: {status['blocked']}",
+        f"⚠️ Ошибок: {status['failed']}",
+    ]
+    if status["status"] == "running":
+        if status["rate"]:
+            lines.append(f"⚡ Скорость: {status['rate']:.1f} сообщ./сек")
+        if status["eta_seconds"] is not None:
+            lines.append(f"⏳ Осталось: ~{_format_duration(status['eta_seconds'])}")
+    await message.answer("\n".join(lines))
+
+
+@manager_router.message(Command("broadcast_cancel"))
+async def handle_broadcast_cancel(message: types.Message, command: CommandObject, broadcast_service: BroadcastService):
+    """/broadcast_cancel <id> — останавливает рассылку."""
+    if not command.args or not command.args.strip().isdigit():
+        await message.answer(f"Использование: {hcode('/broadcast_cancel id')}")
+        return
+    broadcast_id = int(command.args)
+    if await broadcast_service.cancel_broadcast(broadcast_id):
+        await message.answer(f"Рассылка #{broadcast_id} остановлена.")
+        logger.info(f"Manager {message.from_user.id} cancelled broadcast {broadcast_id}.")
+    else:
+        await message.answer(f"Рассылка #{broadcast_id} не найдена или уже завершена.")
@@ -5,21 +5,25 @@ from aiogram.filters import CommandStart
 from aiogram.utils.markdown import hbold
 
 from app.bot.keyboards.inline import get_main_menu_keyboard # Импортируем нашу клавиатуру
+from app.services.user_registry import UserRegistry
 
 # Создаем роутер для пользовательских команд/сообщений
 user_router = Router(name="user_handlers")
 logger = logging.getLogger(__name__)
 
 @user_router.message(CommandStart())
-async def handle_start(message: types.Message):
+async def handle_start(message: types.Message, user_registry: UserRegistry):
     """
     Обработчик команды /start.
-    Отправляет приветственное сообщение и кнопку для открытия Mini App.
+    Запоминает пользователя в реестре (оттуда же берутся получатели рассылок),
+    отправляет приветственное сообщение и кнопку для открытия Mini App.
     """
     user_name = message.from_user.full_name
     user_id = message.from_user.id
     logger.info(f"User {user_id} ({user_name}) started the bot.")
 
+    user_registry.record(message.from_user.model_dump(), started_bot=True)
+
     # Формируем приветственное сообщение
     welcome_text = (
         f"👋 Здравствуйте, {hbold(user_name)}!\n\n"
@@ -0,0 +1,90 @@
+# backend/app/bot/inline_results.py
+import logging
+from typing import Dict, List, Optional
+
+from aiogram.types import InlineQueryResultArticle, InputTextMessageContent
+from aiogram.utils.markdown import hbold, hlink
+
+from app.bot.keyboards.inline import get_product_link_keyboard
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def get_product_deep_link(product: Dict) -> str:
+    """
+    Ссылка на товар: прямая ссылка на Mini App со startapp=product_<id>, если она настроена,
+    иначе страница товара на сайте.
+    """
+    if settings.MINI_APP_DIRECT_LINK:
+        return f"{settings.MINI_APP_DIRECT_LINK.rstrip('/')}?startapp=product_{product['id']}"
+    return product.get("permalink") or settings.WOOCOMMERCE_URL
+
+
+def _format_price(product: Dict) -> str:
+    if product.get("on_sale") and product.get("sale_price") and product.get("regular_price"):
+        return f"{product['sale_price']} ₽ (вместо {product['regular_price']} ₽)"
+    if product.get("price"):
+        return f"{product['price']} ₽"
+    return "цена по запросу"
+
+
+def build_product_article(product: Dict) -> InlineQueryResultArticle:
+    """Готовый результат inline-режима для товара: карточка с ценой, миниатюрой и кнопкой в магазин."""
+    link = get_product_deep_link(product)
+    price = _format_price(product)
+    categories = ", ".join(c["name"] for c in product.get("categories") or [] if c.get("name"))
+
+    description = price
+    if categories:
+        description += f" · {categories}"
+    if product.get("stock_status") == "outofstock":
+        description += " · нет в наличии"
+
+    text = f"{hbold(product['name'])}\n💰 {price}"
+    if categories:
+        text += f"\n🏷️ {categories}"
+    text += f"\n\n{hlink('Открыть в магазине', link)}"
+
+    return InlineQueryResultArticle(
+        id=str(product["id"]),
+        title=product["name"],
+        description=description,
+        thumbnail_url=product.get("image"),
+        input_message_content=InputTextMessageContent(message_text=text, disable_web_page_preview=True),
+        reply_markup=get_product_link_keyboard(link),
+    )
+
+
+class InlineArticleCache:
+    """
+    Результаты inline-режима, предвычисленные для всех товаров индекса.
+    Перестраивается хуком ProductIndex, поэтому ответ на запрос — только поиск и выборка из словаря.
+    """
+    def __init__(self):
+        self._articles: Dict[int, InlineQueryResultArticle] = {}
+
+    def rebuild(self, products: Dict[int, Dict]):
+        articles = {}
+        for product_id, product in products.items():
+            try:
+                articles[product_id] = build_product_article(product)
+            except Exception as e:
+                logger.warning(f"Cannot build inline article for product {product_id}: {e}")
+        self._articles = articles
+        logger.info(f"Inline articles rebuilt for {len(articles)} products.")
+
+    def update(self, product_id: int, product: Optional[Dict]):
+        """Точечное обновление статьи при изменении товара (хук обновления индекса)."""
+        articles = dict(self._articles)
+        articles.pop(product_id, None)
+        if product is not None:
+            try:
+                articles[product_id] = build_product_article(product)
+            except Exception as e:
+                logger.warning(f"Cannot build inline article for product {product_id}: {e}")
+        self._articles = articles
+
+    def get_many(self, products: List[Dict]) -> List[InlineQueryResultArticle]:
+        articles = self._articles
+        return [articles[p["id"]] for p in products if p["id"] in articles]
@@ -1,8 +1,11 @@
 # backend/app/bot/instance.py
+import asyncio
 import logging
 from typing import Optional, Tuple
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
+from aiogram.types import User
+from aiogram.exceptions import TelegramUnauthorizedError
 # >>>>> ИМПОРТИРУЕМ DefaultBotProperties <<<<<
 from aiogram.client.default import DefaultBotProperties
 # from aiogram.fsm.storage.memory import MemoryStorage # Если нужен FSM
@@ -16,7 +19,10 @@ _bot_instance: Optional[Bot] = None
 _dispatcher_instance: Optional[Dispatcher] = None
 
 async def initialize_bot() -> Tuple[Bot, Dispatcher]:
-    """Инициализирует Bot, Dispatcher и регистрирует хендлеры."""
+    """
+    Создает Bot, Dispatcher и регистрирует хендлеры.
+    Сетевых запросов не делает: подключение к Telegram проверяет connect_bot().
+    """
     global _bot_instance, _dispatcher_instance
 
     if _bot_instance and _dispatcher_instance:
@@ -44,16 +50,31 @@ async def initialize_bot() -> Tuple[Bot, Dispatcher]:
     _bot_instance = bot
     _dispatcher_instance = dp
 
-    try:
-        bot_info = await bot.get_me()
-        logger.info(f"Bot initialized: ID={bot_info.id}, Username={bot_info.username}")
-    except Exception as e:
-        logger.exception(f"Failed to connect to Telegram API: {e}")
-        raise RuntimeError("Could not initialize Telegram Bot connection") from e
-
     logger.info("Aiogram Bot and Dispatcher initialized successfully.")
     return bot, dp
 
+async def connect_bot(bot: Bot) -> User:
+    """
+    Проверяет подключение к Telegram API (getMe), повторяя попытки с экспоненциальной задержкой.
+    Ждет до успешного подключения; прервать можно только отменой задачи.
+    """
+    delay = settings.BOT_CONNECT_RETRY_INITIAL_DELAY
+    attempt = 1
+    while True:
+        try:
+            bot_info = await bot.get_me()
+            logger.info(f"Bot connected: ID={bot_info.id}, Username={bot_info.username} (attempt {attempt})")
+            return bot_info
+        except TelegramUnauthorizedError:
+            # Неверный токен: повторять бессмысленно
+            logger.error("Telegram rejected the bot token. Bot will stay offline.")
+            raise
+        except Exception as e:
+            logger.error(f"Failed to connect to Telegram API (attempt {attempt}): {e}. Retrying in {delay:.1f}s...")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.BOT_CONNECT_RETRY_MAX_DELAY)
+        attempt += 1
+
 async def shutdown_bot(bot: Optional[Bot] = None, dp: Optional[Dispatcher] = None):
     """Корректно останавливает сессию бота."""
     global _bot_instance, _dispatcher_instance
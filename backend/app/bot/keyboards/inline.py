@@ -42,4 +42,13 @@ def get_main_menu_keyboard() -> InlineKeyboardMarkup:
 #     builder.button(text="Кнопка 1", callback_data="button_1_pressed")
 #     builder.button(text="Кнопка 2", callback_data="button_2_pressed")
 #     builder.adjust(2) # Две кнопки в строке
-#     return builder.as_markup()
\ No newline at end of file
+#     return builder.as_markup()
+
+def get_product_link_keyboard(url: str) -> InlineKeyboardMarkup:
+    """
+    Клавиатура для сообщения с товаром, отправленного через inline-режим.
+    В чужих чатах кнопки WebApp недоступны, поэтому используется обычная ссылка.
+    """
+    builder = InlineKeyboardBuilder()
+    builder.button(text="🛍️ Открыть в магазине", url=url)
+    return builder.as_markup()
@@ -21,12 +21,167 @@ class Settings(BaseSettings):
     WOOCOMMERCE_KEY: str = "ck_dummykey" # !!! ЗАМЕНИТЬ В .env !!!
     WOOCOMMERCE_SECRET: str = "cs_dummysecret" # !!! ЗАМЕНИТЬ В .env !!!
     WOOCOMMERCE_API_VERSION: str = "wc/v3"
+    # Секрет вебхуков WooCommerce (WooCommerce > Settings > Advanced > Webhooks). Пусто - вебхуки отключены
+    WOOCOMMERCE_WEBHOOK_SECRET: str = ""
+    # Проверять ответы каталога по моделям при заполнении кэша (отладка схемы; стоит полной валидации на каждый промах)
+    WOOCOMMERCE_VALIDATE_RESPONSES: bool = False
+    # Страховочные (hedged) GET-запросы: если ответ дольше текущего перцентиля задержки,
+    # отправляется второй такой же запрос и используется первый пришедший ответ
+    WOOCOMMERCE_HEDGING_ENABLED: bool = False
+    WOOCOMMERCE_HEDGE_PERCENTILE: float = 95.0 # После какого перцентиля задержки отправлять второй запрос
+    WOOCOMMERCE_HEDGE_BUDGET_PERCENT: float = 5.0 # Максимум дополнительных запросов, % от всех GET
+    WOOCOMMERCE_HEDGE_MIN_DELAY: float = 0.05 # Не отправлять второй запрос раньше (секунды)
+    WOOCOMMERCE_HEDGE_MIN_SAMPLES: int = 20 # Сколько замеров нужно, прежде чем включать страховку
+    WOOCOMMERCE_HEDGE_WINDOW: int = 500 # Размер окна замеров задержки на тип запроса
+    # Пакетная запись заказов: заказы, пришедшие почти одновременно, создаются одним запросом orders/batch.
+    # Выключено по умолчанию: сбой сети или 5xx на пакет оставляет до MAX_SIZE заказов в неизвестном состоянии
+    # (созданные находятся по метке после сбоя, остальные получают ошибку, хотя WooCommerce мог создать их позже)
+    WOOCOMMERCE_ORDER_BATCH_ENABLED: bool = False
+    WOOCOMMERCE_ORDER_BATCH_MAX_SIZE: int = 20 # Максимум заказов в одном запросе (WooCommerce допускает до 100)
+    WOOCOMMERCE_ORDER_BATCH_MAX_DELAY: float = 0.005 # Сколько ждать следующих заказов перед отправкой пакета (сек)
 
     # --- Telegram Settings ---
     TELEGRAM_BOT_TOKEN: str = "YOUR_BOT_TOKEN" # !!! ЗАМЕНИТЬ В .env !!!
     # ID менеджеров через запятую в .env, например: 123456,789012
     TELEGRAM_MANAGER_IDS_STR: str = "123456789" # !!! ЗАМЕНИТЬ В .env !!!
     MINI_APP_URL: str = "https://your-frontend-app-url.com" # !!! ЗАМЕНИТЬ В .env !!!
+    # Прямая ссылка на Mini App из BotFather (https://t.me/<bot>/<app>) для ссылок на товары из inline-режима
+    MINI_APP_DIRECT_LINK: str = ""
+    # Повторные попытки подключения бота к Telegram в фоне (экспоненциальная задержка, сек)
+    BOT_CONNECT_RETRY_INITIAL_DELAY: float = 1.0
+    BOT_CONNECT_RETRY_MAX_DELAY: float = 60.0
+    # Фоновая отправка сообщений: лимиты Telegram ~30 сообщений/сек всего и ~1/сек в один чат
+    TELEGRAM_GLOBAL_RATE_LIMIT: float = 25.0
+    TELEGRAM_PER_CHAT_INTERVAL: float = 1.0
+    TELEGRAM_SEND_BATCH_SIZE: int = 25 # Сколько сообщений из очереди отправлять параллельно
+    TELEGRAM_SEND_QUEUE_SIZE: int = 10000
+    ORDER_STATUS_NOTIFICATIONS_ENABLED: bool = True # Сообщать покупателям о смене статуса заказа
+    # Дайджест заказов для менеджеров: при всплеске заказов вместо сообщения на каждый заказ
+    # копим заказы за окно и отправляем одно сводное сообщение каждому менеджеру
+    ORDER_DIGEST_ENABLED: bool = True
+    ORDER_DIGEST_THRESHOLD: int = 10 # Заказов за ORDER_DIGEST_RATE_WINDOW, начиная с которого включается дайджест
+    ORDER_DIGEST_RATE_WINDOW: float = 60.0 # Окно подсчета частоты заказов (сек)
+    ORDER_DIGEST_WINDOW: float = 30.0 # Сколько копить заказы перед отправкой дайджеста (сек)
+    ORDER_DIGEST_MAX_ORDERS: int = 50 # Дайджест отправляется досрочно, когда накопилось столько заказов
+
+    # --- Rate Limit Settings ---
+    # Лимиты по ключу (Telegram ID из initData, иначе IP) и общие на класс маршрутов.
+    # rate — запросов в секунду, burst — сколько можно сделать подряд.
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_CATALOG_RATE: float = 5.0 # Чтение каталога (товары, категории, остатки, история заказов)
+    RATE_LIMIT_CATALOG_BURST: float = 30.0
+    RATE_LIMIT_CATALOG_GLOBAL_RATE: float = 200.0 # На всех клиентов вместе (0 - без общего лимита)
+    RATE_LIMIT_ORDERS_RATE: float = 0.2 # Создание заказов и выгрузки (1 запрос в 5 секунд)
+    RATE_LIMIT_ORDERS_BURST: float = 5.0
+    RATE_LIMIT_ORDERS_GLOBAL_RATE: float = 20.0
+    RATE_LIMIT_MAX_KEYS: int = 10000 # Сколько клиентов помнить на каждый класс маршрутов
+    RATE_LIMIT_TRUST_FORWARDED_FOR: bool = False # Брать IP из X-Forwarded-For (только за доверенным прокси)
+
+    # --- Admission Control Settings ---
+    # Приоритетный допуск запросов к API при перегрузке. Классы (по убыванию приоритета):
+    # critical — оформление заказа, authenticated — запросы с валидной initData и вебхуки, anonymous — остальное чтение
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_MAX_CONCURRENT: int = 100 # Сколько запросов к API обрабатывается одновременно, остальные ждут в очередях
+    ADMISSION_QUEUE_CRITICAL: int = 200 # Размеры очередей классов; при заполненной очереди запрос сразу получает 503
+    ADMISSION_QUEUE_AUTHENTICATED: int = 200
+    ADMISSION_QUEUE_ANONYMOUS: int = 100
+    ADMISSION_QUEUE_WEBHOOK: int = 100 # Вебхуки WooCommerce - самый низкий приоритет (подпись проверяется в эндпоинте)
+    ADMISSION_WAIT_CRITICAL: float = 15.0 # Максимальное ожидание в очереди (сек), дальше 503
+    ADMISSION_WAIT_AUTHENTICATED: float = 5.0
+    ADMISSION_WAIT_ANONYMOUS: float = 1.0
+    ADMISSION_WAIT_WEBHOOK: float = 5.0 # Вебхуки ждут дольше анонимных запросов: отклоненный вебхук WooCommerce не доставит повторно
+    # Цель по задержке приоритетных запросов (сек). После превышения анонимные запросы и вебхуки ADMISSION_DEGRADED_HOLD секунд
+    # не ждут в очереди и получают не больше ADMISSION_DEGRADED_ANONYMOUS_SHARE мест
+    ADMISSION_LATENCY_TARGET: float = 3.0
+    ADMISSION_DEGRADED_HOLD: float = 10.0
+    ADMISSION_DEGRADED_ANONYMOUS_SHARE: float = 0.5
+
+    # --- Cache Settings ---
+    # Бэкенд кэша второго уровня, общего для всех воркеров: memory (только L1 в процессе), sqlite, redis
+    CACHE_BACKEND: str = "memory"
+    CACHE_SQLITE_PATH: str = "data/cache.sqlite3"
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0" # Нужен пакет redis
+    CACHE_KEY_PREFIX: str = "wcapp"
+    CACHE_L1_MAX_ITEMS: int = 1000 # Максимум записей в кэше процесса
+    CACHE_L1_MAX_TTL: float = 60.0 # Сколько секунд L1 может держать значение без сверки с L2
+    CACHE_LOCK_TTL: float = 15.0 # Время жизни блокировки на обновление ключа (сек)
+    CACHE_LOCK_WAIT: float = 5.0 # Сколько ждать, пока другой воркер заполнит ключ (сек)
+    CACHE_INVALIDATION_POLL_INTERVAL: float = 1.0 # Для sqlite: период опроса журнала инвалидаций
+    CACHE_TTL_PRODUCTS: int = 300 # Списки товаров
+    CACHE_TTL_PRODUCT: int = 300 # Карточка товара
+    CACHE_TTL_CATEGORIES: int = 900 # Категории
+    STOCK_CACHE_TTL: float = 15.0 # Остатки меняются часто, поэтому кэшируются отдельно и коротко
+    STOCK_MAX_IDS: int = 100 # Максимум ID товаров в одном запросе /stock
+
+    # --- Compression Settings ---
+    # Кэшируемые ответы каталога сжимаются один раз при заполнении кэша (gzip; br — если установлен пакет brotli)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_SIZE: int = 1024 # Тела меньше этого размера (байт) не сжимаются
+    COMPRESSION_GZIP_LEVEL: int = 6 # Уровень gzip (1-9)
+    COMPRESSION_BROTLI_QUALITY: int = 5 # Качество brotli (0-11): 11 сжимает лучше, но в десятки раз медленнее
+
+    # --- Multi-shop Settings ---
+    # Дополнительные магазины в том же процессе: путь к JSON-файлу со списком магазинов
+    # (id, hosts, woocommerce_url/key/secret, telegram_bot_token, manager_ids). Пусто — только основной магазин
+    SHOPS_CONFIG_PATH: str = ""
+    TENANT_MAX_ACTIVE: int = 20 # Сколько дополнительных магазинов держать активными одновременно
+    TENANT_IDLE_TIMEOUT: float = 900.0 # Магазин без запросов дольше этого (сек) деактивируется
+    TENANT_CACHE_L1_MAX_ITEMS: int = 200 # Размер кэша каталога в памяти процесса на активный магазин
+    TENANT_MAX_CONNECTIONS: int = 10 # Пул соединений к WooCommerce на активный магазин
+
+    # --- Order Index Settings ---
+    # Локальный индекс заказов по Telegram ID для /orders/me
+    ORDER_INDEX_PATH: str = "data/orders.sqlite3"
+    ORDER_SYNC_ENABLED: bool = True # Периодически подтягивать измененные заказы (modified_after)
+    ORDER_SYNC_INTERVAL: float = 60.0 # Период синхронизации (сек)
+    ORDER_INDEX_INITIAL_SYNC_DAYS: int = 90 # Глубина первой синхронизации пустого индекса (дней)
+    STATS_TIMEZONE: str = "Europe/Moscow" # Часовой пояс магазина для границ дней в /stats
+
+    # --- Recommendations Settings ---
+    # "С этим покупают": счетчики совместных покупок строятся по индексу заказов
+    RECOMMENDATIONS_LIMIT: int = 8 # Сколько связанных товаров показывать по умолчанию
+    RECOMMENDATIONS_MAX_RELATED: int = 30 # Сколько связанных товаров хранить в кэше на товар
+    RECOMMENDATIONS_MAX_ORDER_ITEMS: int = 30 # Заказы с большим числом разных товаров не учитываются
+    RECOMMENDATIONS_CACHE_TTL: float = 300.0 # Время жизни кэша рекомендаций в процессе (секунды)
+    RECOMMENDATIONS_CACHE_MAX_ITEMS: int = 10000
+
+    # --- Order Export Settings ---
+    EXPORT_PER_PAGE: int = 100 # Заказов на страницу при выгрузке (максимум WC - 100)
+    EXPORT_PAGE_CONCURRENCY: int = 4 # Сколько страниц загружать одновременно
+    EXPORT_XLSX_MAX_ROWS: int = 20000 # XLSX собирается целиком до отправки, поэтому объем ограничен (CSV - без ограничения)
+
+    # --- Product Index Settings ---
+    PRODUCT_INDEX_REFRESH_INTERVAL: float = 600.0 # Период полной перезагрузки индекса товаров (секунды)
+    PRODUCT_INDEX_RETRY_INTERVAL: float = 30.0 # Повтор загрузки, пока индекс пуст
+    PRODUCT_INDEX_PAGE_CONCURRENCY: int = 4 # Сколько страниц товаров загружать одновременно
+    INLINE_QUERY_CACHE_TIME: int = 300 # Сколько секунд Telegram кэширует ответ на inline-запрос
+    # Снимок каталога на диске: мгновенный старт индекса и отдача каталога, пока WooCommerce недоступен
+    CATALOG_SNAPSHOT_ENABLED: bool = True
+    CATALOG_SNAPSHOT_PATH: str = "data/catalog.snapshot"
+    # Границы ценовых диапазонов фасетного фильтра через запятую (диапазоны [0, 500), [500, 1000), ..., [10000, ∞))
+    FACET_PRICE_BUCKETS: str = "500,1000,2000,5000,10000"
+    FACET_REBUILD_DELAY: float = 1.0 # Через сколько секунд после изменения товара (вебхук) перестраивать маски
+
+    # --- User Registry Settings ---
+    USER_REGISTRY_PATH: str = "data/users.sqlite3" # База пользователей бота и Mini App
+    USER_REGISTRY_FLUSH_INTERVAL: float = 5.0 # Как часто сбрасывать накопленные записи (секунды)
+    USER_REGISTRY_BATCH_SIZE: int = 500 # Сбрасывать раньше, если накопилось столько пользователей
+    USER_REGISTRY_MAX_PENDING: int = 50000 # Максимум пользователей в буфере (сверх — обновления отбрасываются)
+
+    # --- Broadcast Settings ---
+    BROADCAST_DB_PATH: str = "data/broadcast.sqlite3" # База рассылок и их прогресса (получатели — в реестре пользователей)
+    BROADCAST_CONCURRENCY: int = 20 # Сколько сообщений рассылки отправлять одновременно
+    BROADCAST_CHUNK_SIZE: int = 500 # Получателей в пачке (прогресс сохраняется после каждой пачки)
+    BROADCAST_LEASE_SECONDS: float = 120.0 # Через сколько секунд без прогресса рассылку может подхватить другой воркер
+    BROADCAST_RETRY_BACKOFF_MAX: float = 60.0 # Максимальная пауза (сек) между попытками, пока Telegram недоступен
+
+    # --- Warm-up Settings ---
+    WARMUP_ENABLED: bool = True # Прогревать кэш каталога при старте (эндпоинт /ready ждет завершения)
+    WARMUP_TOP_CATEGORIES: int = 5 # Сколько самых наполненных категорий прогревать
+    WARMUP_PAGES_PER_CATEGORY: int = 1 # Сколько первых страниц каждой категории загружать
+    WARMUP_PER_PAGE: int = 10 # Должно совпадать с per_page на фронтенде, иначе ключи кэша не совпадут
+    WARMUP_CONCURRENCY: int = 4 # Одновременных запросов к WooCommerce во время прогрева
+    WARMUP_TIMEOUT: float = 60.0 # После таймаута инстанс считается готовым
 
     # --- Derived/Helper Settings ---
     @property
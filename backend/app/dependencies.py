@@ -1,17 +1,68 @@
 # backend/app/dependencies.py
+import math
 from datetime import datetime, timezone
 from fastapi import Request, HTTPException, status, Depends, Header
-from typing import Annotated, Dict, Optional
+from typing import Annotated, AsyncIterator, Callable, Dict, Optional
 
 from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
 from app.services.telegram import TelegramService, TelegramNotificationError
-from app.utils.telegram_auth import validate_init_data, TelegramAuthError # Импортируем
+from app.services.stock import StockCache
+from app.services.order_index import OrderIndex
+from app.services.user_registry import UserRegistry
+from app.services.product_index import ProductIndex
+from app.services.facets import FacetIndex
+from app.services.suggest import SuggestIndex
+from app.services.recommendations import CoPurchaseIndex
+from app.services.tenants import Tenant
+from app.utils.telegram_auth import validate_request_init_data, TelegramAuthError # Импортируем
+from app.utils.rate_limit import KeyedRateLimiter
 from app.core.config import settings
 
+# --- Магазин запроса ---
+
+async def get_tenant(
+    request: Request,
+    x_shop_id: Annotated[Optional[str], Header(description="ID магазина (Mini App дополнительного магазина)")] = None,
+) -> AsyncIterator[Optional[Tenant]]:
+    """
+    Дополнительный магазин, к которому относится запрос (по X-Shop-Id или домену); None — основной магазин.
+    Магазин активируется при первом запросе и не деактивируется, пока запрос обрабатывается.
+    """
+    tenant_registry = getattr(request.app.state, 'tenant_registry', None)
+    if tenant_registry is None:
+        yield None
+        return
+    try:
+        shop = tenant_registry.resolve(x_shop_id, request.headers.get("host"))
+    except KeyError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Магазин не найден.")
+    if shop is None:
+        yield None
+        return
+    tenant = await tenant_registry.acquire(shop)
+    try:
+        yield tenant
+    finally:
+        tenant_registry.release(tenant)
+
+def _main_shop_only(tenant: Optional[Tenant], detail: str = "Недоступно для этого магазина."):
+    """Индексы каталога и заказов, рассылки и вебхуки ведутся только для основного магазина."""
+    if tenant is not None:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=detail)
+
+async def require_main_shop(tenant: Annotated[Optional[Tenant], Depends(get_tenant)]):
+    """Зависимость для маршрутов, которые есть только у основного магазина (например, вебхуки)."""
+    if tenant is not None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Недоступно для этого магазина.")
+
 # --- Зависимости для сервисов ---
 
-async def get_woocommerce_service(request: Request) -> WooCommerceService:
-    """Зависимость для получения экземпляра WooCommerceService из app.state."""
+async def get_woocommerce_service(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> WooCommerceService:
+    """Зависимость для получения экземпляра WooCommerceService магазина запроса."""
+    if tenant is not None:
+        return tenant.woocommerce_service
     service = getattr(request.app.state, 'woocommerce_service', None)
     if not service or not isinstance(service, WooCommerceService):
         raise HTTPException(
@@ -20,8 +71,12 @@ async def get_woocommerce_service(request: Request) -> WooCommerceService:
         )
     return service
 
-async def get_telegram_service(request: Request) -> TelegramService:
-    """Зависимость для получения экземпляра TelegramService из app.state."""
+async def get_telegram_service(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> TelegramService:
+    """Зависимость для получения экземпляра TelegramService магазина запроса."""
+    if tenant is not None:
+        return tenant.telegram_service
     service = getattr(request.app.state, 'telegram_service', None)
     if not service or not isinstance(service, TelegramService):
         raise HTTPException(
@@ -30,14 +85,123 @@ async def get_telegram_service(request: Request) -> TelegramService:
         )
     return service
 
+async def get_stock_cache(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> StockCache:
+    """Зависимость для получения кэша остатков магазина запроса."""
+    if tenant is not None:
+        return tenant.stock_cache
+    stock_cache = getattr(request.app.state, 'stock_cache', None)
+    if not stock_cache or not isinstance(stock_cache, StockCache):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Сервис остатков недоступен."
+        )
+    return stock_cache
+
+async def get_order_index(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> OrderIndex:
+    """Зависимость для получения локального индекса заказов из app.state."""
+    _main_shop_only(tenant, "История заказов недоступна для этого магазина.")
+    order_index = getattr(request.app.state, 'order_index', None)
+    if not order_index or not isinstance(order_index, OrderIndex):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="История заказов недоступна."
+        )
+    return order_index
+
+async def get_local_order_index(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> Optional[OrderIndex]:
+    """Локальный индекс заказов, если он ведется для магазина запроса (иначе None)."""
+    order_index = getattr(request.app.state, 'order_index', None)
+    if tenant is not None or not isinstance(order_index, OrderIndex):
+        return None
+    return order_index
+
+async def get_product_index(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> ProductIndex:
+    """Зависимость для получения загруженного индекса товаров из app.state."""
+    _main_shop_only(tenant)
+    product_index = getattr(request.app.state, 'product_index', None)
+    if not isinstance(product_index, ProductIndex) or not product_index.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Каталог еще загружается. Попробуйте позже."
+        )
+    return product_index
+
+async def get_facet_index(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> FacetIndex:
+    """Зависимость для получения фасетного индекса; 503, пока каталог не загружен."""
+    _main_shop_only(tenant)
+    facet_index = getattr(request.app.state, 'facet_index', None)
+    if not isinstance(facet_index, FacetIndex) or not facet_index.product_index.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Каталог еще загружается. Попробуйте позже."
+        )
+    return facet_index
+
+async def get_suggest_index(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> SuggestIndex:
+    """Зависимость для получения индекса подсказок поиска; 503, пока каталог не загружен."""
+    _main_shop_only(tenant)
+    suggest_index = getattr(request.app.state, 'suggest_index', None)
+    if not isinstance(suggest_index, SuggestIndex) or not suggest_index.product_index.ready:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Каталог еще загружается. Попробуйте позже."
+        )
+    return suggest_index
+
+async def get_co_purchase_index(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> CoPurchaseIndex:
+    """Зависимость для получения индекса совместных покупок из app.state."""
+    _main_shop_only(tenant)
+    co_purchase_index = getattr(request.app.state, 'co_purchase_index', None)
+    if not isinstance(co_purchase_index, CoPurchaseIndex):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Рекомендации недоступны."
+        )
+    return co_purchase_index
+
+async def get_fallback_catalog(
+    request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> Optional[ProductIndex]:
+    """
+    Индекс товаров для работы каталога в режиме только чтения, когда WooCommerce недоступен.
+    Возвращает None, если индекс не загружен (тогда эндпоинт просто отдает ошибку WooCommerce).
+    """
+    if tenant is not None:
+        return None
+    product_index = getattr(request.app.state, 'product_index', None)
+    if isinstance(product_index, ProductIndex) and product_index.ready:
+        return product_index
+    return None
+
 # --- Зависимость для валидации Telegram initData ---
 
+def _bot_token(tenant: Optional[Tenant]) -> str:
+    """Токен бота магазина: initData подписана ботом, из которого открыт Mini App."""
+    return tenant.shop.telegram_bot_token if tenant is not None else settings.TELEGRAM_BOT_TOKEN
+
 async def validate_telegram_data(
+    request: Request,
+    tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
     x_telegram_init_data: Annotated[Optional[str], Header(description="Строка initData из Telegram Mini App")] = None
 ) -> Dict:
     """
     Зависимость для валидации заголовка X-Telegram-Init-Data.
     Возвращает распарсенные и валидированные данные пользователя или вызывает HTTPException.
+    Пользователь отмечается в реестре (без ожидания записи на диск).
     """
     if not x_telegram_init_data:
          raise HTTPException(
@@ -45,9 +209,11 @@ async def validate_telegram_data(
             detail="Отсутствует заголовок X-Telegram-Init-Data.",
         )
 
-    is_valid, parsed_data = validate_init_data(
+    # Подпись могли уже проверить admission middleware или лимиты частоты — результат берется из состояния запроса
+    is_valid, parsed_data = validate_request_init_data(
+        request.scope.setdefault("state", {}),
         init_data=x_telegram_init_data,
-        bot_token=settings.TELEGRAM_BOT_TOKEN
+        bot_token=_bot_token(tenant),
     )
 
     if not parsed_data: # Ошибка парсинга или внутренняя ошибка валидатора
@@ -78,9 +244,89 @@ async def validate_telegram_data(
             detail="Не удалось извлечь информацию о пользователе Telegram из initData.",
         )
 
+    # Реестр пользователей (для рассылок) ведется только для бота основного магазина
+    user_registry = getattr(request.app.state, 'user_registry', None)
+    if tenant is None and isinstance(user_registry, UserRegistry):
+        user_registry.record(user_info, used_mini_app=True)
+
     # Возвращаем все распарсенные данные на случай, если нужны другие поля (start_param и т.д.)
     return parsed_data
 
+async def require_manager(
+    telegram_data: Annotated[Dict, Depends(validate_telegram_data)],
+    tenant: Annotated[Optional[Tenant], Depends(get_tenant)],
+) -> Dict:
+    """
+    Зависимость для эндпоинтов менеджеров: пользователь из initData должен быть в TELEGRAM_MANAGER_IDS
+    (или в manager_ids дополнительного магазина).
+    """
+    manager_ids = tenant.shop.manager_ids if tenant is not None else settings.TELEGRAM_MANAGER_IDS
+    if int(telegram_data['user']['id']) not in manager_ids:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Доступно только менеджерам магазина.",
+        )
+    return telegram_data
+
+# --- Ограничение частоты запросов ---
+
+def build_rate_limiters() -> Dict[str, KeyedRateLimiter]:
+    """Создает лимитеры для классов маршрутов: 'catalog' (чтение) и 'orders' (запись, выгрузки)."""
+    return {
+        "catalog": KeyedRateLimiter(
+            rate=settings.RATE_LIMIT_CATALOG_RATE,
+            burst=settings.RATE_LIMIT_CATALOG_BURST,
+            global_rate=settings.RATE_LIMIT_CATALOG_GLOBAL_RATE or None,
+            max_keys=settings.RATE_LIMIT_MAX_KEYS,
+        ),
+        "orders": KeyedRateLimiter(
+            rate=settings.RATE_LIMIT_ORDERS_RATE,
+            burst=settings.RATE_LIMIT_ORDERS_BURST,
+            global_rate=settings.RATE_LIMIT_ORDERS_GLOBAL_RATE or None,
+            max_keys=settings.RATE_LIMIT_MAX_KEYS,
+        ),
+    }
+
+def _get_client_key(request: Request, bot_token: str) -> str:
+    """
+    Ключ клиента для лимитов: Telegram ID, если initData валидна (подделать ID без подписи нельзя),
+    иначе IP-адрес.
+    """
+    init_data = request.headers.get("x-telegram-init-data")
+    if init_data:
+        is_valid, parsed_data = validate_request_init_data(
+            request.scope.setdefault("state", {}), init_data=init_data, bot_token=bot_token,
+        )
+        user_info = parsed_data.get('user') if is_valid and parsed_data else None
+        if isinstance(user_info, dict) and 'id' in user_info:
+            return f"tg:{user_info['id']}"
+
+    if settings.RATE_LIMIT_TRUST_FORWARDED_FOR:
+        forwarded_for = request.headers.get("x-forwarded-for")
+        if forwarded_for:
+            return f"ip:{forwarded_for.split(',')[0].strip()}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+def rate_limit(route_class: str) -> Callable:
+    """
+    Фабрика зависимостей ограничения частоты для класса маршрутов.
+    При превышении лимита отвечает 429 с заголовком Retry-After, не доходя до WooCommerce.
+    """
+    async def dependency(request: Request, tenant: Annotated[Optional[Tenant], Depends(get_tenant)]):
+        # У каждого магазина свои лимиты: всплеск в одном не расходует лимиты другого
+        limiters = tenant.rate_limiters if tenant is not None else getattr(request.app.state, 'rate_limiters', None)
+        limiter = limiters.get(route_class) if limiters else None
+        if limiter is None:
+            return # Лимиты выключены
+        wait = limiter.hit(_get_client_key(request, _bot_token(tenant)))
+        if wait > 0:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Слишком много запросов. Попробуйте позже.",
+                headers={"Retry-After": str(max(1, math.ceil(wait)))},
+            )
+    return dependency
+
 # --- Пример использования зависимости валидации в эндпоинте: ---
 # @router.post("/some_protected_route")
 # async def protected_route(
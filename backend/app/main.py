@@ -1,18 +1,37 @@
 # backend/app/main.py
 import logging
 import asyncio # <<<<<<<<<<<< Импортируем asyncio
+import time
+from typing import Awaitable, Callable, Dict, Optional
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, Request, status
 from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.exceptions import RequestValidationError
 from pydantic import ValidationError
+from aiogram.exceptions import TelegramUnauthorizedError
 
 from app.api.v1.router import api_router_v1
 from app.core.config import settings
 from app.services.woocommerce import WooCommerceService
 from app.services.telegram import TelegramService
-from app.bot.instance import initialize_bot, shutdown_bot
+from app.services.warmup import WarmupState, run_warmup
+from app.services.stock import StockCache
+from app.services.order_index import OrderIndex, run_order_sync
+from app.services.order_stats import OrderStats
+from app.services.recommendations import CoPurchaseIndex
+from app.services.broadcast import BroadcastService, BroadcastStore
+from app.services.user_registry import UserRegistry
+from app.services.product_index import ProductIndex, run_product_index_refresh
+from app.services.facets import FacetIndex
+from app.services.suggest import SuggestIndex
+from app.services.catalog_snapshot import CatalogSnapshot, open_snapshot
+from app.services.tenants import TenantRegistry, load_shops, run_tenant_reaper
+from app.bot.inline_results import InlineArticleCache
+from app.dependencies import build_rate_limiters, require_main_shop, require_manager
+from app.utils.fast_json import FastJSONResponse
+from app.utils.admission import AdmissionController, AdmissionMiddleware
+from app.bot.instance import initialize_bot, connect_bot, shutdown_bot
 
 # --- Настройка логирования ---
 log_level = settings.LOGGING_LEVEL.upper()
@@ -31,24 +50,122 @@ logger.info(f"Starting application with log level: {log_level}")
 
 
 # --- Lifespan для управления ресурсами ---
+async def _timed(timings: Dict[str, float], name: str, func: Callable[..., Awaitable], *args):
+    """Выполняет шаг запуска и записывает его длительность в timings."""
+    started = time.perf_counter()
+    result = await func(*args)
+    timings[name] = round(time.perf_counter() - started, 3)
+    logger.info(f"Startup: '{name}' ready in {timings[name]:.3f}s")
+    return result
+
+async def _run_bot(app: FastAPI, bot, dp, timings: Dict[str, float]):
+    """Подключает бота к Telegram (с повторами) и затем запускает polling."""
+    try:
+        await _timed(timings, "bot_connect", connect_bot, bot)
+    except TelegramUnauthorizedError:
+        return # Причина уже залогирована в connect_bot; API продолжает работать без бота
+    app.state.bot_connected = True
+    # Рассылки, прерванные предыдущей остановкой, продолжаются только после подключения к Telegram
+    app.state.broadcast_service.start()
+    logger.info("Starting bot polling in background...")
+    # Пропускаем старые апдейты, чтобы не реагировать на /start, отправленный до запуска
+    await dp.start_polling(bot, skip_updates=True)
+
+async def _open_catalog_snapshot() -> Optional[CatalogSnapshot]:
+    if not settings.CATALOG_SNAPSHOT_ENABLED:
+        return None
+    return await asyncio.to_thread(open_snapshot, settings.CATALOG_SNAPSHOT_PATH)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Application startup: Initializing resources...")
-    bot, dp = await initialize_bot()
-    woo_service = WooCommerceService()
+    startup_started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    app.state.startup_timings = timings
+    app.state.bot_connected = False
+
+    # Подсистемы создаются параллельно и без сетевых запросов к Telegram,
+    # поэтому недоступность Telegram не мешает API каталога стартовать
+    (bot, dp), woo_service, order_index, broadcast_store, user_registry, catalog_snapshot = await asyncio.gather(
+        _timed(timings, "bot_init", initialize_bot),
+        _timed(timings, "woocommerce", asyncio.to_thread, WooCommerceService),
+        _timed(timings, "order_index", asyncio.to_thread, OrderIndex, settings.ORDER_INDEX_PATH),
+        _timed(timings, "broadcast_store", asyncio.to_thread, BroadcastStore, settings.BROADCAST_DB_PATH),
+        _timed(timings, "user_registry", asyncio.to_thread, UserRegistry, settings.USER_REGISTRY_PATH),
+        _timed(timings, "catalog_snapshot", _open_catalog_snapshot),
+    )
     telegram_service = TelegramService(bot=bot)
+    telegram_service.start()
 
     app.state.woocommerce_service = woo_service
+    # Лимиты частоты запросов к API (по пользователю/IP и общие на класс маршрутов)
+    app.state.rate_limiters = build_rate_limiters() if settings.RATE_LIMIT_ENABLED else {}
+    # Реестр пользователей: пишется из /start и из проверки initData, сбрасывается на диск пачками
+    user_registry.start()
+    app.state.user_registry = user_registry
+    dp["user_registry"] = user_registry
+    app.state.stock_cache = StockCache(woo_service)
+    # Индекс товаров в памяти для inline-режима; результаты для Telegram предвычисляются при перестройке
+    product_index = ProductIndex(woo_service)
+    inline_articles = InlineArticleCache()
+    product_index.add_rebuild_hook(inline_articles.rebuild)
+    product_index.add_update_hook(inline_articles.update)
+    facet_index = FacetIndex(product_index) # Маски фасетов перестраиваются вместе с индексом
+    suggest_index = SuggestIndex(product_index) # Подсказки поиска по мере ввода
+    if catalog_snapshot is not None:
+        # Каталог доступен сразу после старта, даже если WooCommerce сейчас недоступен
+        await _timed(timings, "product_index_from_snapshot", asyncio.to_thread, product_index.load_snapshot, catalog_snapshot)
+    app.state.product_index = product_index
+    app.state.facet_index = facet_index
+    app.state.suggest_index = suggest_index
+    dp["product_index"] = product_index
+    dp["inline_articles"] = inline_articles
+    app.state.order_index = order_index
+    # Агрегаты для команд менеджеров; обновляются при каждой записи в индекс заказов
+    order_stats = OrderStats(order_index)
+    app.state.order_stats = order_stats
+    dp["order_stats"] = order_stats # Доступно хендлерам бота как аргумент order_stats
+    # Совместные покупки для "С этим покупают"; обновляются той же записью заказа
+    app.state.co_purchase_index = CoPurchaseIndex(order_index)
+    # Смены статуса (из синхронизации или вебхука) уходят покупателям через очередь TelegramService
+    order_index.add_listener(telegram_service.notify_order_status_change)
     app.state.telegram_service = telegram_service
+    # Рассылки делят с TelegramService глобальный лимит скорости бота
+    broadcast_service = BroadcastService(bot, broadcast_store, user_registry, telegram_service.global_bucket)
+    # Получатели из прежней таблицы рассылок переезжают в реестр пользователей
+    await _timed(timings, "broadcast_recipients_migration", broadcast_service.migrate_legacy_recipients)
+    app.state.broadcast_service = broadcast_service
+    dp["broadcast_service"] = broadcast_service
     app.state.bot_instance = bot
     app.state.dispatcher_instance = dp
+    # Дополнительные магазины: описания читаются при старте, сервисы создаются при первом запросе
+    tenant_registry = None
+    if settings.SHOPS_CONFIG_PATH:
+        shops = await asyncio.to_thread(load_shops, settings.SHOPS_CONFIG_PATH)
+        rate_limiters_factory = build_rate_limiters if settings.RATE_LIMIT_ENABLED else dict
+        tenant_registry = TenantRegistry(shops, rate_limiters_factory)
+        logger.info(f"Loaded {len(shops)} additional shops from {settings.SHOPS_CONFIG_PATH}.")
+    app.state.tenant_registry = tenant_registry
 
-    logger.info("WooCommerce service, Telegram service, Bot, and Dispatcher initialized.")
+    timings["total"] = round(time.perf_counter() - startup_started, 3)
+    logger.info(f"WooCommerce service, Telegram service, Bot, and Dispatcher initialized in {timings['total']:.3f}s.")
 
-    # >>>>>>>>>> Запускаем polling в фоновой задаче <<<<<<<<<<
-    logger.info("Starting bot polling in background...")
-    # Пропускаем старые апдейты, чтобы не реагировать на /start, отправленный до запуска
-    polling_task = asyncio.create_task(dp.start_polling(bot, skip_updates=True))
+    # Прогрев кэша каталога в фоне; /ready вернет 200 только после его завершения
+    warmup_state = WarmupState(enabled=settings.WARMUP_ENABLED)
+    app.state.warmup_state = warmup_state
+    warmup_task = asyncio.create_task(run_warmup(woo_service, warmup_state))
+
+    product_index_task = asyncio.create_task(run_product_index_refresh(product_index))
+
+    # Синхронизация локального индекса заказов с WooCommerce
+    order_sync_task = None
+    if settings.ORDER_SYNC_ENABLED:
+        order_sync_task = asyncio.create_task(run_order_sync(woo_service, order_index))
+
+    tenant_reaper_task = asyncio.create_task(run_tenant_reaper(tenant_registry)) if tenant_registry else None
+
+    # >>>>>>>>>> Подключаем бота и запускаем polling в фоновой задаче <<<<<<<<<<
+    polling_task = asyncio.create_task(_run_bot(app, bot, dp, timings))
     # >>>>>>>>>>>>>>>>>>>>>>>>><<<<<<<<<<<<<<<<<<<<<<<<<<<<<<
 
     try:
@@ -57,6 +174,14 @@ async def lifespan(app: FastAPI):
         # Код, выполняемый при остановке приложения
         logger.info("Application shutdown: Cleaning up resources...")
 
+        for background_task in (warmup_task, product_index_task, order_sync_task, tenant_reaper_task):
+            if background_task and not background_task.done():
+                background_task.cancel()
+                try:
+                    await background_task
+                except asyncio.CancelledError:
+                    pass
+
         # >>>>>>>>>> Останавливаем polling <<<<<<<<<<
         if polling_task and not polling_task.done():
              logger.info("Stopping bot polling...")
@@ -74,6 +199,13 @@ async def lifespan(app: FastAPI):
 
         # Закрываем HTTP клиент WooCommerce
         await woo_service.close_client()
+        if tenant_registry is not None:
+            await tenant_registry.close()
+        product_index.close()
+        order_index.close()
+        await broadcast_service.close()
+        await user_registry.close()
+        await telegram_service.close()
         # Корректно останавливаем сессию бота
         await shutdown_bot(bot=app.state.bot_instance)
         logger.info("Resources cleaned up successfully.")
@@ -87,7 +219,8 @@ app = FastAPI(
     lifespan=lifespan,
     docs_url="/docs",
     redoc_url="/redoc",
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=FastJSONResponse, # Сериализация ответов через orjson (если установлен)
 )
 
 origins = [
@@ -100,6 +233,12 @@ origins = [
 ]
 logger.info(f"Allowed CORS origins: {origins}")
 
+# Приоритетный допуск запросов к API. Добавляется до CORS, чтобы ответы 503 тоже получали CORS-заголовки
+admission_controller = AdmissionController.from_settings() if settings.ADMISSION_ENABLED else None
+app.state.admission_controller = admission_controller
+if admission_controller is not None:
+    app.add_middleware(AdmissionMiddleware, controller=admission_controller, path_prefix=settings.API_V1_STR)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -139,4 +278,39 @@ logger.info(f"Included API router at prefix: {settings.API_V1_STR}")
 @app.get("/", tags=["Root"], summary="Health check")
 async def read_root():
     """Простой эндпоинт для проверки работоспособности API."""
-    return {"status": "ok", "project": settings.PROJECT_NAME}
\ No newline at end of file
+    return {"status": "ok", "project": settings.PROJECT_NAME}
+
+@app.get("/ready", tags=["Root"], summary="Readiness check")
+async def read_ready(request: Request):
+    """
+    Готовность инстанса принимать трафик: 200 после прогрева кэшей, иначе 503.
+    Предназначен для балансировщика, в отличие от health check на "/".
+    """
+    warmup_state = getattr(request.app.state, 'warmup_state', None)
+    if warmup_state is None:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"ready": False, "status": "starting"})
+    content = warmup_state.as_dict()
+    # Бот подключается независимо и на готовность API каталога не влияет
+    content["bot_connected"] = getattr(request.app.state, 'bot_connected', False)
+    content["startup_timings"] = getattr(request.app.state, 'startup_timings', {})
+    tenant_registry = getattr(request.app.state, 'tenant_registry', None)
+    if tenant_registry is not None:
+        content["tenants"] = tenant_registry.stats()
+    return JSONResponse(
+        status_code=status.HTTP_200_OK if warmup_state.ready else status.HTTP_503_SERVICE_UNAVAILABLE,
+        content=content,
+    )
+
+@app.get(
+    "/admission",
+    tags=["Root"],
+    summary="Admission control metrics",
+    # Счетчики нагрузки — служебные данные: только менеджерам основного магазина (initData)
+    dependencies=[Depends(require_main_shop), Depends(require_manager)],
+)
+async def read_admission(request: Request):
+    """Занятые места, очереди и счетчики отклоненных запросов по классам приоритета. Только для менеджеров."""
+    admission_controller = getattr(request.app.state, 'admission_controller', None)
+    if admission_controller is None:
+        return {"enabled": False}
+    return {"enabled": True, **admission_controller.stats()}
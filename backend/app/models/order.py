@@ -52,4 +52,4 @@ class OrderWooCommerce(BaseModel):
     date_created: str # Дата приходит как строка
     line_items: List[Dict] # Ответ по line_items сложнее, пока оставим как Dict
     meta_data: List[MetaData] = []
-    # ... другие поля по необходимости
\ No newline at end of file
+    # ... другие поля по необходимости
@@ -1,5 +1,5 @@
 # backend/app/models/product.py
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
 from typing import List, Optional
 
 # Упрощенные модели для начала, можно расширить по необходимости
@@ -32,4 +32,9 @@ class Product(BaseModel):
     stock_status: str # 'instock', 'outofstock', 'onbackorder'
     images: List[Image] = []
     categories: List[Category] = []
-    # Добавьте другие поля: attributes, variations, meta_data и т.д.
\ No newline at end of file
+    # Добавьте другие поля: attributes, variations, meta_data и т.д.
+
+
+# Адаптеры списков собираются один раз при импорте (для одиночной модели достаточно Product.model_validate)
+ProductListAdapter = TypeAdapter(List[Product])
+CategoryListAdapter = TypeAdapter(List[Category])
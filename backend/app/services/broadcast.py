@@ -0,0 +1,351 @@
+# backend/app/services/broadcast.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter, TelegramServerError,
+)
+
+from app.core.config import settings
+from app.services.user_registry import UserRegistry
+from app.utils.rate_limit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class BroadcastError(Exception):
+    """Ошибка управления рассылкой (например, рассылка уже идет)."""
+    pass
+
+
+class BroadcastStore:
+    """
+    Хранилище рассылок и их прогресса (SQLite). Получатели берутся из реестра пользователей.
+    Прогресс хранится курсором по user_id, поэтому прерванная рассылка продолжается с места остановки.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS broadcasts ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, text TEXT NOT NULL, created_by INTEGER, "
+                "status TEXT NOT NULL, cursor INTEGER NOT NULL DEFAULT 0, total INTEGER NOT NULL DEFAULT 0, "
+                "sent INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, blocked INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, finished_at REAL, owner TEXT, heartbeat REAL)"
+            )
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def get_legacy_recipients(self) -> List[Tuple[int, float, int]]:
+        """Получатели из прежней таблицы recipients (до переноса в реестр пользователей)."""
+        with self._lock:
+            exists = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recipients'"
+            ).fetchone()
+            if not exists:
+                return []
+            return self._conn.execute("SELECT user_id, added_at, blocked FROM recipients").fetchall()
+
+    def drop_legacy_recipients(self):
+        self._execute("DROP TABLE IF EXISTS recipients")
+
+    def create_broadcast(self, text: str, created_by: Optional[int], total: int) -> int:
+        cursor = self._execute(
+            "INSERT INTO broadcasts (text, created_by, status, total, created_at) VALUES (?, ?, 'running', ?, ?)",
+            (text, created_by, total, time.time()),
+        )
+        return cursor.lastrowid
+
+    def claim(self, broadcast_id: int, owner: str, lease_seconds: float) -> bool:
+        """Захватывает выполнение рассылки (аренда), чтобы ее не вели несколько воркеров сразу."""
+        now = time.time()
+        cursor = self._execute(
+            "UPDATE broadcasts SET owner = ?, heartbeat = ? WHERE id = ? AND status = 'running' "
+            "AND (owner IS NULL OR owner = ? OR heartbeat < ?)",
+            (owner, now, broadcast_id, owner, now - lease_seconds),
+        )
+        return cursor.rowcount == 1
+
+    def save_progress(self, broadcast_id: int, cursor: int, sent: int, failed: int, blocked: int):
+        self._execute(
+            "UPDATE broadcasts SET cursor = ?, sent = sent + ?, failed = failed + ?, blocked = blocked + ?, "
+            "heartbeat = ? WHERE id = ?",
+            (cursor, sent, failed, blocked, time.time(), broadcast_id),
+        )
+
+    def finish(self, broadcast_id: int, status: str):
+        self._execute(
+            "UPDATE broadcasts SET status = ?, finished_at = ?, owner = NULL WHERE id = ?",
+            (status, time.time(), broadcast_id),
+        )
+
+    def get_broadcast(self, broadcast_id: Optional[int] = None) -> Optional[Dict]:
+        """Возвращает рассылку по ID или последнюю созданную."""
+        with self._lock:
+            self._conn.row_factory = sqlite3.Row
+            try:
+                if broadcast_id is None:
+                    row = self._conn.execute("SELECT * FROM broadcasts ORDER BY id DESC LIMIT 1").fetchone()
+                else:
+                    row = self._conn.execute("SELECT * FROM broadcasts WHERE id = ?", (broadcast_id,)).fetchone()
+            finally:
+                self._conn.row_factory = None
+        return dict(row) if row else None
+
+    def get_running_ids(self) -> List[int]:
+        return [row[0] for row in self._execute("SELECT id FROM broadcasts WHERE status = 'running'").fetchall()]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BroadcastService:
+    """
+    Рассылки объявлений всем, кто запускал бота.
+
+    Отправка идет параллельно пачками под общим лимитом скорости Telegram,
+    заблокировавшие бота пользователи исключаются из получателей,
+    прогресс сохраняется после каждой пачки и переживает перезапуск.
+    Пока Telegram недоступен, рассылка стоит на паузе и курсор не сдвигается.
+    """
+    def __init__(self, bot: Bot, store: BroadcastStore, user_registry: UserRegistry, rate_limiter: TokenBucket):
+        self.bot = bot
+        self.store = store
+        # Единственный источник получателей: /start и блокировки отмечаются только в реестре
+        self.user_registry = user_registry
+        # Общий с TelegramService лимит: ограничение Telegram действует на бота целиком
+        self._bucket = rate_limiter
+        self._owner_id = uuid.uuid4().hex
+        self._tasks: Dict[int, asyncio.Task] = {}
+        # Скорость текущих рассылок в этом воркере: broadcast_id -> (время старта, обработано)
+        self._progress: Dict[int, Tuple[float, int]] = {}
+        self._watch_task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Запускает подхват незавершенных рассылок. Вызывается после подключения бота к Telegram."""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch_unfinished())
+
+    async def _watch_unfinished(self):
+        # Повторяется периодически: рассылку остановившегося воркера подхватываем, когда истечет его аренда
+        interval = max(1.0, settings.BROADCAST_LEASE_SECONDS / 2)
+        while True:
+            try:
+                await self.resume_unfinished()
+            except Exception as e:
+                logger.error(f"Failed to resume unfinished broadcasts: {e}")
+            await asyncio.sleep(interval)
+
+    async def migrate_legacy_recipients(self):
+        """Однократно переносит получателей из прежней таблицы рассылок в реестр пользователей."""
+        recipients = await asyncio.to_thread(self.store.get_legacy_recipients)
+        if not recipients:
+            return
+        await asyncio.to_thread(self.user_registry.import_recipients, recipients)
+        await asyncio.to_thread(self.store.drop_legacy_recipients)
+        logger.info(f"Moved {len(recipients)} broadcast recipients to the user registry.")
+
+    async def start_broadcast(self, text: str, created_by: Optional[int] = None) -> int:
+        if await asyncio.to_thread(self.store.get_running_ids):
+            raise BroadcastError("Уже идет другая рассылка. Дождитесь ее окончания или отмените ее.")
+        # Недавние /start еще могут быть в буфере реестра
+        await self.user_registry.flush()
+        total = await asyncio.to_thread(self.user_registry.count_recipients)
+        broadcast_id = await asyncio.to_thread(self.store.create_broadcast, text, created_by, total)
+        logger.info(f"Broadcast {broadcast_id} created by {created_by}.")
+        self._launch(broadcast_id)
+        return broadcast_id
+
+    async def resume_unfinished(self):
+        """Продолжает рассылки, прерванные перезапуском (если их не ведет другой воркер)."""
+        for broadcast_id in await asyncio.to_thread(self.store.get_running_ids):
+            task = self._tasks.get(broadcast_id)
+            if task is None or task.done():
+                logger.debug(f"Trying to resume broadcast {broadcast_id}...")
+                self._launch(broadcast_id)
+
+    async def cancel_broadcast(self, broadcast_id: int) -> bool:
+        broadcast = await asyncio.to_thread(self.store.get_broadcast, broadcast_id)
+        if not broadcast or broadcast["status"] != "running":
+            return False
+        # Статус в базе остановит раннер и в другом воркере после текущей пачки
+        await asyncio.to_thread(self.store.finish, broadcast_id, "cancelled")
+        task = self._tasks.get(broadcast_id)
+        if task and not task.done():
+            task.cancel()
+        logger.info(f"Broadcast {broadcast_id} cancelled.")
+        return True
+
+    def _launch(self, broadcast_id: int):
+        task = self._tasks.get(broadcast_id)
+        if task is None or task.done():
+            self._tasks[broadcast_id] = asyncio.create_task(self._run(broadcast_id))
+
+    async def get_status(self, broadcast_id: Optional[int] = None) -> Optional[Dict]:
+        """Состояние рассылки с оценкой скорости (сообщений/сек) и оставшегося времени."""
+        broadcast = await asyncio.to_thread(self.store.get_broadcast, broadcast_id)
+        if not broadcast:
+            return None
+        processed = broadcast["sent"] + broadcast["failed"] + broadcast["blocked"]
+        remaining = max(0, broadcast["total"] - processed)
+        rate = None
+        progress = self._progress.get(broadcast["id"])
+        if progress:
+            started_at, processed_here = progress
+            elapsed = time.monotonic() - started_at
+            rate = processed_here / elapsed if elapsed > 0 else None
+        broadcast["processed"] = processed
+        broadcast["remaining"] = remaining
+        broadcast["rate"] = rate
+        broadcast["eta_seconds"] = remaining / rate if rate else None
+        return broadcast
+
+    async def _send_one(self, user_id: int, text: str) -> str:
+        """
+        Отправляет сообщение одному получателю. Возвращает 'sent', 'blocked', 'failed'
+        или 'retry' — Telegram временно недоступен, отправку нужно повторить позже.
+        """
+        for _ in range(3):
+            await self._bucket.acquire()
+            try:
+                await self.bot.send_message(user_id, text, disable_web_page_preview=True)
+                return "sent"
+            except TelegramRetryAfter as e:
+                logger.warning(f"Broadcast hit flood limit. Sleeping {e.retry_after}s.")
+                await asyncio.sleep(e.retry_after)
+            except TelegramForbiddenError:
+                return "blocked" # Бот заблокирован или пользователь удален
+            except TelegramBadRequest as e:
+                if "chat not found" in str(e).lower():
+                    return "blocked"
+                logger.error(f"Broadcast message to {user_id} rejected: {e}")
+                return "failed"
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning(f"Telegram is unavailable while sending broadcast message to {user_id}: {e}")
+                return "retry"
+            except Exception as e:
+                logger.error(f"Failed to send broadcast message to {user_id}: {e}")
+                return "failed"
+        return "failed"
+
+    async def _run(self, broadcast_id: int):
+        lease = settings.BROADCAST_LEASE_SECONDS
+        if not await asyncio.to_thread(self.store.claim, broadcast_id, self._owner_id, lease):
+            logger.debug(f"Broadcast {broadcast_id} is handled by another worker.")
+            return
+        broadcast = await asyncio.to_thread(self.store.get_broadcast, broadcast_id)
+        logger.info(f"Broadcast {broadcast_id} claimed (cursor {broadcast['cursor']}).")
+        text, cursor = broadcast["text"], broadcast["cursor"]
+        started_at = time.monotonic()
+        processed = 0
+        self._progress[broadcast_id] = (started_at, 0)
+        semaphore = asyncio.Semaphore(settings.BROADCAST_CONCURRENCY)
+
+        async def send(user_id: int) -> str:
+            async with semaphore:
+                return await self._send_one(user_id, text)
+
+        try:
+            while True:
+                chunk = await asyncio.to_thread(
+                    self.user_registry.get_recipients_chunk, cursor, settings.BROADCAST_CHUNK_SIZE
+                )
+                if not chunk:
+                    break
+                results = dict(zip(chunk, await asyncio.gather(*(send(user_id) for user_id in chunk))))
+                pending = [uid for uid, result in results.items() if result == "retry"]
+                backoff = 1.0
+                while pending:
+                    # Telegram недоступен: курсор не сдвигается, пока пачка не будет отправлена целиком
+                    logger.warning(
+                        f"Broadcast {broadcast_id} paused: {len(pending)} messages not delivered. Retrying in {backoff:.0f}s."
+                    )
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, settings.BROADCAST_RETRY_BACKOFF_MAX)
+                    if not await self._still_owned(broadcast_id, lease):
+                        return
+                    results.update(zip(pending, await asyncio.gather(*(send(user_id) for user_id in pending))))
+                    pending = [uid for uid in pending if results[uid] == "retry"]
+                outcomes = list(results.values())
+                blocked_ids = [uid for uid, result in results.items() if result == "blocked"]
+                await asyncio.to_thread(self.user_registry.mark_blocked, blocked_ids)
+                cursor = chunk[-1]
+                await asyncio.to_thread(
+                    self.store.save_progress, broadcast_id, cursor,
+                    outcomes.count("sent"), outcomes.count("failed"), len(blocked_ids),
+                )
+                processed += len(chunk)
+                self._progress[broadcast_id] = (started_at, processed)
+
+                status = await self.get_status(broadcast_id)
+                if status["status"] != "running":
+                    logger.info(f"Broadcast {broadcast_id} stopped with status '{status['status']}'.")
+                    return
+                eta = f"{status['eta_seconds']:.0f}s" if status["eta_seconds"] is not None else "?"
+                logger.info(
+                    f"Broadcast {broadcast_id}: {status['processed']}/{status['total']} processed, "
+                    f"{status['rate'] or 0:.1f} msg/s, ETA {eta}."
+                )
+                if not await asyncio.to_thread(self.store.claim, broadcast_id, self._owner_id, lease):
+                    logger.warning(f"Lost lease on broadcast {broadcast_id}. Stopping here.")
+                    return
+
+            await asyncio.to_thread(self.store.finish, broadcast_id, "done")
+            status = await self.get_status(broadcast_id)
+            logger.info(
+                f"Broadcast {broadcast_id} finished: sent {status['sent']}, failed {status['failed']}, "
+                f"blocked {status['blocked']} in {time.monotonic() - started_at:.0f}s."
+            )
+            if status.get("created_by"):
+                await self._send_one(
+                    status["created_by"],
+                    f"✅ Рассылка #{broadcast_id} завершена: отправлено {status['sent']}, "
+                    f"ошибок {status['failed']}, заблокировали бота {status['blocked']}.",
+                )
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception(f"Broadcast {broadcast_id} runner failed: {e}. It will be resumed after the lease expires.")
+        finally:
+            self._progress.pop(broadcast_id, None)
+
+    async def _still_owned(self, broadcast_id: int, lease: float) -> bool:
+        """Во время паузы: рассылку не отменили, и аренда продлена (ее не подхватит другой воркер)."""
+        broadcast = await asyncio.to_thread(self.store.get_broadcast, broadcast_id)
+        if not broadcast or broadcast["status"] != "running":
+            logger.info(f"Broadcast {broadcast_id} stopped during pause.")
+            return False
+        if not await asyncio.to_thread(self.store.claim, broadcast_id, self._owner_id, lease):
+            logger.warning(f"Lost lease on broadcast {broadcast_id} during pause. Stopping here.")
+            return False
+        return True
+
+    async def close(self):
+        """Останавливает раннеры; незавершенные рассылки продолжатся при следующем запуске."""
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+        for task in self._tasks.values():
+            if not task.done():
+                task.cancel()
+        for task in [self._watch_task, *self._tasks.values()]:
+            if task is None:
+                continue
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        await asyncio.to_thread(self.store.close)
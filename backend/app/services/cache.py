@@ -0,0 +1,542 @@
+# backend/app/services/cache.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.utils.fast_json import dumps as json_dumps, loads as json_loads
+from app.utils.compression import precompress
+
+logger = logging.getLogger(__name__)
+
+# Специальный маркер для инвалидации по префиксу ключа
+PREFIX_WILDCARD = "*"
+
+
+class CacheBackendError(Exception):
+    """Ошибка бэкенда кэша второго уровня."""
+    pass
+
+
+class MemoryCache:
+    """
+    Кэш первого уровня (внутри процесса) с ограничением по размеру (LRU) и TTL.
+    """
+    def __init__(self, max_items: int = 1000):
+        self.max_items = max_items
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            self._data.pop(key, None)
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any, expires_at: float):
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_items:
+            self._data.popitem(last=False)
+
+    def delete(self, key: str):
+        self._data.pop(key, None)
+
+    def delete_prefix(self, prefix: str):
+        for key in [k for k in self._data if k.startswith(prefix)]:
+            self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class CacheBackend:
+    """
+    Базовый интерфейс кэша второго уровня, общего для всех воркеров.
+    Значения хранятся как bytes вместе с абсолютным временем истечения.
+    """
+    name = "base"
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        """Возвращает (значение, expires_at) или None."""
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, key: str):
+        raise NotImplementedError
+
+    async def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        """Пытается захватить блокировку ключа. Возвращает True, если удалось."""
+        raise NotImplementedError
+
+    async def release_lock(self, key: str, owner: str):
+        raise NotImplementedError
+
+    async def publish_invalidation(self, key: str):
+        """Рассылает всем воркерам сообщение об инвалидации ключа (или префикса с '*')."""
+        raise NotImplementedError
+
+    async def listen_invalidations(self, callback: Callable[[str], None]):
+        """
+        Бесконечно слушает сообщения об инвалидации и вызывает callback для каждого ключа.
+        Завершается только отменой задачи.
+        """
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Общий кэш на SQLite-файле для воркеров на одной машине.
+    Блокировки и рассылка инвалидаций реализованы отдельными таблицами.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str, poll_interval: float = 1.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        # Одно соединение на процесс, доступ к нему сериализуется через threading.Lock
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_locks ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_invalidations ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+        logger.info(f"SQLite cache backend initialized at {path}")
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def _fetchone(self, sql: str, params: tuple = ()) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    def _fetchall(self, sql: str, params: tuple = ()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        row = await asyncio.to_thread(
+            self._fetchone, "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+        )
+        if not row or row[1] <= time.time():
+            return None
+        return bytes(row[0]), row[1]
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, sqlite3.Binary(value), time.time() + ttl),
+        )
+
+    async def delete(self, key: str):
+        if key.endswith(PREFIX_WILDCARD):
+            pattern = key[:-1].replace("%", r"\%").replace("_", r"\_") + "%"
+            await asyncio.to_thread(
+                self._execute, "DELETE FROM cache_entries WHERE key LIKE ? ESCAPE '\\'", (pattern,)
+            )
+        else:
+            await asyncio.to_thread(self._execute, "DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def _acquire_lock_sync(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_locks WHERE key = ? AND expires_at <= ?", (key, now))
+            cursor = self._conn.execute(
+                "INSERT OR IGNORE INTO cache_locks (key, owner, expires_at) VALUES (?, ?, ?)",
+                (key, owner, now + ttl),
+            )
+            return cursor.rowcount == 1
+
+    async def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        return await asyncio.to_thread(self._acquire_lock_sync, key, owner, ttl)
+
+    async def release_lock(self, key: str, owner: str):
+        await asyncio.to_thread(
+            self._execute, "DELETE FROM cache_locks WHERE key = ? AND owner = ?", (key, owner)
+        )
+
+    async def publish_invalidation(self, key: str):
+        await asyncio.to_thread(
+            self._execute,
+            "INSERT INTO cache_invalidations (key, created_at) VALUES (?, ?)",
+            (key, time.time()),
+        )
+
+    async def listen_invalidations(self, callback: Callable[[str], None]):
+        # Начинаем с текущего конца журнала: старые инвалидации нас не касаются
+        row = await asyncio.to_thread(self._fetchone, "SELECT COALESCE(MAX(id), 0) FROM cache_invalidations")
+        last_id = row[0] if row else 0
+        last_cleanup = time.time()
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                rows = await asyncio.to_thread(
+                    self._fetchall,
+                    "SELECT id, key FROM cache_invalidations WHERE id > ? ORDER BY id",
+                    (last_id,),
+                )
+                for row_id, key in rows:
+                    last_id = row_id
+                    callback(key)
+                # Периодически чистим журнал и протухшие записи
+                if time.time() - last_cleanup > 60:
+                    last_cleanup = time.time()
+                    await asyncio.to_thread(
+                        self._execute, "DELETE FROM cache_invalidations WHERE created_at < ?", (time.time() - 300,)
+                    )
+                    await asyncio.to_thread(
+                        self._execute, "DELETE FROM cache_entries WHERE expires_at <= ?", (time.time(),)
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Error polling SQLite cache invalidations: {e}")
+
+    async def close(self):
+        with self._lock:
+            self._conn.close()
+        logger.info("SQLite cache backend closed.")
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Общий кэш в Redis (или совместимом сервере) для воркеров на разных машинах.
+    Требует установленного пакета `redis` (не входит в обязательные зависимости).
+    """
+    name = "redis"
+    _RELEASE_LOCK_SCRIPT = (
+        "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+    )
+
+    def __init__(self, url: str, key_prefix: str = "wcapp"):
+        try:
+            import redis.asyncio as redis_asyncio
+        except ImportError as e:
+            raise CacheBackendError("Для CACHE_BACKEND=redis необходимо установить пакет 'redis'.") from e
+        self._redis = redis_asyncio.from_url(url)
+        self.channel = f"{key_prefix}:invalidations"
+        logger.info(f"Redis cache backend initialized for {url}")
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, float]]:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.get(key)
+            pipe.pttl(key)
+            value, pttl = await pipe.execute()
+        if value is None:
+            return None
+        expires_at = time.time() + (pttl / 1000 if pttl and pttl > 0 else 0)
+        return value, expires_at
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self._redis.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, key: str):
+        if key.endswith(PREFIX_WILDCARD):
+            async for found in self._redis.scan_iter(match=key, count=500):
+                await self._redis.delete(found)
+        else:
+            await self._redis.delete(key)
+
+    async def acquire_lock(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self._redis.set(f"lock:{key}", owner, nx=True, px=max(1, int(ttl * 1000))))
+
+    async def release_lock(self, key: str, owner: str):
+        await self._redis.eval(self._RELEASE_LOCK_SCRIPT, 1, f"lock:{key}", owner)
+
+    async def publish_invalidation(self, key: str):
+        await self._redis.publish(self.channel, key)
+
+    async def listen_invalidations(self, callback: Callable[[str], None]):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(self.channel)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = message.get("data")
+                callback(data.decode() if isinstance(data, bytes) else str(data))
+        finally:
+            await pubsub.aclose()
+
+    async def close(self):
+        await self._redis.aclose()
+        logger.info("Redis cache backend closed.")
+
+
+class CachedJSON:
+    """
+    Значение кэша вместе с его JSON-представлением.
+    Тело сериализуется не больше одного раза (или берется готовым из L2), поэтому
+    эндпоинты могут отдавать его клиенту как есть, без повторной сериализации.
+    Сжатые варианты тела (gzip, br) строятся один раз при заполнении L1 и хранятся рядом.
+    """
+    __slots__ = ("data", "_body", "variants")
+
+    def __init__(self, data: Any, body: Optional[bytes] = None):
+        self.data = data
+        self._body = body
+        self.variants: Dict[str, bytes] = {}
+
+    @property
+    def body(self) -> bytes:
+        if self._body is None:
+            self._body = json_dumps(self.data)
+        return self._body
+
+    def precompress(self) -> "CachedJSON":
+        self.variants = precompress(self.body)
+        return self
+
+
+class TieredCache:
+    """
+    Двухуровневый кэш: L1 в памяти процесса и опциональный общий L2 (SQLite/Redis).
+
+    get_or_load гарантирует, что в рамках процесса один ключ загружается только одной
+    корутиной, а при наличии L2 — что только один воркер обновляет ключ (блокировка на ключ).
+    """
+    def __init__(
+        self,
+        backend: Optional[CacheBackend] = None,
+        key_prefix: str = "wcapp",
+        l1_max_items: int = 1000,
+        l1_max_ttl: float = 60.0,
+        lock_ttl: float = 15.0,
+        lock_wait: float = 5.0,
+    ):
+        self.backend = backend
+        self.key_prefix = key_prefix
+        self.l1 = MemoryCache(max_items=l1_max_items)
+        self.l1_max_ttl = l1_max_ttl
+        self.lock_ttl = lock_ttl
+        self.lock_wait = lock_wait
+        self._owner_id = uuid.uuid4().hex
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._listener_task: Optional[asyncio.Task] = None
+
+    def _full_key(self, key: str) -> str:
+        return f"{self.key_prefix}:{key}"
+
+    def _ensure_listener(self):
+        """Лениво запускает фоновое прослушивание инвалидаций от других воркеров."""
+        if self.backend is None:
+            return
+        if self._listener_task is None or self._listener_task.done():
+            self._listener_task = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                await self.backend.listen_invalidations(self._on_invalidation)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation listener failed: {e}. Restarting in 5s...")
+                await asyncio.sleep(5)
+
+    def _on_invalidation(self, full_key: str):
+        if full_key.endswith(PREFIX_WILDCARD):
+            self.l1.delete_prefix(full_key[:-1])
+        else:
+            self.l1.delete(full_key)
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = await self.get_entry(key)
+        return entry.data if entry is not None else None
+
+    async def get_entry(self, key: str) -> Optional[CachedJSON]:
+        full_key = self._full_key(key)
+        entry = self.l1.get(full_key)
+        if entry is not None:
+            return entry
+        if self.backend is None:
+            return None
+        self._ensure_listener()
+        try:
+            found = await self.backend.get(full_key)
+        except Exception as e:
+            logger.error(f"L2 cache get failed for {full_key}: {e}")
+            return None
+        if found is None:
+            return None
+        raw, expires_at = found
+        entry = CachedJSON(json_loads(raw), raw).precompress()
+        self.l1.set(full_key, entry, min(expires_at, time.time() + self.l1_max_ttl))
+        return entry
+
+    async def set(self, key: str, value: Any, ttl: float) -> CachedJSON:
+        full_key = self._full_key(key)
+        entry = CachedJSON(value).precompress()
+        self.l1.set(full_key, entry, time.time() + min(ttl, self.l1_max_ttl))
+        if self.backend is None:
+            return entry
+        self._ensure_listener()
+        try:
+            await self.backend.set(full_key, entry.body, ttl)
+        except Exception as e:
+            logger.error(f"L2 cache set failed for {full_key}: {e}")
+        return entry
+
+    async def invalidate(self, key: str):
+        """
+        Удаляет ключ во всех воркерах. Ключ, оканчивающийся на '*', трактуется как префикс.
+        """
+        full_key = self._full_key(key)
+        self._on_invalidation(full_key)
+        if self.backend is None:
+            return
+        try:
+            await self.backend.delete(full_key)
+            await self.backend.publish_invalidation(full_key)
+        except Exception as e:
+            logger.error(f"L2 cache invalidation failed for {full_key}: {e}")
+
+    async def get_or_load(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Any:
+        """
+        Возвращает значение из кэша или загружает его через loader.
+        None от loader не кэшируется; исключения loader пробрасываются вызывающему.
+        """
+        entry = await self.get_or_load_entry(key, loader, ttl)
+        return entry.data if entry is not None else None
+
+    async def get_or_load_entry(
+        self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float
+    ) -> Optional[CachedJSON]:
+        """То же, что get_or_load, но возвращает запись кэша вместе с готовым JSON-телом."""
+        entry = await self.get_entry(key)
+        if entry is not None:
+            return entry
+
+        # Объединяем одновременные запросы одного ключа внутри процесса
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                if not inflight.cancelled():
+                    raise
+                # Загружавшая корутина была отменена — пробуем загрузить сами
+                return await self.get_or_load_entry(key, loader, ttl)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            entry = await self._load_with_lock(key, loader, ttl)
+            future.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Исключение будет получено ожидающими; не даем asyncio ругаться на неполученное
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _load_and_set(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Optional[CachedJSON]:
+        value = await loader()
+        if value is None:
+            return None
+        return await self.set(key, value, ttl)
+
+    async def _load_with_lock(self, key: str, loader: Callable[[], Awaitable[Any]], ttl: float) -> Optional[CachedJSON]:
+        if self.backend is None:
+            return await self._load_and_set(key, loader, ttl)
+
+        full_key = self._full_key(key)
+        try:
+            locked = await self.backend.acquire_lock(full_key, self._owner_id, self.lock_ttl)
+        except Exception as e:
+            logger.error(f"L2 cache lock failed for {full_key}: {e}")
+            locked = True  # Без блокировки просто загружаем сами
+
+        if not locked:
+            # Ключ обновляет другой воркер: ждем появления значения в L2
+            deadline = time.monotonic() + self.lock_wait
+            while time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+                entry = await self.get_entry(key)
+                if entry is not None:
+                    return entry
+            logger.warning(f"Timed out waiting for another worker to fill cache key {full_key}. Loading directly.")
+
+        try:
+            return await self._load_and_set(key, loader, ttl)
+        finally:
+            if locked:
+                try:
+                    await self.backend.release_lock(full_key, self._owner_id)
+                except Exception as e:
+                    logger.error(f"L2 cache unlock failed for {full_key}: {e}")
+
+    async def close(self):
+        if self._listener_task and not self._listener_task.done():
+            self._listener_task.cancel()
+            try:
+                await self._listener_task
+            except asyncio.CancelledError:
+                pass
+        self.l1.clear()
+        if self.backend is not None:
+            await self.backend.close()
+
+
+def build_cache(key_prefix: Optional[str] = None, l1_max_items: Optional[int] = None) -> TieredCache:
+    """Создает TieredCache с бэкендом второго уровня согласно настройкам."""
+    backend: Optional[CacheBackend] = None
+    backend_name = settings.CACHE_BACKEND.lower()
+    try:
+        if backend_name == "sqlite":
+            backend = SQLiteCacheBackend(
+                settings.CACHE_SQLITE_PATH,
+                poll_interval=settings.CACHE_INVALIDATION_POLL_INTERVAL,
+            )
+        elif backend_name == "redis":
+            backend = RedisCacheBackend(settings.CACHE_REDIS_URL, key_prefix=settings.CACHE_KEY_PREFIX)
+        elif backend_name != "memory":
+            logger.warning(f"Unknown CACHE_BACKEND '{settings.CACHE_BACKEND}'. Using in-process cache only.")
+    except (CacheBackendError, sqlite3.Error) as e:
+        logger.error(f"Failed to initialize '{backend_name}' cache backend: {e}. Using in-process cache only.")
+        backend = None
+
+    return TieredCache(
+        backend=backend,
+        key_prefix=key_prefix or settings.CACHE_KEY_PREFIX,
+        l1_max_items=l1_max_items or settings.CACHE_L1_MAX_ITEMS,
+        l1_max_ttl=settings.CACHE_L1_MAX_TTL,
+        lock_ttl=settings.CACHE_LOCK_TTL,
+        lock_wait=settings.CACHE_LOCK_WAIT,
+    )
@@ -0,0 +1,138 @@
+# backend/app/services/catalog_snapshot.py
+"""
+Снимок каталога на диске: компактный индекс товаров, категории и полные JSON товаров.
+
+Формат файла (версия SNAPSHOT_FORMAT_VERSION):
+    MAGIC (8 байт) | версия формата (uint16) | длина заголовка (uint32) | заголовок | блобы товаров
+
+Заголовок — сжатый zlib JSON с компактными товарами, категориями и таблицей смещений.
+Блобы — полные JSON товаров, каждый сжат zlib отдельно. Файл читается через mmap:
+при загрузке разбирается только заголовок, конкретный товар распаковывается по запросу.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from app.utils.fast_json import dumps as json_dumps, loads as json_loads
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"WCCATSN\x00"
+SNAPSHOT_FORMAT_VERSION = 1
+_PREFIX = struct.Struct("<HI")
+
+
+class CatalogSnapshotError(Exception):
+    """Файл снимка отсутствует, поврежден или в неподдерживаемом формате."""
+    pass
+
+
+def write_snapshot(path: str, compact_products: List[Dict], raw_products: Dict[int, Dict], categories: List[Dict]):
+    """
+    Атомарно записывает снимок: во временный файл рядом, затем os.replace.
+    Читатели старого файла (через mmap) продолжают работать со своей копией.
+    """
+    blobs = []
+    offsets = []
+    position = 0
+    for product in compact_products:
+        raw = raw_products.get(product["id"])
+        if raw is None:
+            continue
+        blob = zlib.compress(json_dumps(raw), 6)
+        offsets.append([product["id"], position, len(blob)])
+        blobs.append(blob)
+        position += len(blob)
+
+    header = zlib.compress(json_dumps({
+        "created_at": time.time(),
+        "products": compact_products,
+        "categories": categories,
+        "offsets": offsets,
+    }), 6)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(_PREFIX.pack(SNAPSHOT_FORMAT_VERSION, len(header)))
+            f.write(header)
+            for blob in blobs:
+                f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class CatalogSnapshot:
+    """Открытый снимок каталога (только чтение)."""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as e: # Пустой файл
+            self._file.close()
+            raise CatalogSnapshotError(f"Snapshot {path} is empty") from e
+
+        try:
+            if self._mm[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise CatalogSnapshotError(f"{path} is not a catalog snapshot")
+            prefix_end = len(SNAPSHOT_MAGIC) + _PREFIX.size
+            version, header_len = _PREFIX.unpack(self._mm[len(SNAPSHOT_MAGIC):prefix_end])
+            if version != SNAPSHOT_FORMAT_VERSION:
+                raise CatalogSnapshotError(f"Unsupported snapshot format version {version}")
+            header = json_loads(zlib.decompress(self._mm[prefix_end:prefix_end + header_len]))
+        except CatalogSnapshotError:
+            self.close()
+            raise
+        except Exception as e:
+            self.close()
+            raise CatalogSnapshotError(f"Snapshot {path} is corrupted: {e}") from e
+
+        self._blobs_start = prefix_end + header_len
+        self.created_at: float = header["created_at"]
+        self.products: List[Dict] = header["products"]
+        self.categories: List[Dict] = header["categories"]
+        self._offsets: Dict[int, tuple] = {pid: (offset, length) for pid, offset, length in header["offsets"]}
+
+    def get_product_body(self, product_id: int) -> Optional[bytes]:
+        """Полный JSON товара (bytes) или None, если товара нет в снимке."""
+        location = self._offsets.get(product_id)
+        if location is None:
+            return None
+        offset, length = location
+        start = self._blobs_start + offset
+        return zlib.decompress(self._mm[start:start + length])
+
+    def close(self):
+        if not self._mm.closed:
+            self._mm.close()
+        self._file.close()
+
+
+def open_snapshot(path: str) -> Optional[CatalogSnapshot]:
+    """Открывает снимок, если он есть. Поврежденный снимок логируется и игнорируется."""
+    if not os.path.exists(path):
+        return None
+    started = time.perf_counter()
+    try:
+        snapshot = CatalogSnapshot(path)
+    except (OSError, CatalogSnapshotError) as e:
+        logger.warning(f"Cannot open catalog snapshot {path}: {e}")
+        return None
+    age = time.time() - snapshot.created_at
+    logger.info(
+        f"Catalog snapshot loaded: {len(snapshot.products)} products, {len(snapshot.categories)} categories "
+        f"in {time.perf_counter() - started:.3f}s (age {age / 60:.0f} min)."
+    )
+    return snapshot
@@ -0,0 +1,354 @@
+# backend/app/services/facets.py
+"""
+Фасетный фильтр каталога поверх индекса товаров.
+
+Каждое значение фасета (категория, значение атрибута, наличие, скидка, ценовой диапазон)
+хранится битовой маской в виде int: бит i установлен, если товар с позицией i обладает значением.
+Позиции назначаются в порядке возрастания цены, поэтому любой диапазон цен — это непрерывный
+отрезок битов, и фильтр по цене строится одной маской без перебора товаров.
+
+Комбинация фильтров — AND масок (внутри одного фасета — OR выбранных значений),
+количество товаров — popcount. Счетчики фасета считаются без учета фильтра по самому фасету,
+чтобы покупатель видел, сколько товаров добавит выбор соседнего значения.
+"""
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.services.product_index import ProductIndex, normalize_text, price_value
+
+logger = logging.getLogger(__name__)
+
+
+def _bits(positions: Iterable[int]) -> int:
+    mask = 0
+    for position in positions:
+        mask |= 1 << position
+    return mask
+
+
+def _range_mask(start: int, end: int) -> int:
+    """Маска битов [start, end)."""
+    if end <= start:
+        return 0
+    return ((1 << (end - start)) - 1) << start
+
+
+def _positions(mask: int) -> List[int]:
+    """Номера установленных битов по возрастанию."""
+    if not mask:
+        return []
+    # Перевернутая двоичная строка: символ i соответствует биту i
+    return [i for i, bit in enumerate(bin(mask)[:1:-1]) if bit == "1"]
+
+
+def _parse_price_buckets(value: str) -> List[float]:
+    edges = []
+    for part in value.split(","):
+        part = part.strip()
+        if part:
+            try:
+                edges.append(float(part))
+            except ValueError:
+                logger.warning(f"Ignoring invalid FACET_PRICE_BUCKETS edge: {part!r}")
+    return sorted(set(edges))
+
+
+class FacetFilter:
+    """Выбранные покупателем фильтры."""
+    def __init__(
+        self,
+        categories: Optional[List[int]] = None,
+        attributes: Optional[Dict[str, List[str]]] = None,
+        in_stock: Optional[bool] = None,
+        on_sale: Optional[bool] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        search: Optional[str] = None,
+    ):
+        self.categories = categories or []
+        self.attributes = {slug: values for slug, values in (attributes or {}).items() if values}
+        self.in_stock = in_stock
+        self.on_sale = on_sale
+        self.min_price = min_price
+        self.max_price = max_price
+        self.search = search
+
+
+class _FacetData:
+    """Неизменяемый набор масок для одной версии индекса товаров (подменяется целиком)."""
+    def __init__(self):
+        self.products: List[Dict] = [] # Товары по позиции (по возрастанию цены)
+        self.position_of: Dict[int, int] = {} # ID товара -> позиция
+        self.prices: List[float] = []
+        self.haystacks: List[str] = []
+        self.all = 0
+        self.in_stock = 0
+        self.on_sale = 0
+        self.categories: Dict[int, int] = {} # ID категории -> маска (с товарами подкатегорий)
+        self.category_names: Dict[int, str] = {}
+        self.attributes: Dict[str, Dict[str, int]] = {} # slug атрибута -> значение -> маска
+        self.attribute_names: Dict[str, str] = {}
+        self.price_buckets: List[Tuple[float, Optional[float], int]] = [] # (от, до, маска)
+
+
+class FacetIndex:
+    """
+    Фасетный индекс, перестраиваемый хуком ProductIndex после каждой загрузки каталога.
+    Ответ на любую комбинацию фильтров — несколько операций над int, без обращения к WooCommerce.
+
+    Позиции товаров упорядочены по цене, поэтому точечное изменение товара (вебхук) может сдвинуть
+    все маски. Вместо правки битов индекс перестраивается целиком через FACET_REBUILD_DELAY
+    после первого изменения: пачка вебхуков дает одну перестройку, а до нее удаленные
+    товары уже не попадают в выдачу.
+    """
+    def __init__(self, product_index: ProductIndex):
+        self.product_index = product_index
+        self.price_edges = _parse_price_buckets(settings.FACET_PRICE_BUCKETS)
+        self._data = _FacetData()
+        # Поколение набора товаров: перестройка по более старым данным не подменяет более новую
+        self._generation_lock = threading.Lock()
+        self._generation = 0
+        self._installed_generation = 0
+        self._rebuild_timer: Optional[asyncio.TimerHandle] = None
+        self._rebuild_tasks: Set[asyncio.Task] = set()
+        product_index.add_rebuild_hook(self.rebuild)
+        product_index.add_update_hook(self.on_product_update)
+
+    def _next_generation(self) -> int:
+        with self._generation_lock:
+            self._generation += 1
+            return self._generation
+
+    def rebuild(self, products: Dict[int, Dict]):
+        """Строит маски для нового набора товаров (вызывается в рабочем потоке)."""
+        self._build(products, self._next_generation())
+
+    def on_product_update(self, product_id: int, product: Optional[Dict]):
+        """Хук точечного изменения товара: планирует перестройку масок (вызывается из цикла событий)."""
+        if self._rebuild_timer is None:
+            self._rebuild_timer = asyncio.get_running_loop().call_later(
+                settings.FACET_REBUILD_DELAY, self._rebuild_after_update,
+            )
+
+    def _rebuild_after_update(self):
+        self._rebuild_timer = None
+        # Копия словаря: индекс товаров продолжает меняться, пока маски строятся в рабочем потоке
+        products = dict(self.product_index.products)
+        task = asyncio.create_task(asyncio.to_thread(self._build, products, self._next_generation()))
+        self._rebuild_tasks.add(task)
+        task.add_done_callback(self._on_rebuild_done)
+
+    def _on_rebuild_done(self, task: asyncio.Task):
+        self._rebuild_tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Facet index rebuild after product update failed: {task.exception()}")
+
+    def _build(self, products: Dict[int, Dict], generation: int):
+        started = time.perf_counter()
+        data = _FacetData()
+        ordered = sorted(products.values(), key=lambda p: (price_value(p), p["id"]))
+        data.products = ordered
+        data.position_of = {product["id"]: position for position, product in enumerate(ordered)}
+        data.prices = [price_value(p) for p in ordered]
+        data.all = _range_mask(0, len(ordered))
+
+        in_stock: List[int] = []
+        on_sale: List[int] = []
+        categories: Dict[int, List[int]] = {}
+        attributes: Dict[str, Dict[str, List[int]]] = {}
+        for position, product in enumerate(ordered):
+            name = normalize_text(product["name"])
+            category_names = " ".join(normalize_text(c.get("name")) for c in product["categories"])
+            data.haystacks.append(f"{name} {normalize_text(product['sku'])} {category_names}")
+            if product.get("stock_status") == "instock":
+                in_stock.append(position)
+            if product["on_sale"]:
+                on_sale.append(position)
+            for category in product["categories"]:
+                if category.get("id") is None:
+                    continue
+                categories.setdefault(category["id"], []).append(position)
+                data.category_names.setdefault(category["id"], category.get("name") or "")
+            for attribute in product.get("attributes") or []:
+                slug = attribute["slug"]
+                data.attribute_names.setdefault(slug, attribute["name"])
+                values = attributes.setdefault(slug, {})
+                for option in attribute["options"]:
+                    values.setdefault(option, []).append(position)
+
+        data.in_stock = _bits(in_stock)
+        data.on_sale = _bits(on_sale)
+        data.categories = {category_id: _bits(positions) for category_id, positions in categories.items()}
+        self._include_subcategories(data)
+        data.attributes = {
+            slug: {value: _bits(positions) for value, positions in values.items()}
+            for slug, values in attributes.items()
+        }
+        bounds = [None] + self.price_edges + [None]
+        for low, high in zip(bounds, bounds[1:]):
+            data.price_buckets.append((low or 0.0, high, self._price_mask(data, low, high, exclusive_high=True)))
+
+        with self._generation_lock:
+            if generation < self._installed_generation:
+                logger.debug(f"Facet index build {generation} skipped: newer build {self._installed_generation} installed.")
+                return
+            self._data = data
+            self._installed_generation = generation
+        logger.info(
+            f"Facet index built: {len(ordered)} products, {len(data.categories)} categories, "
+            f"{len(data.attributes)} attributes in {time.perf_counter() - started:.3f}s."
+        )
+
+    def _include_subcategories(self, data: _FacetData):
+        """Фильтр по категории включает подкатегории, как в WooCommerce."""
+        children: Dict[int, List[int]] = {}
+        for category in self.product_index.categories:
+            if category.get("parent"):
+                children.setdefault(category["parent"], []).append(category["id"])
+            data.category_names.setdefault(category["id"], category.get("name") or "")
+
+        resolved: Dict[int, int] = {}
+
+        def resolve(category_id: int, path: frozenset) -> int:
+            if category_id in resolved:
+                return resolved[category_id]
+            mask = data.categories.get(category_id, 0)
+            for child in children.get(category_id, []):
+                if child not in path: # Защита от циклов в кривых данных
+                    mask |= resolve(child, path | {child})
+            resolved[category_id] = mask
+            return mask
+
+        for category_id in set(data.categories) | set(children):
+            resolve(category_id, frozenset([category_id]))
+        data.categories = {category_id: mask for category_id, mask in resolved.items() if mask}
+
+    @staticmethod
+    def _price_mask(data: _FacetData, low: Optional[float], high: Optional[float], exclusive_high: bool = False) -> int:
+        start = bisect.bisect_left(data.prices, low) if low is not None else 0
+        if high is None:
+            end = len(data.prices)
+        elif exclusive_high:
+            end = bisect.bisect_left(data.prices, high)
+        else:
+            end = bisect.bisect_right(data.prices, high)
+        return _range_mask(start, end)
+
+    def _search_mask(self, data: _FacetData, search: str) -> int:
+        terms = normalize_text(search).split()
+        if not terms:
+            return data.all
+        return _bits(
+            position for position, haystack in enumerate(data.haystacks)
+            if all(term in haystack for term in terms)
+        )
+
+    def query(
+        self,
+        facet_filter: FacetFilter,
+        orderby: str = "popularity",
+        order: str = "desc",
+        limit: int = 20,
+        offset: int = 0,
+    ) -> Dict:
+        """
+        Применяет фильтры и возвращает страницу товаров (компактное представление), общее число
+        найденных товаров и счетчики по всем фасетам.
+        """
+        data = self._data
+        # Маски отдельных фасетов; None — фасет не ограничивает выборку
+        masks: Dict[str, int] = {}
+        if facet_filter.categories:
+            mask = 0
+            for category_id in facet_filter.categories:
+                mask |= data.categories.get(category_id, 0)
+            masks["category"] = mask
+        for slug, values in facet_filter.attributes.items():
+            mask = 0
+            for value in values:
+                mask |= data.attributes.get(slug, {}).get(value, 0)
+            masks[f"attribute:{slug}"] = mask
+        if facet_filter.in_stock is not None:
+            masks["in_stock"] = data.in_stock if facet_filter.in_stock else data.all & ~data.in_stock
+        if facet_filter.on_sale is not None:
+            masks["on_sale"] = data.on_sale if facet_filter.on_sale else data.all & ~data.on_sale
+        if facet_filter.min_price is not None or facet_filter.max_price is not None:
+            masks["price"] = self._price_mask(data, facet_filter.min_price, facet_filter.max_price)
+
+        base = self._search_mask(data, facet_filter.search) if facet_filter.search else data.all
+
+        def combined(exclude: Optional[str] = None) -> int:
+            mask = base
+            for name, facet_mask in masks.items():
+                if name != exclude:
+                    mask &= facet_mask
+            return mask
+
+        result = combined()
+        total = result.bit_count()
+        # Сортировка не нужна: идем по предсортированным ID индекса товаров и берем попавшие в выборку,
+        # пока не наберется страница
+        matched = set(_positions(result)) if total else set()
+        items = []
+        if matched:
+            wanted = offset + limit
+            for product_id in self.product_index.ordered_ids(orderby, order):
+                position = data.position_of.get(product_id)
+                if position is None or position not in matched:
+                    continue
+                # Только товары, опубликованные сейчас: маски могут отставать от вебхуков до перестройки
+                product = self.product_index.products.get(product_id)
+                if product is not None:
+                    items.append(product)
+                    if len(items) >= wanted:
+                        break
+
+        category_scope = combined("category")
+        categories = [
+            {"id": category_id, "name": data.category_names.get(category_id, ""), "count": count}
+            for category_id, mask in data.categories.items()
+            if (count := (mask & category_scope).bit_count())
+        ]
+        categories.sort(key=lambda c: (-c["count"], c["name"].lower()))
+
+        attributes = []
+        for slug, values in data.attributes.items():
+            scope = combined(f"attribute:{slug}")
+            counted = [
+                {"value": value, "count": count}
+                for value, mask in values.items()
+                if (count := (mask & scope).bit_count())
+            ]
+            if counted:
+                counted.sort(key=lambda v: v["value"].lower())
+                attributes.append({"slug": slug, "name": data.attribute_names.get(slug, slug), "values": counted})
+
+        price_scope = combined("price")
+        price_positions = _positions(price_scope)
+        price_buckets = [
+            {"min": low, "max": high, "count": count}
+            for low, high, mask in data.price_buckets
+            if (count := (mask & price_scope).bit_count())
+        ]
+
+        return {
+            "total": total,
+            "items": items[offset:offset + limit],
+            "facets": {
+                "categories": categories,
+                "attributes": attributes,
+                "price": {
+                    # Позиции упорядочены по цене: первая и последняя — границы диапазона
+                    "min": data.prices[price_positions[0]] if price_positions else None,
+                    "max": data.prices[price_positions[-1]] if price_positions else None,
+                    "buckets": price_buckets,
+                },
+                "in_stock": (data.in_stock & combined("in_stock")).bit_count(),
+                "on_sale": (data.on_sale & combined("on_sale")).bit_count(),
+            },
+        }
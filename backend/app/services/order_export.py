@@ -0,0 +1,203 @@
+# backend/app/services/order_export.py
+import asyncio
+import csv
+import io
+import logging
+import os
+import tempfile
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.order_index import get_order_telegram_user_id
+from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FIELDS = "id,number,status,total,currency,date_created,customer_note,line_items,meta_data"
+
+EXPORT_COLUMNS = [
+    "ID заказа", "Номер", "Дата", "Статус", "Сумма", "Валюта",
+    "Telegram ID", "Telegram username", "Имя", "Товары", "Заметка покупателя",
+]
+
+
+class ExportFormatUnavailableError(Exception):
+    """Формат экспорта недоступен (не установлена необязательная зависимость)."""
+    pass
+
+
+class ExportTooLargeError(Exception):
+    """Выгрузка XLSX превысила EXPORT_XLSX_MAX_ROWS (такой объем отдается только в CSV)."""
+    pass
+
+
+def _meta_value(order: Dict, key: str) -> Optional[str]:
+    for meta in order.get("meta_data") or []:
+        if meta.get("key") == key:
+            return meta.get("value")
+    return None
+
+
+def is_mini_app_order(order: Dict) -> bool:
+    """
+    Заказ создан через Telegram Mini App: в нем есть meta _telegram_user_id, которую мы проставляем.
+    Meta _created_via не подходит: WooCommerce считает ее внутренним ключом и не возвращает в meta_data.
+    """
+    return get_order_telegram_user_id(order) is not None
+
+
+def order_to_row(order: Dict) -> List:
+    """Преобразует заказ WooCommerce в строку экспорта (порядок соответствует EXPORT_COLUMNS)."""
+    first_name = _meta_value(order, "_telegram_first_name") or ""
+    last_name = _meta_value(order, "_telegram_last_name") or ""
+    items = "; ".join(
+        f"{item.get('name')} x{item.get('quantity')}" for item in order.get("line_items") or []
+    )
+    return [
+        order.get("id"),
+        order.get("number") or order.get("id"),
+        order.get("date_created"),
+        order.get("status"),
+        order.get("total"),
+        order.get("currency"),
+        _meta_value(order, "_telegram_user_id") or "",
+        _meta_value(order, "_telegram_username") or "",
+        f"{first_name} {last_name}".strip(),
+        items,
+        order.get("customer_note") or "",
+    ]
+
+
+async def iter_mini_app_orders(
+    wc_service: WooCommerceService,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> AsyncIterator[Dict]:
+    """
+    Постранично обходит заказы WooCommerce и отдает заказы из Mini App по одному.
+
+    Одновременно загружается не больше EXPORT_PAGE_CONCURRENCY страниц, страницы отдаются
+    по порядку, поэтому в памяти никогда не лежит больше этого окна.
+    """
+    per_page = settings.EXPORT_PER_PAGE
+    concurrency = max(1, settings.EXPORT_PAGE_CONCURRENCY)
+
+    async def fetch(page: int) -> List[Dict]:
+        orders = await wc_service.get_orders(
+            page=page, per_page=per_page, after=after, before=before,
+            orderby="date", order="asc", _fields=EXPORT_FIELDS,
+        )
+        return orders if isinstance(orders, list) else []
+
+    pending: Deque[asyncio.Task] = deque()
+    next_page = 1
+    try:
+        while True:
+            while len(pending) < concurrency:
+                pending.append(asyncio.create_task(fetch(next_page)))
+                next_page += 1
+            orders = await pending.popleft()
+            for order in orders:
+                if is_mini_app_order(order):
+                    yield order
+            if len(orders) < per_page:
+                break  # Последняя страница: следующие за ней заведомо пустые
+    finally:
+        for task in pending:
+            task.cancel()
+        # Дожидаемся отмененных загрузок и забираем их ошибки ("Task exception was never retrieved")
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def stream_orders_csv(
+    wc_service: WooCommerceService,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> AsyncIterator[bytes]:
+    """
+    Отдает CSV построчно по мере загрузки страниц заказов.
+
+    Первый фрагмент отдается только после загрузки первой страницы: ошибку на ней вызывающий
+    получает исключением до начала ответа и может вернуть ошибку HTTP. Если загрузка прервалась
+    позже, статус ответа изменить уже нельзя, поэтому файл завершается строкой с ошибкой.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    orders = iter_mini_app_orders(wc_service, after=after, before=before)
+    try:
+        first_order = await orders.__anext__()
+    except StopAsyncIteration:
+        first_order = None
+
+    # BOM, чтобы Excel корректно распознал UTF-8
+    writer.writerow(EXPORT_COLUMNS)
+    count = 0
+    if first_order is not None:
+        writer.writerow(order_to_row(first_order))
+        count += 1
+    yield b"\xef\xbb\xbf" + flush()
+    if first_order is None:
+        logger.info("CSV order export finished: 0 orders.")
+        return
+
+    try:
+        async for order in orders:
+            writer.writerow(order_to_row(order))
+            count += 1
+            yield flush()
+    except Exception as e:
+        message = e.message if isinstance(e, WooCommerceServiceError) else "внутренняя ошибка сервера"
+        logger.error(f"CSV order export interrupted after {count} orders: {e}")
+        writer.writerow([f"ОШИБКА: выгрузка прервана ({message}), файл неполный. Выгружено заказов: {count}."])
+        yield flush()
+        return
+    logger.info(f"CSV order export finished: {count} orders.")
+
+
+async def build_orders_xlsx(
+    wc_service: WooCommerceService,
+    after: Optional[str] = None,
+    before: Optional[str] = None,
+) -> str:
+    """
+    Строит XLSX во временном файле и возвращает путь к нему (файл удаляет вызывающий).
+
+    XLSX — zip-архив, поэтому отдавать его до завершения нельзя: потоково отдается только CSV.
+    openpyxl в режиме write_only сбрасывает строки на диск, а число строк ограничено
+    EXPORT_XLSX_MAX_ROWS, чтобы менеджер не ждал первого байта неограниченно долго.
+    """
+    try:
+        from openpyxl import Workbook
+    except ImportError as e:
+        raise ExportFormatUnavailableError("Для экспорта в XLSX необходимо установить пакет 'openpyxl'.") from e
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Заказы")
+    sheet.append(EXPORT_COLUMNS)
+    count = 0
+    async for order in iter_mini_app_orders(wc_service, after=after, before=before):
+        if count >= settings.EXPORT_XLSX_MAX_ROWS:
+            raise ExportTooLargeError(
+                f"В XLSX можно выгрузить не больше {settings.EXPORT_XLSX_MAX_ROWS} заказов. "
+                f"Сократите период или выберите формат CSV."
+            )
+        sheet.append(order_to_row(order))
+        count += 1
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(workbook.save, path)
+    except Exception:
+        os.remove(path)
+        raise
+    logger.info(f"XLSX order export finished: {count} orders.")
+    return path
@@ -0,0 +1,244 @@
+# backend/app/services/order_index.py
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_USER_META_KEY = "_telegram_user_id"
+
+# Поля заказа, которые нужны индексу (ограничиваем ответ WooCommerce через _fields)
+ORDER_SYNC_FIELDS = "id,number,status,total,currency,date_created,date_created_gmt,date_modified_gmt,line_items,meta_data"
+
+
+def get_order_telegram_user_id(order: Dict) -> Optional[int]:
+    """Достает Telegram ID покупателя из meta_data заказа."""
+    for meta in order.get("meta_data") or []:
+        if meta.get("key") == TELEGRAM_USER_META_KEY:
+            try:
+                return int(meta.get("value"))
+            except (TypeError, ValueError):
+                return None
+    return None
+
+
+def summarize_order(order: Dict) -> Dict:
+    """Компактное представление заказа для истории покупателя."""
+    return {
+        "id": order.get("id"),
+        "number": order.get("number") or str(order.get("id")),
+        "status": order.get("status"),
+        "total": order.get("total"),
+        "currency": order.get("currency"),
+        "date_created": order.get("date_created"),
+        "date_created_gmt": order.get("date_created_gmt"),
+        "date_modified_gmt": order.get("date_modified_gmt"),
+        "line_items": [
+            {
+                "product_id": item.get("product_id"),
+                "variation_id": item.get("variation_id") or None,
+                "name": item.get("name"),
+                "quantity": item.get("quantity"),
+                "total": item.get("total"),
+            }
+            for item in order.get("line_items") or []
+        ],
+    }
+
+
+class OrderIndex:
+    """
+    Локальный индекс заказов из Mini App по Telegram ID покупателя (SQLite).
+    Позволяет отвечать на "мои заказы" без поиска по meta в WooCommerce.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS orders ("
+                "id INTEGER PRIMARY KEY, tg_user_id INTEGER NOT NULL, status TEXT, "
+                "date_created_gmt TEXT, date_modified_gmt TEXT, data TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_orders_user ON orders (tg_user_id, date_created_gmt DESC)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+        self._write_hooks: List[Callable[[sqlite3.Connection, Dict, Optional[Dict]], None]] = []
+        self._listeners: List[Callable[[Dict, Optional[Dict]], Awaitable[None]]] = []
+        logger.info(f"Order index initialized at {path}")
+
+    @contextmanager
+    def locked_connection(self) -> Iterator[sqlite3.Connection]:
+        """Соединение с базой индекса под блокировкой (для производных таблиц, например статистики)."""
+        with self._lock:
+            yield self._conn
+
+    def add_write_hook(self, hook: Callable[[sqlite3.Connection, Dict, Optional[Dict]], None]):
+        """
+        Регистрирует синхронный хук, вызываемый внутри транзакции записи заказа
+        с аргументами (соединение, новая сводка, предыдущая сводка или None).
+        Используется для поддержания производных агрегатов в той же базе.
+        """
+        self._write_hooks.append(hook)
+
+    def add_listener(self, listener: Callable[[Dict, Optional[Dict]], Awaitable[None]]):
+        """
+        Регистрирует асинхронный обработчик событий заказа (новый заказ или смена статуса).
+        Благодаря транзакции событие получает только тот воркер, который первым записал изменение.
+        """
+        self._listeners.append(listener)
+
+    def _upsert_sync(self, orders: List[Dict]) -> List[Tuple[Dict, Optional[Dict]]]:
+        prepared = []
+        for order in orders:
+            tg_user_id = get_order_telegram_user_id(order)
+            if tg_user_id is None or not order.get("id"):
+                continue  # Заказ создан не через Mini App
+            summary = summarize_order(order)
+            summary["tg_user_id"] = tg_user_id
+            prepared.append(summary)
+        if not prepared:
+            return []
+
+        events = []
+        with self._lock:
+            # BEGIN IMMEDIATE сериализует запись между процессами: чтение предыдущего статуса
+            # и замена строки атомарны, поэтому событие смены статуса возникает ровно один раз
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for summary in prepared:
+                    row = self._conn.execute("SELECT data FROM orders WHERE id = ?", (summary["id"],)).fetchone()
+                    previous = json.loads(row[0]) if row else None
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO orders (id, tg_user_id, status, date_created_gmt, date_modified_gmt, data) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (
+                            summary["id"], summary["tg_user_id"], summary["status"], summary["date_created_gmt"],
+                            summary["date_modified_gmt"], json.dumps(summary, ensure_ascii=False),
+                        ),
+                    )
+                    for hook in self._write_hooks:
+                        hook(self._conn, summary, previous)
+                    if previous is None or previous.get("status") != summary["status"]:
+                        events.append((summary, previous))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return events
+
+    async def upsert_orders(self, orders: List[Dict]) -> int:
+        """
+        Добавляет или обновляет заказы и уведомляет обработчиков о новых заказах и сменах статуса.
+        Возвращает число событий.
+        """
+        events = await asyncio.to_thread(self._upsert_sync, orders)
+        for summary, previous in events:
+            for listener in self._listeners:
+                try:
+                    await listener(summary, previous)
+                except Exception as e:
+                    logger.exception(f"Order index listener failed for order {summary.get('id')}: {e}")
+        return len(events)
+
+    async def upsert_order(self, order: Dict) -> int:
+        return await self.upsert_orders([order])
+
+    def _get_user_orders_sync(self, tg_user_id: int, limit: int, offset: int) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM orders WHERE tg_user_id = ? ORDER BY date_created_gmt DESC, id DESC LIMIT ? OFFSET ?",
+                (tg_user_id, limit, offset),
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    async def get_user_orders(self, tg_user_id: int, limit: int = 20, offset: int = 0) -> List[Dict]:
+        return await asyncio.to_thread(self._get_user_orders_sync, tg_user_id, limit, offset)
+
+    def get_sync_cursor(self) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM sync_state WHERE key = 'modified_after'").fetchone()
+        return row[0] if row else None
+
+    def set_sync_cursor(self, value: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('modified_after', ?)", (value,)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+        logger.info("Order index closed.")
+
+
+async def sync_orders_once(wc_service: WooCommerceService, order_index: OrderIndex) -> int:
+    """
+    Подтягивает заказы, измененные после сохраненной отметки (modified_after), и обновляет индекс.
+    Возвращает число обработанных заказов.
+    """
+    cursor = order_index.get_sync_cursor()
+    if cursor is None:
+        since = datetime.now(timezone.utc) - timedelta(days=settings.ORDER_INDEX_INITIAL_SYNC_DAYS)
+        cursor = since.strftime("%Y-%m-%dT%H:%M:%S")
+
+    newest = cursor
+    processed = 0
+    page = 1
+    while True:
+        orders = await wc_service.get_orders(
+            page=page,
+            per_page=100,
+            modified_after=cursor,
+            dates_are_gmt=True,
+            orderby="modified",
+            order="asc",
+            _fields=ORDER_SYNC_FIELDS,
+        )
+        if not orders:
+            break
+        await order_index.upsert_orders(orders)
+        processed += len(orders)
+        for order in orders:
+            modified = order.get("date_modified_gmt")
+            if modified and modified > newest:
+                newest = modified
+        if len(orders) < 100:
+            break
+        page += 1
+
+    if newest != cursor:
+        # modified_after строгий, но секунды в WC округляются — берем отметку с запасом в секунду
+        # (повторная обработка заказа безопасна: upsert идемпотентен)
+        newest_dt = datetime.strptime(newest, "%Y-%m-%dT%H:%M:%S") - timedelta(seconds=1)
+        order_index.set_sync_cursor(newest_dt.strftime("%Y-%m-%dT%H:%M:%S"))
+    return processed
+
+
+async def run_order_sync(wc_service: WooCommerceService, order_index: OrderIndex):
+    """Фоновая задача: периодически синхронизирует индекс заказов с WooCommerce."""
+    logger.info(f"Order index sync started (interval {settings.ORDER_SYNC_INTERVAL}s).")
+    while True:
+        try:
+            processed = await sync_orders_once(wc_service, order_index)
+            if processed:
+                logger.info(f"Order index sync: processed {processed} modified orders.")
+        except WooCommerceServiceError as e:
+            logger.warning(f"Order index sync failed: {e.message}")
+        except Exception as e:
+            logger.exception(f"Unexpected error during order index sync: {e}")
+        await asyncio.sleep(settings.ORDER_SYNC_INTERVAL)
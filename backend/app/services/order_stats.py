@@ -0,0 +1,138 @@
+# backend/app/services/order_stats.py
+import asyncio
+import json
+import logging
+import sqlite3
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from app.core.config import settings
+from app.services.order_index import OrderIndex
+
+logger = logging.getLogger(__name__)
+
+# Статусы, заказы в которых не учитываются в выручке
+NON_REVENUE_STATUSES = {"cancelled", "failed", "refunded", "trash"}
+
+
+class OrderStats:
+    """
+    Агрегаты продаж по дням для команд менеджеров (/stats).
+
+    Агрегаты хранятся в той же SQLite-базе, что и индекс заказов, и обновляются
+    инкрементально в транзакции записи каждого заказа: при смене статуса или суммы вклад
+    старой версии заказа вычитается, новой — прибавляется. Команда бота читает несколько строк.
+    """
+    def __init__(self, order_index: OrderIndex, tz_name: Optional[str] = None):
+        self.order_index = order_index
+        self.tz = ZoneInfo(tz_name or settings.STATS_TIMEZONE)
+        with order_index.locked_connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS order_stats_daily ("
+                "day TEXT NOT NULL, currency TEXT NOT NULL, orders INTEGER NOT NULL DEFAULT 0, "
+                "revenue TEXT NOT NULL DEFAULT '0', PRIMARY KEY (day, currency))"
+            )
+        order_index.add_write_hook(self._apply)
+        self._rebuild_if_empty()
+
+    def _contribution(self, summary: Optional[Dict]) -> Optional[Tuple[str, str, Decimal]]:
+        """Вклад заказа в агрегаты: (день в часовом поясе магазина, валюта, выручка)."""
+        if not summary or not summary.get("date_created_gmt"):
+            return None
+        try:
+            created = datetime.fromisoformat(summary["date_created_gmt"]).replace(tzinfo=timezone.utc)
+        except ValueError:
+            return None
+        revenue = Decimal(0)
+        if summary.get("status") not in NON_REVENUE_STATUSES:
+            try:
+                revenue = Decimal(str(summary.get("total") or 0))
+            except InvalidOperation:
+                pass
+        return created.astimezone(self.tz).date().isoformat(), summary.get("currency") or "", revenue
+
+    @staticmethod
+    def _add(conn: sqlite3.Connection, contribution: Tuple[str, str, Decimal], sign: int):
+        day, currency, revenue = contribution
+        row = conn.execute(
+            "SELECT orders, revenue FROM order_stats_daily WHERE day = ? AND currency = ?", (day, currency)
+        ).fetchone()
+        orders, total = (row[0], Decimal(row[1])) if row else (0, Decimal(0))
+        conn.execute(
+            "INSERT OR REPLACE INTO order_stats_daily (day, currency, orders, revenue) VALUES (?, ?, ?, ?)",
+            (day, currency, orders + sign, str(total + sign * revenue)),
+        )
+
+    def _apply(self, conn: sqlite3.Connection, summary: Dict, previous: Optional[Dict]):
+        """Хук индекса заказов: вызывается внутри транзакции записи заказа."""
+        old = self._contribution(previous)
+        new = self._contribution(summary)
+        if old == new:
+            return
+        if old:
+            self._add(conn, old, -1)
+        if new:
+            self._add(conn, new, +1)
+
+    def _rebuild_if_empty(self):
+        """Первичное заполнение агрегатов из уже проиндексированных заказов (один раз)."""
+        with self.order_index.locked_connection() as conn:
+            # Проверка внутри транзакции записи: воркеры с общей базой не заполняют агрегаты дважды
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM order_stats_daily LIMIT 1").fetchone():
+                    conn.execute("ROLLBACK")
+                    return
+                count = 0
+                for (data,) in conn.execute("SELECT data FROM orders").fetchall():
+                    contribution = self._contribution(json.loads(data))
+                    if contribution:
+                        self._add(conn, contribution, +1)
+                        count += 1
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if count:
+            logger.info(f"Order stats rebuilt from {count} indexed orders.")
+
+    def today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    def _get_period_sync(self, start: date, end: date) -> Dict:
+        with self.order_index.locked_connection() as conn:
+            rows = conn.execute(
+                "SELECT currency, orders, revenue FROM order_stats_daily WHERE day >= ? AND day <= ?",
+                (start.isoformat(), end.isoformat()),
+            ).fetchall()
+        orders = 0
+        revenue: Dict[str, Decimal] = {}
+        for currency, count, day_revenue in rows:
+            orders += count
+            revenue[currency] = revenue.get(currency, Decimal(0)) + Decimal(day_revenue)
+        return {"start": start, "end": end, "orders": orders, "revenue": revenue}
+
+    async def get_period(self, days: int) -> Dict:
+        """Статистика за последние days дней, включая сегодняшний."""
+        end = self.today()
+        start = end - timedelta(days=days - 1)
+        return await asyncio.to_thread(self._get_period_sync, start, end)
+
+    def _get_orders_by_status_sync(self, statuses: Sequence[str], limit: int) -> Tuple[int, List[Dict]]:
+        placeholders = ",".join("?" for _ in statuses)
+        with self.order_index.locked_connection() as conn:
+            total = conn.execute(
+                f"SELECT COUNT(*) FROM orders WHERE status IN ({placeholders})", tuple(statuses)
+            ).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT data FROM orders WHERE status IN ({placeholders}) "
+                f"ORDER BY date_created_gmt DESC LIMIT ?",
+                (*statuses, limit),
+            ).fetchall()
+        return total, [json.loads(row[0]) for row in rows]
+
+    async def get_orders_by_status(self, statuses: Sequence[str], limit: int = 20) -> Tuple[int, List[Dict]]:
+        """Возвращает (общее количество, последние limit заказов) в указанных статусах."""
+        return await asyncio.to_thread(self._get_orders_by_status_sync, statuses, limit)
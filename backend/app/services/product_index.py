@@ -0,0 +1,497 @@
+# backend/app/services/product_index.py
+import asyncio
+import bisect
+import logging
+import re
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.catalog_snapshot import CatalogSnapshot, open_snapshot, write_snapshot
+from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
+
+logger = logging.getLogger(__name__)
+
+# Поля товара, которые нужны индексу (ограничиваем ответ WooCommerce через _fields)
+PRODUCT_INDEX_FIELDS = (
+    "id,name,slug,permalink,sku,type,price,regular_price,sale_price,on_sale,stock_status,"
+    "images,categories,total_sales,average_rating,rating_count,date_created,menu_order,featured,attributes"
+)
+
+_NON_WORD_RE = re.compile(r"[^\w]+", re.UNICODE)
+
+
+def normalize_text(text: Optional[str]) -> str:
+    """Приводит текст к виду для поиска: нижний регистр, ё -> е, только буквы и цифры через пробел."""
+    if not text:
+        return ""
+    return _NON_WORD_RE.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+def price_value(product: Dict) -> float:
+    """Цена товара числом (пустая или некорректная цена — 0)."""
+    try:
+        return float(product.get("price") or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Ключи сортировки, совместимые с параметром orderby WooCommerce
+SORT_KEYS: Dict[str, Callable[[Dict], Any]] = {
+    "date": lambda p: p.get("date_created") or "",
+    "id": lambda p: p["id"],
+    "title": lambda p: p["name"].lower(),
+    "price": price_value,
+    "popularity": lambda p: p["total_sales"],
+    "rating": lambda p: p["average_rating"],
+    "menu_order": lambda p: p["menu_order"],
+}
+
+
+class SortedOrders:
+    """
+    Предсортированные списки (значение ключа, ID товара) по каждому ключу SORT_KEYS:
+    для всего каталога (область None) и для каждой категории (область — ID категории).
+
+    Выдача отсортированной страницы — проход по готовому списку (в обратную сторону для desc)
+    до заполнения страницы; изменение одного товара — удаление и вставка через bisect.
+    Все методы синхронные и вызываются из цикла событий, поэтому читатели не видят промежуточного состояния.
+    """
+    def __init__(self):
+        self._lists: Dict[Tuple[Optional[int], str], List[Tuple[Any, int]]] = {}
+
+    @staticmethod
+    def _scopes(product: Dict) -> List[Optional[int]]:
+        return [None] + [c["id"] for c in product["categories"] if c.get("id") is not None]
+
+    @classmethod
+    def build(cls, products: Dict[int, Dict]) -> "SortedOrders":
+        orders = cls()
+        for product in products.values():
+            for scope in cls._scopes(product):
+                for name, key in SORT_KEYS.items():
+                    orders._lists.setdefault((scope, name), []).append((key(product), product["id"]))
+        for entries in orders._lists.values():
+            entries.sort()
+        return orders
+
+    def add(self, product: Dict):
+        for scope in self._scopes(product):
+            for name, key in SORT_KEYS.items():
+                bisect.insort(self._lists.setdefault((scope, name), []), (key(product), product["id"]))
+
+    def remove(self, product: Dict):
+        """Удаляет товар; значения ключей вычисляются по той же (старой) версии товара, что была добавлена."""
+        for scope in self._scopes(product):
+            for name, key in SORT_KEYS.items():
+                entries = self._lists.get((scope, name))
+                if not entries:
+                    continue
+                entry = (key(product), product["id"])
+                position = bisect.bisect_left(entries, entry)
+                if position < len(entries) and entries[position] == entry:
+                    del entries[position]
+
+    def ids(self, orderby: str, descending: bool, scope: Optional[int] = None) -> Iterator[int]:
+        """ID товаров области в порядке сортировки. Неизвестный orderby трактуется как date."""
+        entries = self._lists.get((scope, orderby if orderby in SORT_KEYS else "date"), [])
+        iterable = reversed(entries) if descending else entries
+        return (product_id for _, product_id in iterable)
+
+
+def compact_product(product: Dict) -> Dict:
+    """Компактное представление товара для индекса (без описаний и лишних полей WC)."""
+    images = product.get("images") or []
+    try:
+        total_sales = int(product.get("total_sales") or 0)
+    except (TypeError, ValueError):
+        total_sales = 0
+    try:
+        average_rating = float(product.get("average_rating") or 0)
+    except (TypeError, ValueError):
+        average_rating = 0.0
+    return {
+        "id": product.get("id"),
+        "name": product.get("name") or "",
+        "slug": product.get("slug"),
+        "permalink": product.get("permalink"),
+        "sku": product.get("sku") or "",
+        "type": product.get("type"),
+        "price": product.get("price"),
+        "regular_price": product.get("regular_price"),
+        "sale_price": product.get("sale_price"),
+        "on_sale": bool(product.get("on_sale")),
+        "featured": bool(product.get("featured")),
+        "stock_status": product.get("stock_status"),
+        "image": images[0].get("src") if images else None,
+        "categories": [
+            {"id": c.get("id"), "name": c.get("name"), "slug": c.get("slug")}
+            for c in product.get("categories") or []
+        ],
+        "total_sales": total_sales,
+        "average_rating": average_rating,
+        "rating_count": product.get("rating_count") or 0,
+        "date_created": product.get("date_created"),
+        "menu_order": product.get("menu_order") or 0,
+        # Глобальные атрибуты имеют slug вида pa_color; у локальных атрибутов товара его нет
+        "attributes": [
+            {
+                "slug": a.get("slug") or normalize_text(a.get("name")).replace(" ", "-"),
+                "name": a.get("name") or "",
+                "options": [str(option) for option in a.get("options") or []],
+            }
+            for a in product.get("attributes") or []
+            if a.get("name") or a.get("slug")
+        ],
+    }
+
+
+class ProductIndex:
+    """
+    Индекс опубликованных товаров в памяти процесса.
+
+    Периодически полностью перезагружается из WooCommerce; структуры для поиска строятся
+    заново и подменяются целиком, поэтому чтения не блокируются и не видят промежуточного состояния.
+    Используется там, где нельзя ждать WooCommerce (inline-режим бота, работа каталога при недоступном WC).
+
+    После каждой загрузки сохраняется снимок каталога на диск; при старте индекс сразу
+    поднимается из снимка, не дожидаясь постраничной загрузки из WooCommerce.
+    """
+    def __init__(self, wc_service: WooCommerceService):
+        self.wc_service = wc_service
+        self.products: Dict[int, Dict] = {}
+        self.categories: List[Dict] = []
+        self.version = 0
+        self.loaded_at: Optional[float] = None
+        self.source: Optional[str] = None # "woocommerce" или "snapshot"
+        self.snapshot: Optional[CatalogSnapshot] = None
+        # (-продажи, ID, нормализованное название, строка поиска, товар): естественный порядок кортежей —
+        # по убыванию продаж, поэтому строки обновляются через bisect без пересортировки
+        self._search_rows: List[Tuple[int, int, str, str, Dict]] = []
+        self._haystacks: Dict[int, str] = {}
+        self._orders = SortedOrders()
+        self._category_slugs: Dict[str, int] = {}
+        self._rebuild_hooks: List[Callable[[Dict[int, Dict]], None]] = []
+        self._update_hooks: List[Callable[[int, Optional[Dict]], None]] = []
+        # Изменения из вебхуков, пришедшие во время полной перезагрузки (данные загрузки могут быть старее)
+        self._pending_updates: Dict[int, Optional[Dict]] = {}
+        self._refresh_lock = asyncio.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.loaded_at is not None
+
+    def add_rebuild_hook(self, hook: Callable[[Dict[int, Dict]], None]):
+        """
+        Регистрирует синхронный хук, вызываемый (в рабочем потоке) после каждой перестройки индекса
+        с новым словарем товаров. Используется для предвычисления производных структур.
+        """
+        self._rebuild_hooks.append(hook)
+
+    def add_update_hook(self, hook: Callable[[int, Optional[Dict]], None]):
+        """
+        Регистрирует хук, вызываемый при точечном изменении товара (product_id, товар или None при удалении).
+        Хуки без такого метода обновляются только при следующей полной перезагрузке.
+        """
+        self._update_hooks.append(hook)
+
+    async def _load_all(self) -> List[Dict]:
+        """Загружает все опубликованные товары, держа в полете не больше PRODUCT_INDEX_PAGE_CONCURRENCY страниц."""
+        per_page = 100
+        concurrency = max(1, settings.PRODUCT_INDEX_PAGE_CONCURRENCY)
+        # Для снимка нужны полные карточки товаров, иначе достаточно полей индекса
+        fields = None if settings.CATALOG_SNAPSHOT_ENABLED else PRODUCT_INDEX_FIELDS
+
+        async def fetch(page: int) -> List[Dict]:
+            products = await self.wc_service.get_products_page(
+                page=page, per_page=per_page, status="publish", _fields=fields,
+            )
+            return products if isinstance(products, list) else []
+
+        loaded: List[Dict] = []
+        pending: Deque[asyncio.Task] = deque()
+        next_page = 1
+        try:
+            while True:
+                while len(pending) < concurrency:
+                    pending.append(asyncio.create_task(fetch(next_page)))
+                    next_page += 1
+                products = await pending.popleft()
+                loaded.extend(products)
+                if len(products) < per_page:
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+        return loaded
+
+    async def _load_categories(self) -> List[Dict]:
+        """Загружает все категории (включая пустые: фильтр hide_empty применяется при выдаче)."""
+        categories: List[Dict] = []
+        page = 1
+        while True:
+            batch = await self.wc_service.get_categories(per_page=100, page=page, hide_empty=False)
+            batch = batch if isinstance(batch, list) else []
+            categories.extend(batch)
+            if len(batch) < 100:
+                return categories
+            page += 1
+
+    def _build(self, raw_products: List[Dict]) -> Dict[str, Any]:
+        products = {}
+        for raw in raw_products:
+            if raw.get("id"):
+                product = compact_product(raw)
+                products[product["id"]] = product
+        return self._build_from_compact(products)
+
+    @staticmethod
+    def _search_row(product: Dict) -> Tuple[int, int, str, str, Dict]:
+        name = normalize_text(product["name"])
+        categories = " ".join(normalize_text(c.get("name")) for c in product["categories"])
+        haystack = f"{name} {normalize_text(product['sku'])} {categories}"
+        return -product["total_sales"], product["id"], name, haystack, product
+
+    def _build_from_compact(self, products: Dict[int, Dict]) -> Dict[str, Any]:
+        """
+        Строит структуры индекса (в рабочем потоке) и вызывает хуки перестройки.
+        Подмена выполняется отдельно в _install из цикла событий, чтобы не гоняться с точечными обновлениями.
+        """
+        rows = [self._search_row(product) for product in products.values()]
+        haystacks = {row[1]: row[3] for row in rows}
+        rows.sort(key=lambda row: row[:2])
+        orders = SortedOrders.build(products)
+        category_slugs = {
+            c["slug"]: c["id"] for product in products.values() for c in product["categories"] if c.get("slug")
+        }
+
+        for hook in self._rebuild_hooks:
+            try:
+                hook(products)
+            except Exception as e:
+                logger.exception(f"Product index rebuild hook failed: {e}")
+
+        return {
+            "products": products,
+            "_search_rows": rows,
+            "_haystacks": haystacks,
+            "_orders": orders,
+            "_category_slugs": category_slugs,
+        }
+
+    def _install(self, built: Dict[str, Any]):
+        for name, value in built.items():
+            setattr(self, name, value)
+        self.version += 1
+        self.loaded_at = time.time()
+
+    def upsert_product(self, raw_product: Dict):
+        """
+        Точечно обновляет товар (например, из вебхука WooCommerce): неопубликованный товар удаляется.
+        Сортированные списки правятся через bisect, без полной пересортировки.
+        """
+        product_id = raw_product.get("id")
+        if not product_id:
+            return
+        product = compact_product(raw_product) if raw_product.get("status", "publish") == "publish" else None
+        if self._refresh_lock.locked():
+            self._pending_updates[product_id] = product
+        self._apply_update(product_id, product)
+
+    def remove_product(self, product_id: int):
+        if self._refresh_lock.locked():
+            self._pending_updates[product_id] = None
+        self._apply_update(product_id, None)
+
+    def _apply_update(self, product_id: int, product: Optional[Dict]):
+        # Структуры меняются на месте: все читатели синхронны и работают в том же цикле событий
+        previous = self.products.get(product_id)
+        if previous is None and product is None:
+            return
+        rows = self._search_rows
+        if previous is not None:
+            self._orders.remove(previous)
+            position = bisect.bisect_left(rows, (-previous["total_sales"], product_id), key=lambda row: row[:2])
+            if position < len(rows) and rows[position][1] == product_id:
+                del rows[position]
+            del self.products[product_id]
+            self._haystacks.pop(product_id, None)
+        if product is not None:
+            row = self._search_row(product)
+            bisect.insort(rows, row, key=lambda row: row[:2])
+            self.products[product_id] = product
+            self._haystacks[product_id] = row[3]
+            self._orders.add(product)
+            for c in product["categories"]:
+                if c.get("slug"):
+                    self._category_slugs.setdefault(c["slug"], c["id"])
+
+        self.version += 1
+        for hook in self._update_hooks:
+            try:
+                hook(product_id, product)
+            except Exception as e:
+                logger.exception(f"Product index update hook failed for product {product_id}: {e}")
+
+    async def refresh(self) -> int:
+        """Полностью перезагружает индекс из WooCommerce. Возвращает число товаров."""
+        async with self._refresh_lock:
+            started = time.perf_counter()
+            self._pending_updates = {}
+            raw_products, categories = await asyncio.gather(self._load_all(), self._load_categories())
+            # Категории нужны хукам перестройки (дерево категорий для фасетов)
+            self.categories = categories
+            self._install(await asyncio.to_thread(self._build, raw_products))
+            # Вебхуки, пришедшие во время загрузки, новее загруженных страниц
+            pending, self._pending_updates = self._pending_updates, {}
+            for product_id, product in pending.items():
+                self._apply_update(product_id, product)
+            self.source = "woocommerce"
+            logger.info(
+                f"Product index loaded: {len(self.products)} products in {time.perf_counter() - started:.2f}s "
+                f"(version {self.version})."
+            )
+            if settings.CATALOG_SNAPSHOT_ENABLED:
+                await self._save_snapshot(raw_products)
+            return len(self.products)
+
+    def load_snapshot(self, snapshot: CatalogSnapshot):
+        """Поднимает индекс из снимка (синхронно; вызывать в рабочем потоке или при старте)."""
+        self.categories = snapshot.categories
+        self._install(self._build_from_compact({product["id"]: product for product in snapshot.products}))
+        self.loaded_at = snapshot.created_at
+        self.source = "snapshot"
+        self.snapshot = snapshot
+
+    async def _save_snapshot(self, raw_products: List[Dict]):
+        path = settings.CATALOG_SNAPSHOT_PATH
+        started = time.perf_counter()
+        try:
+            raw_by_id = {raw["id"]: raw for raw in raw_products if raw.get("id")}
+            await asyncio.to_thread(write_snapshot, path, list(self.products.values()), raw_by_id, self.categories)
+            snapshot = await asyncio.to_thread(open_snapshot, path)
+        except Exception as e:
+            logger.exception(f"Failed to save catalog snapshot to {path}: {e}")
+            return
+        previous, self.snapshot = self.snapshot, snapshot
+        if previous is not None:
+            previous.close()
+        logger.info(f"Catalog snapshot saved to {path} in {time.perf_counter() - started:.2f}s.")
+
+    def close(self):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def ordered_ids(self, orderby: str = "date", order: str = "desc", category_id: Optional[int] = None) -> Iterator[int]:
+        """ID товаров (всех или одной категории) в заданном порядке из предсортированных списков."""
+        return self._orders.ids(orderby, descending=(order != "asc"), scope=category_id)
+
+    def query(
+        self,
+        category: Optional[str] = None,
+        search: Optional[str] = None,
+        featured: Optional[bool] = None,
+        on_sale: Optional[bool] = None,
+        orderby: str = "date",
+        order: str = "desc",
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> List[Dict]:
+        """
+        Выборка товаров с фильтрами и сортировкой, совместимыми с параметрами списка товаров WooCommerce.
+        Неизвестный orderby трактуется как date. Товары перебираются в уже отсортированном порядке,
+        поэтому при заданном limit перебор останавливается, как только набрана страница.
+        """
+        category_id = None
+        if category:
+            category_id = int(category) if category.isdigit() else self._category_slugs.get(category)
+            if category_id is None:
+                return []
+        terms = normalize_text(search).split() if search else []
+        products = self.products
+        haystacks = self._haystacks
+        wanted = offset + limit if limit is not None else None
+        result = []
+        for product_id in self.ordered_ids(orderby, order, category_id):
+            product = products[product_id]
+            if featured is not None and product.get("featured") != featured:
+                continue
+            if on_sale is not None and product["on_sale"] != on_sale:
+                continue
+            if terms and not all(term in haystacks[product_id] for term in terms):
+                continue
+            result.append(product)
+            if wanted is not None and len(result) >= wanted:
+                break
+        return result[offset:]
+
+    def get_product_body(self, product_id: int) -> Optional[bytes]:
+        """Полная карточка товара (JSON) из снимка или None."""
+        if self.snapshot is None or product_id not in self.products:
+            return None
+        return self.snapshot.get_product_body(product_id)
+
+    def render_products(self, products: List[Dict]) -> Optional[bytes]:
+        """JSON-массив полных карточек товаров из снимка; None, если снимка нет."""
+        if self.snapshot is None:
+            return None
+        bodies = [self.snapshot.get_product_body(product["id"]) for product in products]
+        return b"[" + b",".join(body for body in bodies if body is not None) + b"]"
+
+    def query_categories(self, parent: Optional[int] = None, hide_empty: bool = True) -> List[Dict]:
+        """Категории с фильтрами, как у списка категорий WooCommerce (сортировка по имени)."""
+        categories = [
+            c for c in self.categories
+            if (parent is None or c.get("parent") == parent) and (not hide_empty or (c.get("count") or 0) > 0)
+        ]
+        return sorted(categories, key=lambda c: (c.get("name") or "").lower())
+
+    def get(self, product_id: int) -> Optional[Dict]:
+        return self.products.get(product_id)
+
+    def matches_terms(self, product_id: int, terms: List[str]) -> bool:
+        """Все ли (нормализованные) слова встречаются в названии, артикуле или категориях товара."""
+        haystack = self._haystacks.get(product_id)
+        return haystack is not None and all(term in haystack for term in terms)
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """
+        Ищет товары, у которых каждое слово запроса встречается в названии, артикуле или категориях.
+        Сначала товары, название которых начинается с первого слова, затем — где с него начинается
+        любое слово названия; внутри групп — по убыванию продаж. Пустой запрос — самые продаваемые.
+        """
+        terms = normalize_text(query).split()
+        if not terms:
+            return [row[4] for row in self._search_rows[offset:offset + limit]]
+
+        first = terms[0]
+        first_word_start = " " + first
+        matches = []
+        for neg_sales, product_id, name, haystack, product in self._search_rows:
+            if all(term in haystack for term in terms):
+                if name.startswith(first):
+                    rank = 0
+                elif first_word_start in name:
+                    rank = 1
+                else:
+                    rank = 2
+                matches.append((rank, neg_sales, product_id, product))
+        matches.sort(key=lambda match: match[:3])
+        return [match[3] for match in matches[offset:offset + limit]]
+
+
+async def run_product_index_refresh(product_index: ProductIndex):
+    """Фоновая задача: загружает индекс товаров при старте и периодически обновляет его."""
+    logger.info(f"Product index refresh started (interval {settings.PRODUCT_INDEX_REFRESH_INTERVAL}s).")
+    while True:
+        try:
+            await product_index.refresh()
+        except WooCommerceServiceError as e:
+            logger.warning(f"Product index refresh failed: {e.message}")
+        except Exception as e:
+            logger.exception(f"Unexpected error during product index refresh: {e}")
+        # Пока индекс пуст, повторяем попытку чаще
+        interval = settings.PRODUCT_INDEX_REFRESH_INTERVAL if product_index.ready else settings.PRODUCT_INDEX_RETRY_INTERVAL
+        await asyncio.sleep(interval)
@@ -0,0 +1,130 @@
+# backend/app/services/recommendations.py
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from itertools import permutations
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.order_index import OrderIndex
+
+logger = logging.getLogger(__name__)
+
+# Отмененные и возвращенные заказы не считаются совместной покупкой
+NON_PURCHASE_STATUSES = {"cancelled", "failed", "refunded", "trash"}
+
+
+class CoPurchaseIndex:
+    """
+    Рекомендации "с этим покупают" по совместным покупкам.
+
+    Счетчики пар (товар, товар) хранятся в той же SQLite-базе, что и индекс заказов,
+    и обновляются инкрементально в транзакции записи каждого заказа (так же, как статистика продаж):
+    при смене состава или отмене заказа вклад старой версии вычитается, новой — прибавляется.
+    Топ связанных товаров кэшируется в процессе на RECOMMENDATIONS_CACHE_TTL секунд.
+    """
+    def __init__(self, order_index: OrderIndex):
+        self.order_index = order_index
+        self._cache: Dict[int, Tuple[float, List[Tuple[int, int]]]] = {}
+        # Кэш читается в цикле событий, а сбрасывается хуком записи в рабочем потоке
+        self._cache_lock = threading.Lock()
+        with order_index.locked_connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS co_purchases ("
+                "product_id INTEGER NOT NULL, related_id INTEGER NOT NULL, count INTEGER NOT NULL, "
+                "PRIMARY KEY (product_id, related_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_co_purchases_top ON co_purchases (product_id, count DESC)")
+            conn.execute("CREATE TABLE IF NOT EXISTS co_purchases_state (key TEXT PRIMARY KEY, value TEXT)")
+        order_index.add_write_hook(self._apply)
+        self._rebuild_if_needed()
+
+    @staticmethod
+    def _basket(summary: Optional[Dict]) -> FrozenSet[int]:
+        """Набор товаров заказа, учитываемый в совместных покупках."""
+        if not summary or summary.get("status") in NON_PURCHASE_STATUSES:
+            return frozenset()
+        products = frozenset(
+            item["product_id"] for item in summary.get("line_items") or [] if item.get("product_id")
+        )
+        # Очень большие заказы (оптовые) дают квадратичное число пар и мало говорят о связях товаров
+        if len(products) < 2 or len(products) > settings.RECOMMENDATIONS_MAX_ORDER_ITEMS:
+            return frozenset()
+        return products
+
+    @staticmethod
+    def _add(conn: sqlite3.Connection, basket: FrozenSet[int], sign: int):
+        pairs = list(permutations(basket, 2))
+        conn.executemany(
+            "INSERT INTO co_purchases (product_id, related_id, count) VALUES (?, ?, ?) "
+            "ON CONFLICT (product_id, related_id) DO UPDATE SET count = count + excluded.count",
+            [(product_id, related_id, sign) for product_id, related_id in pairs],
+        )
+        if sign < 0:
+            conn.executemany(
+                "DELETE FROM co_purchases WHERE product_id = ? AND related_id = ? AND count <= 0", pairs
+            )
+
+    def _apply(self, conn: sqlite3.Connection, summary: Dict, previous: Optional[Dict]):
+        """Хук индекса заказов: вызывается внутри транзакции записи заказа."""
+        old = self._basket(previous)
+        new = self._basket(summary)
+        if old == new:
+            return
+        if old:
+            self._add(conn, old, -1)
+        if new:
+            self._add(conn, new, +1)
+        with self._cache_lock:
+            for product_id in old | new:
+                self._cache.pop(product_id, None)
+
+    def _rebuild_if_needed(self):
+        """Первичное заполнение счетчиков из уже проиндексированных заказов (один раз)."""
+        with self.order_index.locked_connection() as conn:
+            # Флаг проверяется внутри транзакции записи: воркеры с общей базой не удваивают счетчики
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if conn.execute("SELECT 1 FROM co_purchases_state WHERE key = 'built'").fetchone():
+                    conn.execute("ROLLBACK")
+                    return
+                count = 0
+                for (data,) in conn.execute("SELECT data FROM orders").fetchall():
+                    basket = self._basket(json.loads(data))
+                    if basket:
+                        self._add(conn, basket, +1)
+                        count += 1
+                conn.execute("INSERT OR REPLACE INTO co_purchases_state (key, value) VALUES ('built', '1')")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if count:
+            logger.info(f"Co-purchase index built from {count} indexed orders.")
+
+    def _get_related_sync(self, product_id: int, limit: int) -> List[Tuple[int, int]]:
+        with self.order_index.locked_connection() as conn:
+            return conn.execute(
+                "SELECT related_id, count FROM co_purchases WHERE product_id = ? "
+                "ORDER BY count DESC, related_id LIMIT ?",
+                (product_id, limit),
+            ).fetchall()
+
+    async def get_related(self, product_id: int) -> List[Tuple[int, int]]:
+        """
+        До RECOMMENDATIONS_MAX_RELATED пар (ID товара, число совместных покупок) по убыванию.
+        Из других воркеров изменения видны после истечения кэша.
+        """
+        with self._cache_lock:
+            cached = self._cache.get(product_id)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        related = await asyncio.to_thread(self._get_related_sync, product_id, settings.RECOMMENDATIONS_MAX_RELATED)
+        with self._cache_lock:
+            self._cache[product_id] = (time.monotonic() + settings.RECOMMENDATIONS_CACHE_TTL, related)
+            if len(self._cache) > settings.RECOMMENDATIONS_CACHE_MAX_ITEMS:
+                self._cache.pop(next(iter(self._cache))) # Вытесняем самую старую запись
+        return related
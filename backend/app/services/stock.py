@@ -0,0 +1,125 @@
+# backend/app/services/stock.py
+import asyncio
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.woocommerce import WooCommerceService
+
+logger = logging.getLogger(__name__)
+
+# WooCommerce отдает не больше 100 записей на страницу
+WC_MAX_PER_PAGE = 100
+
+
+class StockCache:
+    """
+    Короткоживущий кэш остатков (stock_status / stock_quantity) по товарам и их вариациям.
+
+    Хранится отдельно от кэша карточек товаров: остатки меняются намного чаще контента,
+    поэтому у них свой короткий TTL, а обновление идет пакетно облегченными запросами (_fields).
+    """
+    def __init__(self, wc_service: WooCommerceService, ttl: Optional[float] = None):
+        self.wc_service = wc_service
+        self.ttl = ttl if ttl is not None else settings.STOCK_CACHE_TTL
+        self._entries: Dict[int, Tuple[float, Dict]] = {}
+        # Незавершенные загрузки по ID товара, чтобы параллельные опросы не дублировали запросы
+        self._inflight: Dict[int, asyncio.Future] = {}
+
+    def _get_fresh(self, product_id: int) -> Optional[Dict]:
+        entry = self._entries.get(product_id)
+        if entry is None:
+            return None
+        fetched_at, data = entry
+        if time.monotonic() - fetched_at > self.ttl:
+            return None
+        return data
+
+    def invalidate(self, product_ids: Iterable[int]):
+        """Сбрасывает остатки указанных товаров (например, после оформления заказа)."""
+        for product_id in product_ids:
+            self._entries.pop(product_id, None)
+
+    async def get_stock(self, product_ids: List[int]) -> Dict[int, Dict]:
+        """
+        Возвращает остатки для списка товаров. Отсутствующие в WooCommerce товары не попадают в результат.
+        """
+        result: Dict[int, Dict] = {}
+        waiting: Dict[int, asyncio.Future] = {}
+        missing: List[int] = []
+
+        for product_id in dict.fromkeys(product_ids):
+            data = self._get_fresh(product_id)
+            if data is not None:
+                result[product_id] = data
+            elif product_id in self._inflight:
+                waiting[product_id] = self._inflight[product_id]
+            else:
+                missing.append(product_id)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {product_id: loop.create_future() for product_id in missing}
+            self._inflight.update(futures)
+            try:
+                fetched = await self._fetch(missing)
+                now = time.monotonic()
+                for product_id in missing:
+                    data = fetched.get(product_id)
+                    if data is not None:
+                        self._entries[product_id] = (now, data)
+                        result[product_id] = data
+                    futures[product_id].set_result(data)
+            except BaseException as e:
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(e)
+                        future.exception()  # Ошибку получит сам вызывающий
+                raise
+            finally:
+                for product_id in missing:
+                    self._inflight.pop(product_id, None)
+
+        for product_id, future in waiting.items():
+            data = await asyncio.shield(future)
+            if data is not None:
+                result[product_id] = data
+
+        return result
+
+    async def _fetch(self, product_ids: List[int]) -> Dict[int, Dict]:
+        """Загружает остатки товаров пачками по 100, затем вариации вариативных товаров."""
+        chunks = [product_ids[i:i + WC_MAX_PER_PAGE] for i in range(0, len(product_ids), WC_MAX_PER_PAGE)]
+        responses = await asyncio.gather(*(self.wc_service.get_stock_levels(chunk) for chunk in chunks))
+
+        fetched: Dict[int, Dict] = {}
+        variable_ids: List[int] = []
+        for products in responses:
+            for product in products or []:
+                product_id = product.get("id")
+                if not product_id:
+                    continue
+                fetched[product_id] = {
+                    "stock_status": product.get("stock_status"),
+                    "stock_quantity": product.get("stock_quantity"),
+                }
+                if product.get("type") == "variable" and product.get("variations"):
+                    variable_ids.append(product_id)
+
+        if variable_ids:
+            variations_list = await asyncio.gather(
+                *(self.wc_service.get_variation_stock_levels(product_id) for product_id in variable_ids)
+            )
+            for product_id, variations in zip(variable_ids, variations_list):
+                fetched[product_id]["variations"] = {
+                    variation["id"]: {
+                        "stock_status": variation.get("stock_status"),
+                        "stock_quantity": variation.get("stock_quantity"),
+                    }
+                    for variation in variations or []
+                    if variation.get("id")
+                }
+
+        logger.debug(f"Refreshed stock for {len(fetched)}/{len(product_ids)} products ({len(variable_ids)} variable).")
+        return fetched
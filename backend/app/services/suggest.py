@@ -0,0 +1,163 @@
+# backend/app/services/suggest.py
+"""
+Автодополнение поиска по каталогу (поиск по мере ввода).
+
+Индекс — отсортированный список различных слов из названий, артикулов и категорий; для каждого слова
+хранится список товаров, заранее упорядоченный по рангу: поле (название выше артикула и категории),
+затем популярность. Слова с заданным префиксом лежат в списке подряд (находятся через bisect),
+их списки товаров лениво сливаются heapq.merge, и перебор останавливается, как только набраны подсказки.
+Топ для коротких префиксов (1-2 символа, самые широкие диапазоны) запоминается до следующего изменения каталога.
+"""
+import bisect
+import heapq
+import logging
+import time
+from itertools import chain
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from app.services.product_index import ProductIndex, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Ранги полей: чем меньше, тем выше в подсказках
+FIELD_NAME = 0
+FIELD_SKU = 1
+FIELD_CATEGORY = 2
+
+_MEMO_PREFIX_LENGTH = 2
+_MEMO_SIZE = 20 # Сколько товаров запоминать для короткого префикса (не меньше максимального limit)
+
+# Элемент списка товаров слова: (ранг поля, -продажи, ID товара)
+Posting = Tuple[int, int, int]
+
+
+def _product_postings(product: Dict) -> List[Tuple[str, Posting]]:
+    tokens: Dict[str, int] = {}
+    for word in normalize_text(product["name"]).split():
+        tokens[word] = FIELD_NAME
+    sku = normalize_text(product["sku"])
+    if sku:
+        # Артикул целиком (без пробелов) и по частям: "AB-12" находится и по "ab12", и по "12"
+        for word in [sku.replace(" ", "")] + sku.split():
+            tokens.setdefault(word, FIELD_SKU)
+    for category in product["categories"]:
+        for word in normalize_text(category.get("name")).split():
+            tokens.setdefault(word, FIELD_CATEGORY)
+    return [(word, (field, -product["total_sales"], product["id"])) for word, field in tokens.items()]
+
+
+class SuggestIndex:
+    """Индекс префиксов для /products/suggest, перестраиваемый и обновляемый хуками ProductIndex."""
+    def __init__(self, product_index: ProductIndex):
+        self.product_index = product_index
+        self._words: List[str] = []
+        self._postings: Dict[str, List[Posting]] = {}
+        self._by_product: Dict[int, List[Tuple[str, Posting]]] = {} # Для точечного удаления товара
+        self._memo: Dict[str, List[int]] = {}
+        product_index.add_rebuild_hook(self.rebuild)
+        product_index.add_update_hook(self.update)
+
+    def rebuild(self, products: Dict[int, Dict]):
+        started = time.perf_counter()
+        by_product = {product_id: _product_postings(product) for product_id, product in products.items()}
+        postings: Dict[str, List[Posting]] = {}
+        for product_postings in by_product.values():
+            for word, posting in product_postings:
+                postings.setdefault(word, []).append(posting)
+        for word_postings in postings.values():
+            word_postings.sort()
+        self._words, self._postings, self._by_product, self._memo = sorted(postings), postings, by_product, {}
+        logger.info(f"Suggest index built: {len(postings)} words in {time.perf_counter() - started:.3f}s.")
+
+    def update(self, product_id: int, product: Optional[Dict]):
+        """Точечное обновление: записи товара удаляются и вставляются заново через bisect."""
+        for word, posting in self._by_product.pop(product_id, []):
+            word_postings = self._postings.get(word, [])
+            position = bisect.bisect_left(word_postings, posting)
+            if position < len(word_postings) and word_postings[position] == posting:
+                del word_postings[position]
+            if not word_postings:
+                self._postings.pop(word, None)
+                position = bisect.bisect_left(self._words, word)
+                if position < len(self._words) and self._words[position] == word:
+                    del self._words[position]
+        if product is not None:
+            product_postings = _product_postings(product)
+            for word, posting in product_postings:
+                if word not in self._postings:
+                    self._postings[word] = []
+                    bisect.insort(self._words, word)
+                bisect.insort(self._postings[word], posting)
+            self._by_product[product_id] = product_postings
+        self._memo = {}
+
+    def _ranked(self, prefix: str) -> Iterator[int]:
+        """ID товаров со словом на prefix в порядке ранга, без повторов."""
+        words = self._words
+        lists = []
+        position = bisect.bisect_left(words, prefix)
+        while position < len(words) and words[position].startswith(prefix):
+            lists.append(self._postings[words[position]])
+            position += 1
+        seen = set()
+        for _, _, product_id in heapq.merge(*lists):
+            if product_id not in seen:
+                seen.add(product_id)
+                yield product_id
+
+    def suggest_products(self, query: str, limit: int = 8) -> List[Dict]:
+        """
+        Товары, у которых последнее слово запроса — начало какого-либо слова, а остальные слова
+        встречаются в названии, артикуле или категориях (как в обычном поиске).
+        """
+        terms = normalize_text(query).split()
+        if not terms:
+            return []
+        *complete, prefix = terms
+        products = self.product_index.products
+
+        if not complete and len(prefix) <= _MEMO_PREFIX_LENGTH and limit <= _MEMO_SIZE:
+            top = self._memo.get(prefix)
+            if top is None:
+                top = []
+                for product_id in self._ranked(prefix):
+                    top.append(product_id)
+                    if len(top) >= _MEMO_SIZE:
+                        break
+                self._memo[prefix] = top
+            return [products[product_id] for product_id in top[:limit] if product_id in products]
+
+        found = []
+        seen = set()
+        # Запрос из нескольких слов может быть артикулом ("AB-12" -> "ab 12"): сначала слитное написание
+        candidates = (
+            (product_id, True) for product_id in self._ranked("".join(terms))
+        ) if complete else iter(())
+        for product_id, is_joined in chain(candidates, ((product_id, False) for product_id in self._ranked(prefix))):
+            if product_id in seen:
+                continue
+            if complete and not is_joined and not self.product_index.matches_terms(product_id, complete):
+                continue
+            product = products.get(product_id)
+            if product is not None:
+                seen.add(product_id)
+                found.append(product)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def suggest_categories(self, query: str, limit: int = 3) -> List[Dict]:
+        """Категории, в названии которых есть все слова запроса (последнее — как префикс); по числу товаров."""
+        terms = normalize_text(query).split()
+        if not terms:
+            return []
+        *complete, prefix = terms
+        found = []
+        for category in self.product_index.categories:
+            if not category.get("count"):
+                continue
+            words = normalize_text(category.get("name")).split()
+            if any(word.startswith(prefix) for word in words) and all(term in words for term in complete):
+                found.append(category)
+        found.sort(key=lambda c: -(c.get("count") or 0))
+        return [{"id": c["id"], "name": c.get("name"), "count": c.get("count")} for c in found[:limit]]
@@ -1,14 +1,23 @@
 # backend/app/services/telegram.py
+import asyncio
 import logging
-from typing import List, Dict, Optional, Any
+import time
+from collections import deque
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import Deque, List, Dict, Optional, Any, Tuple
 from aiogram import Bot
 from aiogram.utils.markdown import hbold, hitalic, hlink, hcode
-from aiogram.exceptions import TelegramAPIError
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
 
 from app.core.config import settings
+from app.utils.rate_limit import TokenBucket
 
 logger = logging.getLogger(__name__)
 
+TELEGRAM_MESSAGE_LIMIT = 4096 # Максимальная длина текста сообщения
+DIGEST_ITEMS_SHOWN = 3 # Сколько позиций заказа показывать в строке дайджеста
+
 class TelegramNotificationError(Exception):
     """Custom exception for notification errors."""
     pass
@@ -17,19 +26,104 @@ class TelegramService:
     """
     Сервис для отправки уведомлений и взаимодействия с Telegram Bot API.
     """
-    def __init__(self, bot: Bot):
+    def __init__(self, bot: Bot, manager_ids: Optional[List[int]] = None, store_url: Optional[str] = None):
+        """manager_ids и store_url задаются для дополнительных магазинов; по умолчанию берутся из настроек."""
         if not isinstance(bot, Bot):
              raise ValueError("TelegramService requires an initialized aiogram.Bot instance.")
         self.bot = bot
-        self.manager_ids = settings.TELEGRAM_MANAGER_IDS
+        self.manager_ids = manager_ids if manager_ids is not None else settings.TELEGRAM_MANAGER_IDS
+        self.store_url = (store_url or settings.WOOCOMMERCE_URL).rstrip('/')
 
         if not self.manager_ids:
              logger.warning("Telegram Manager IDs are not configured. Notifications will not be sent.")
 
+        # Очередь фоновой отправки с ограничением скорости (глобально и на чат)
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.TELEGRAM_SEND_QUEUE_SIZE)
+        self.global_bucket = TokenBucket(rate=settings.TELEGRAM_GLOBAL_RATE_LIMIT)
+        self._chat_last_sent: Dict[int, float] = {}
+        self._worker_task: Optional[asyncio.Task] = None
+
+        # Дайджест заказов для менеджеров: время недавних заказов и заказы, ожидающие отправки сводкой
+        self._recent_orders: Deque[float] = deque()
+        self._digest_pending: List[Tuple[Dict, Dict]] = []
+        self._digest_timer: Optional[asyncio.Task] = None
+
+    # --- Фоновая очередь отправки ---
+
+    def start(self):
+        """Запускает фоновую отправку сообщений из очереди."""
+        if self._worker_task is None or self._worker_task.done():
+            self._worker_task = asyncio.create_task(self._send_worker())
+
+    async def close(self):
+        """
+        Останавливает фоновую отправку (неотправленные сообщения теряются).
+        Накопленный дайджест заказов отправляется сразу, не дожидаясь конца окна.
+        """
+        if self._digest_timer is not None:
+            self._digest_timer.cancel()
+            self._digest_timer = None
+        if self._digest_pending:
+            await self._send_orders_digest(self._take_digest())
+        if self._worker_task and not self._worker_task.done():
+            self._worker_task.cancel()
+            try:
+                await self._worker_task
+            except asyncio.CancelledError:
+                pass
+        if not self._queue.empty():
+            logger.warning(f"{self._queue.qsize()} queued Telegram messages were not sent before shutdown.")
+
+    def enqueue_message(self, user_id: int, text: str, **kwargs) -> bool:
+        """
+        Ставит сообщение в очередь фоновой отправки. Не ждет отправки.
+        Возвращает False, если очередь переполнена.
+        """
+        try:
+            self._queue.put_nowait((user_id, text, kwargs))
+            return True
+        except asyncio.QueueFull:
+            logger.error(f"Telegram send queue is full. Message to user {user_id} dropped.")
+            return False
+
+    async def _send_worker(self):
+        """Забирает сообщения из очереди пачками и отправляет их параллельно в рамках лимитов."""
+        while True:
+            batch: List[Tuple[int, str, Dict]] = [await self._queue.get()]
+            while len(batch) < settings.TELEGRAM_SEND_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await asyncio.gather(*(self._send_rate_limited(*item) for item in batch))
+            except Exception as e:
+                logger.exception(f"Unexpected error in Telegram send worker: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send_rate_limited(self, user_id: int, text: str, kwargs: Dict) -> bool:
+        # Telegram ограничивает ~1 сообщение в секунду в один чат
+        now = time.monotonic()
+        last_sent = self._chat_last_sent.get(user_id, 0.0)
+        self._chat_last_sent[user_id] = max(now, last_sent + settings.TELEGRAM_PER_CHAT_INTERVAL)
+        if last_sent + settings.TELEGRAM_PER_CHAT_INTERVAL > now:
+            await asyncio.sleep(last_sent + settings.TELEGRAM_PER_CHAT_INTERVAL - now)
+        if len(self._chat_last_sent) > 10000:
+            cutoff = time.monotonic() - settings.TELEGRAM_PER_CHAT_INTERVAL
+            self._chat_last_sent = {k: v for k, v in self._chat_last_sent.items() if v > cutoff}
+
+        await self.global_bucket.acquire()
+        return await self._send_message_safe(user_id, text, **kwargs)
+
     async def _send_message_safe(self, user_id: int, text: str, **kwargs):
         """Безопасная отправка сообщения с обработкой ошибок."""
         try:
-            await self.bot.send_message(user_id, text, **kwargs)
+            try:
+                await self.bot.send_message(user_id, text, **kwargs)
+            except TelegramRetryAfter as e:
+                # Флуд-контроль Telegram: ждем указанное время и повторяем один раз
+                logger.warning(f"Flood limit hit sending to user {user_id}. Retrying in {e.retry_after}s.")
+                await asyncio.sleep(e.retry_after)
+                await self.bot.send_message(user_id, text, **kwargs)
             logger.debug(f"Message sent successfully to user {user_id}")
             return True
         except TelegramAPIError as e:
@@ -41,6 +135,22 @@ class TelegramService:
             logger.exception(f"Unexpected error sending message to user {user_id}: {e}")
             return False
 
+    @staticmethod
+    def _format_customer(user_info: Dict) -> str:
+        """Ссылка на покупателя в Telegram (имя и @username)."""
+        tg_user_id = user_info.get('id')
+        tg_username = user_info.get('username')
+        tg_first_name = user_info.get('first_name', '')
+        tg_last_name = user_info.get('last_name', '')
+        user_link = f"tg://user?id={tg_user_id}"
+        user_mention = hlink(f"{tg_first_name} {tg_last_name}".strip() or f"User {tg_user_id}", user_link)
+        if tg_username:
+            user_mention += f" (@{tg_username})"
+        return user_mention
+
+    def _order_admin_url(self, order_id: Any) -> str:
+        return f"{self.store_url}/wp-admin/post.php?post={order_id}&action=edit"
+
     def _format_order_notification(self, order_details: Dict, user_info: Dict) -> str:
         """Форматирует текст уведомления о новом заказе для менеджера."""
         order_id = order_details.get('id', 'N/A')
@@ -61,14 +171,7 @@ class TelegramService:
 
 
         # Информация о покупателе
-        tg_user_id = user_info.get('id')
-        tg_username = user_info.get('username')
-        tg_first_name = user_info.get('first_name', '')
-        tg_last_name = user_info.get('last_name', '')
-        user_link = f"tg://user?id={tg_user_id}"
-        user_mention = hlink(f"{tg_first_name} {tg_last_name}".strip() or f"User {tg_user_id}", user_link)
-        if tg_username:
-            user_mention += f" (@{tg_username})"
+        user_mention = self._format_customer(user_info)
 
         # Состав заказа (упрощенно)
         items_str_list = []
@@ -85,8 +188,7 @@ class TelegramService:
         note_str = f"\n\n{hbold('Заметка покупателя:')}\n{hitalic(customer_note)}" if customer_note else ""
 
         # Ссылка на заказ в админке WP (если возможно сформировать)
-        admin_url = f"{settings.WOOCOMMERCE_URL.rstrip('/')}/wp-admin/post.php?post={order_id}&action=edit"
-        admin_link_str = f"\n\n{hlink('Открыть заказ в WP Admin', admin_url)}"
+        admin_link_str = f"\n\n{hlink('Открыть заказ в WP Admin', self._order_admin_url(order_id))}"
 
         # Собираем сообщение
         message = (
@@ -102,11 +204,104 @@ class TelegramService:
         )
         return message
 
+    def _format_orders_digest(self, orders: List[Tuple[Dict, Dict]]) -> List[str]:
+        """
+        Пакетный вариант _format_order_notification: одна строка на заказ и общий итог по валютам.
+        Возвращает список сообщений — длинный дайджест делится по лимиту длины сообщения Telegram.
+        """
+        totals: Dict[str, Decimal] = {}
+        lines = []
+        for order_details, user_info in orders:
+            order_id = order_details.get('id', 'N/A')
+            order_number = order_details.get('number', order_id)
+            order_total = order_details.get('total', 'N/A')
+            currency = order_details.get('currency', '')
+            try:
+                totals[currency] = totals.get(currency, Decimal(0)) + Decimal(str(order_total))
+            except (InvalidOperation, ValueError):
+                pass
+
+            line_items = order_details.get('line_items', [])
+            items = [f"{item.get('name', 'Unknown Item')} × {item.get('quantity', '?')}" for item in line_items[:DIGEST_ITEMS_SHOWN]]
+            if len(line_items) > DIGEST_ITEMS_SHOWN:
+                items.append(f"и еще {len(line_items) - DIGEST_ITEMS_SHOWN}")
+            items_str = hitalic(", ".join(items)) if items else hitalic("Нет данных о товарах")
+
+            lines.append(
+                f"• {hlink(f'№ {order_number}', self._order_admin_url(order_id))} — "
+                f"{hcode(f'{order_total} {currency}'.strip())} — {self._format_customer(user_info)}\n"
+                f"  {items_str}"
+            )
+
+        totals_str = ", ".join(f"{total} {currency}".strip() for currency, total in totals.items())
+        header = f"🎉 {hbold('Новые заказы:')} {len(orders)}"
+        if totals_str:
+            header += f"\n💰 {hbold('Итого:')} {hcode(totals_str)}"
+
+        messages = []
+        current = header + "\n"
+        for line in lines:
+            if len(current) + len(line) + 1 > TELEGRAM_MESSAGE_LIMIT:
+                messages.append(current.rstrip())
+                current = ""
+            current += "\n" + line
+        messages.append(current.rstrip())
+        return messages
+
+    # --- Уведомления менеджеров о новых заказах ---
+
+    def _should_digest(self) -> bool:
+        """Учитывает новый заказ в скользящем окне; True — заказ нужно отложить в дайджест."""
+        if not settings.ORDER_DIGEST_ENABLED:
+            return False
+        now = time.monotonic()
+        recent = self._recent_orders
+        recent.append(now)
+        while recent and recent[0] <= now - settings.ORDER_DIGEST_RATE_WINDOW:
+            recent.popleft()
+        # Пока дайджест копится, новые заказы идут в него же, чтобы не обгонять уже отложенные
+        return bool(self._digest_pending) or len(recent) >= settings.ORDER_DIGEST_THRESHOLD
+
+    def _take_digest(self) -> List[Tuple[Dict, Dict]]:
+        orders, self._digest_pending = self._digest_pending, []
+        return orders
+
+    async def _digest_window(self):
+        """Ждет окончания окна дайджеста и отправляет накопленные заказы."""
+        await asyncio.sleep(settings.ORDER_DIGEST_WINDOW)
+        # Между сбросом таймера и забором заказов нет await: досрочная отправка не может отменить уже начатую
+        self._digest_timer = None
+        await self._send_orders_digest(self._take_digest())
+
+    async def _send_orders_digest(self, orders: List[Tuple[Dict, Dict]]):
+        if not orders:
+            return
+        messages = self._format_orders_digest(orders)
+        logger.info(
+            f"Sending digest of {len(orders)} orders ({len(messages)} messages) to {len(self.manager_ids)} managers..."
+        )
+
+        async def send_to_manager(manager_id: int) -> bool:
+            sent = True
+            for message_text in messages:
+                sent = await self._send_rate_limited(manager_id, message_text, {"disable_web_page_preview": True}) and sent
+            return sent
+
+        results = await asyncio.gather(*(send_to_manager(manager_id) for manager_id in self.manager_ids))
+        success_count = sum(results)
+        if success_count == len(self.manager_ids):
+            logger.info(f"Digest of {len(orders)} orders sent successfully to all managers.")
+        else:
+            logger.warning(f"Digest of {len(orders)} orders sent to {success_count}/{len(self.manager_ids)} managers.")
 
     async def notify_new_order(self, order_details: Dict, user_info: Dict):
         """
         Отправляет уведомление о новом заказе всем менеджерам.
 
+        При обычном потоке заказов каждый заказ уходит отдельным сообщением. Когда за
+        ORDER_DIGEST_RATE_WINDOW приходит ORDER_DIGEST_THRESHOLD заказов и больше, заказы копятся
+        ORDER_DIGEST_WINDOW секунд и уходят одним сводным сообщением каждому менеджеру.
+
         Args:
             order_details: Словарь с данными созданного заказа из WooCommerce.
             user_info: Словарь с данными пользователя из Telegram initData.
@@ -119,6 +314,19 @@ class TelegramService:
              logger.error("Cannot send notification: Missing order_details or user_info.")
              return
 
+        if self._should_digest():
+            self._digest_pending.append((order_details, user_info))
+            logger.info(f"Order {order_details.get('id')} added to managers digest ({len(self._digest_pending)} pending).")
+            if len(self._digest_pending) >= settings.ORDER_DIGEST_MAX_ORDERS:
+                # Дайджест заполнен: отправляем досрочно, не дожидаясь конца окна
+                if self._digest_timer is not None:
+                    self._digest_timer.cancel()
+                    self._digest_timer = None
+                await self._send_orders_digest(self._take_digest())
+            elif self._digest_timer is None:
+                self._digest_timer = asyncio.create_task(self._digest_window())
+            return
+
         message_text = self._format_order_notification(order_details, user_info)
 
         logger.info(f"Sending notification for order {order_details.get('id')} to {len(self.manager_ids)} managers...")
@@ -134,4 +342,47 @@ class TelegramService:
              logger.warning(f"Notification for order {order_details.get('id')} sent to {success_count}/{len(self.manager_ids)} managers.")
         # Можно выбросить исключение, если ни одно уведомление не было отправлено
         # if success_count == 0:
-        #     raise TelegramNotificationError("Failed to send notification to any manager.")
\ No newline at end of file
+        #     raise TelegramNotificationError("Failed to send notification to any manager.")
+
+    # --- Уведомления покупателей о смене статуса заказа ---
+
+    ORDER_STATUS_MESSAGES = {
+        "processing": "✅ Заказ принят в работу.",
+        "completed": "🎉 Заказ выполнен. Спасибо за покупку!",
+        "cancelled": "❌ Заказ отменен. Если это ошибка, свяжитесь с нами.",
+        "refunded": "💸 По заказу оформлен возврат средств.",
+        "on-hold": "⏳ Заказ ожидает подтверждения менеджером.",
+        "failed": "⚠️ Не удалось обработать заказ. Мы свяжемся с вами.",
+    }
+
+    def _format_order_status_notification(self, order_summary: Dict) -> Optional[str]:
+        """Форматирует сообщение покупателю о новом статусе заказа (None — статус не сообщаем)."""
+        status_message = self.ORDER_STATUS_MESSAGES.get(order_summary.get('status'))
+        if not status_message:
+            return None
+        order_number = order_summary.get('number') or order_summary.get('id')
+        total = order_summary.get('total')
+        currency = order_summary.get('currency') or ''
+        message = f"📦 {hbold('Заказ')} № {hcode(order_number)}\n\n{status_message}"
+        if total:
+            message += f"\n\n💰 {hbold('Сумма:')} {hcode(f'{total} {currency}'.strip())}"
+        return message
+
+    async def notify_order_status_change(self, order_summary: Dict, previous_summary: Optional[Dict]):
+        """
+        Обработчик событий индекса заказов: ставит в очередь сообщение покупателю о смене статуса.
+        Для новых заказов (previous_summary is None) ничего не отправляет — покупатель и так видит результат.
+        """
+        if previous_summary is None or not settings.ORDER_STATUS_NOTIFICATIONS_ENABLED:
+            return
+        tg_user_id = order_summary.get('tg_user_id')
+        if not tg_user_id:
+            return
+        message_text = self._format_order_status_notification(order_summary)
+        if message_text is None:
+            return
+        logger.info(
+            f"Queueing status notification for order {order_summary.get('id')} "
+            f"({previous_summary.get('status')} -> {order_summary.get('status')}) to user {tg_user_id}."
+        )
+        self.enqueue_message(tg_user_id, message_text)
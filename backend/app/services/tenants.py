@@ -0,0 +1,183 @@
+# backend/app/services/tenants.py
+"""
+Несколько магазинов WooCommerce в одном процессе.
+
+Основной магазин настраивается как раньше (settings) и обслуживается сервисами из app.state.
+Дополнительные магазины описываются в JSON-файле SHOPS_CONFIG_PATH; запрос относится к магазину
+по заголовку X-Shop-Id (его отправляет Mini App конкретного бота) или по домену (Host).
+
+У каждого магазина свой пул соединений к WooCommerce, свои кэши, лимиты частоты, менеджеры и бот.
+Магазин активируется лениво — при первом запросе — и деактивируется после TENANT_IDLE_TIMEOUT без запросов,
+а число активных магазинов ограничено TENANT_MAX_ACTIVE. Неактивный магазин занимает в памяти только свое описание.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+from aiogram import Bot
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+from pydantic import BaseModel, Field, ValidationError
+
+from app.core.config import settings
+from app.services.cache import build_cache
+from app.services.stock import StockCache
+from app.services.telegram import TelegramService
+from app.services.woocommerce import WooCommerceService
+from app.utils.rate_limit import KeyedRateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class ShopConfig(BaseModel):
+    """Описание дополнительного магазина из SHOPS_CONFIG_PATH."""
+    id: str = Field(..., min_length=1, pattern=r"^[A-Za-z0-9_-]+$")
+    hosts: List[str] = [] # Домены, запросы на которые относятся к магазину
+    woocommerce_url: str
+    woocommerce_key: str
+    woocommerce_secret: str
+    telegram_bot_token: str # Бот магазина: им проверяется initData и отправляются уведомления менеджерам
+    manager_ids: List[int] = []
+
+
+def load_shops(path: str) -> List[ShopConfig]:
+    """Читает список магазинов. Ошибка в файле не дает приложению стартовать с неполным списком магазинов."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    try:
+        shops = [ShopConfig.model_validate(item) for item in raw]
+    except ValidationError as e:
+        raise ValueError(f"Invalid shops config {path}: {e}") from e
+    ids = [shop.id for shop in shops]
+    if len(ids) != len(set(ids)):
+        raise ValueError(f"Invalid shops config {path}: duplicate shop ids.")
+    return shops
+
+
+def _build_woocommerce_service(shop: ShopConfig) -> WooCommerceService:
+    # Свой пул соединений и свой кэш; ключи L2 разделены префиксом магазина
+    cache = build_cache(key_prefix=f"{settings.CACHE_KEY_PREFIX}:{shop.id}", l1_max_items=settings.TENANT_CACHE_L1_MAX_ITEMS)
+    return WooCommerceService(
+        cache=cache,
+        url=shop.woocommerce_url,
+        key=shop.woocommerce_key,
+        secret=shop.woocommerce_secret,
+        max_connections=settings.TENANT_MAX_CONNECTIONS,
+    )
+
+
+class Tenant:
+    """Активный дополнительный магазин: его сервисы, созданные при активации."""
+    def __init__(self, shop: ShopConfig, woocommerce_service: WooCommerceService, rate_limiters: Dict[str, KeyedRateLimiter]):
+        self.shop = shop
+        self.woocommerce_service = woocommerce_service
+        self.stock_cache = StockCache(woocommerce_service)
+        self.rate_limiters = rate_limiters
+        # Сессия бота открывается при первой отправке; polling для дополнительных магазинов не запускается
+        self.bot = Bot(token=shop.telegram_bot_token, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+        self.telegram_service = TelegramService(self.bot, manager_ids=shop.manager_ids, store_url=shop.woocommerce_url)
+        self.telegram_service.start()
+        self.in_flight = 0 # Запросы, которые сейчас используют магазин (такой магазин не деактивируется)
+        self.last_used = time.monotonic()
+
+    async def close(self):
+        await self.telegram_service.close()
+        await self.woocommerce_service.close_client()
+        await self.bot.session.close()
+
+
+class TenantRegistry:
+    """Реестр дополнительных магазинов с ленивой активацией и вытеснением неиспользуемых."""
+    def __init__(self, shops: List[ShopConfig], rate_limiters_factory: Callable[[], Dict[str, KeyedRateLimiter]]):
+        self.shops: Dict[str, ShopConfig] = {shop.id: shop for shop in shops}
+        self._by_host: Dict[str, ShopConfig] = {host.lower(): shop for shop in shops for host in shop.hosts}
+        self._rate_limiters_factory = rate_limiters_factory
+        self._active: "OrderedDict[str, Tenant]" = OrderedDict() # В порядке последнего использования
+        self._activation_lock = asyncio.Lock()
+
+    def resolve(self, shop_id: Optional[str], host: Optional[str]) -> Optional[ShopConfig]:
+        """
+        Магазин запроса: по X-Shop-Id, затем по домену. None — основной магазин.
+        Неизвестный X-Shop-Id — KeyError (запрос не должен молча уйти в основной магазин).
+        """
+        if shop_id:
+            return self.shops[shop_id]
+        if host:
+            return self._by_host.get(host.split(":", 1)[0].lower())
+        return None
+
+    async def acquire(self, shop: ShopConfig) -> Tenant:
+        """Возвращает активный магазин (активируя при необходимости) и отмечает его использование."""
+        tenant = self._active.get(shop.id)
+        if tenant is None:
+            async with self._activation_lock:
+                tenant = self._active.get(shop.id)
+                if tenant is None:
+                    tenant = await self._activate(shop)
+        self._active.move_to_end(shop.id)
+        tenant.in_flight += 1
+        tenant.last_used = time.monotonic()
+        return tenant
+
+    def release(self, tenant: Tenant):
+        tenant.in_flight -= 1
+        tenant.last_used = time.monotonic()
+
+    async def _activate(self, shop: ShopConfig) -> Tenant:
+        started = time.perf_counter()
+        woocommerce_service = await asyncio.to_thread(_build_woocommerce_service, shop)
+        tenant = Tenant(shop, woocommerce_service, self._rate_limiters_factory())
+        self._active[shop.id] = tenant
+        logger.info(f"Shop '{shop.id}' activated in {time.perf_counter() - started:.3f}s ({len(self._active)} active).")
+        await self._evict_over_limit(keep=shop.id)
+        return tenant
+
+    async def _evict_over_limit(self, keep: str):
+        """Деактивирует давно не использованные магазины сверх TENANT_MAX_ACTIVE (только без текущих запросов)."""
+        excess = len(self._active) - settings.TENANT_MAX_ACTIVE
+        if excess <= 0:
+            return
+        idle = [shop_id for shop_id, tenant in self._active.items() if tenant.in_flight == 0 and shop_id != keep]
+        for shop_id in idle[:excess]:
+            await self._deactivate(shop_id, "active shops limit")
+
+    async def _deactivate(self, shop_id: str, reason: str):
+        tenant = self._active.pop(shop_id, None)
+        if tenant is None:
+            return
+        logger.info(f"Shop '{shop_id}' deactivated ({reason}).")
+        try:
+            await tenant.close()
+        except Exception as e:
+            logger.error(f"Error closing shop '{shop_id}': {e}")
+
+    async def close_idle(self) -> int:
+        cutoff = time.monotonic() - settings.TENANT_IDLE_TIMEOUT
+        idle = [shop_id for shop_id, tenant in self._active.items() if tenant.in_flight == 0 and tenant.last_used < cutoff]
+        for shop_id in idle:
+            await self._deactivate(shop_id, "idle")
+        return len(idle)
+
+    async def close(self):
+        for shop_id in list(self._active):
+            await self._deactivate(shop_id, "shutdown")
+
+    def stats(self) -> Dict:
+        return {
+            "shops": len(self.shops),
+            "active": {shop_id: tenant.in_flight for shop_id, tenant in self._active.items()},
+        }
+
+
+async def run_tenant_reaper(registry: TenantRegistry):
+    """Фоновая задача: периодически деактивирует магазины без запросов."""
+    interval = max(1.0, min(60.0, settings.TENANT_IDLE_TIMEOUT / 2))
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await registry.close_idle()
+        except Exception as e:
+            logger.exception(f"Tenant reaper failed: {e}")
@@ -0,0 +1,202 @@
+# backend/app/services/user_registry.py
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Поля профиля Telegram, которые сохраняет реестр
+USER_PROFILE_FIELDS = ("username", "first_name", "last_name", "language_code")
+
+
+class UserRegistry:
+    """
+    Реестр пользователей Telegram (SQLite): кто запускал бота и кто открывал Mini App,
+    с отметками первого и последнего появления. Он же — список получателей рассылок:
+    запускавшие бота, кроме тех, кто его заблокировал.
+
+    record() не обращается к диску: записи копятся в памяти (по одной на пользователя)
+    и сбрасываются в базу пачками фоновой задачей.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS users ("
+                "user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT, language_code TEXT, "
+                "started_bot INTEGER NOT NULL DEFAULT 0, used_mini_app INTEGER NOT NULL DEFAULT 0, "
+                "first_seen REAL NOT NULL, last_seen REAL NOT NULL, blocked INTEGER NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(users)")}
+            if "blocked" not in columns:
+                # База, созданная до переноса получателей рассылок в реестр
+                self._conn.execute("ALTER TABLE users ADD COLUMN blocked INTEGER NOT NULL DEFAULT 0")
+        self._pending: Dict[int, Dict] = {}
+        self._flush_requested = asyncio.Event()
+        self._flusher_task: Optional[asyncio.Task] = None
+        logger.info(f"User registry initialized at {path}")
+
+    def start(self):
+        """Запускает фоновую задачу сброса записей в базу."""
+        if self._flusher_task is None:
+            self._flusher_task = asyncio.create_task(self._flusher())
+
+    def record(self, user: Dict, started_bot: bool = False, used_mini_app: bool = False):
+        """
+        Отмечает появление пользователя. Не блокирует: повторные появления одного пользователя
+        до очередного сброса объединяются в одну запись.
+        """
+        try:
+            user_id = int(user["id"])
+        except (KeyError, TypeError, ValueError):
+            return
+        now = time.time()
+        entry = self._pending.get(user_id)
+        if entry is None:
+            if len(self._pending) >= settings.USER_REGISTRY_MAX_PENDING:
+                logger.warning(f"User registry buffer is full. Dropping update for user {user_id}.")
+                return
+            entry = {"user_id": user_id, "started_bot": 0, "used_mini_app": 0, "first_seen": now}
+            self._pending[user_id] = entry
+        for field in USER_PROFILE_FIELDS:
+            if user.get(field) is not None:
+                entry[field] = user[field]
+        entry["started_bot"] |= int(started_bot)
+        entry["used_mini_app"] |= int(used_mini_app)
+        entry["last_seen"] = now
+        if len(self._pending) >= settings.USER_REGISTRY_BATCH_SIZE:
+            self._flush_requested.set()
+
+    def _write_batch(self, entries: List[Dict]):
+        rows = [
+            (
+                e["user_id"], *(e.get(field) for field in USER_PROFILE_FIELDS),
+                e["started_bot"], e["used_mini_app"], e["first_seen"], e["last_seen"],
+            )
+            for e in entries
+        ]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO users (user_id, username, first_name, last_name, language_code, "
+                    "started_bot, used_mini_app, first_seen, last_seen) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET "
+                    "username = COALESCE(excluded.username, username), "
+                    "first_name = COALESCE(excluded.first_name, first_name), "
+                    "last_name = COALESCE(excluded.last_name, last_name), "
+                    "language_code = COALESCE(excluded.language_code, language_code), "
+                    "started_bot = MAX(started_bot, excluded.started_bot), "
+                    "used_mini_app = MAX(used_mini_app, excluded.used_mini_app), "
+                    "first_seen = MIN(first_seen, excluded.first_seen), "
+                    "last_seen = MAX(last_seen, excluded.last_seen), "
+                    # Повторный /start снимает отметку о блокировке: пользователь снова доступен
+                    "blocked = CASE WHEN excluded.started_bot = 1 THEN 0 ELSE blocked END",
+                    rows,
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    async def flush(self) -> int:
+        """Записывает накопленные изменения в базу. Возвращает число записанных пользователей."""
+        if not self._pending:
+            return 0
+        entries = list(self._pending.values())
+        self._pending = {}
+        try:
+            await asyncio.to_thread(self._write_batch, entries)
+        except Exception as e:
+            logger.error(f"Failed to flush {len(entries)} users to registry: {e}")
+            # Возвращаем записи в буфер, не затирая более свежие данные
+            for entry in entries:
+                self._pending.setdefault(entry["user_id"], entry)
+            return 0
+        return len(entries)
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=settings.USER_REGISTRY_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            written = await self.flush()
+            if written:
+                logger.debug(f"User registry: flushed {written} users.")
+
+    def mark_blocked(self, user_ids: List[int]):
+        """Исключает заблокировавших бота из получателей рассылок."""
+        if not user_ids:
+            return
+        with self._lock:
+            self._conn.executemany("UPDATE users SET blocked = 1 WHERE user_id = ?", [(uid,) for uid in user_ids])
+
+    def count_recipients(self, after_user_id: int = 0) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM users WHERE started_bot = 1 AND blocked = 0 AND user_id > ?", (after_user_id,)
+            ).fetchone()[0]
+
+    def get_recipients_chunk(self, after_user_id: int, limit: int) -> List[int]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id FROM users WHERE started_bot = 1 AND blocked = 0 AND user_id > ? "
+                "ORDER BY user_id LIMIT ?",
+                (after_user_id, limit),
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def import_recipients(self, recipients: List[Tuple[int, float, int]]):
+        """Переносит получателей из прежней таблицы рассылок: (user_id, added_at, blocked)."""
+        if not recipients:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO users (user_id, started_bot, first_seen, last_seen, blocked) VALUES (?, 1, ?, ?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET started_bot = 1, "
+                    "first_seen = MIN(first_seen, excluded.first_seen), blocked = excluded.blocked",
+                    [(user_id, added_at, added_at, blocked) for user_id, added_at, blocked in recipients],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _get_user_sync(self, user_id: int) -> Optional[Dict]:
+        with self._lock:
+            self._conn.row_factory = sqlite3.Row
+            try:
+                row = self._conn.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            finally:
+                self._conn.row_factory = None
+        return dict(row) if row else None
+
+    async def get_user(self, user_id: int) -> Optional[Dict]:
+        return await asyncio.to_thread(self._get_user_sync, user_id)
+
+    async def close(self):
+        """Останавливает фоновую задачу и сбрасывает остаток буфера."""
+        if self._flusher_task and not self._flusher_task.done():
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        with self._lock:
+            self._conn.close()
+        logger.info("User registry closed.")
@@ -0,0 +1,116 @@
+# backend/app/services/warmup.py
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.woocommerce import WooCommerceService, WooCommerceServiceError
+
+logger = logging.getLogger(__name__)
+
+
+class WarmupState:
+    """
+    Прогресс прогрева кэшей после старта. Используется эндпоинтом /ready.
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.status = "pending" if enabled else "disabled"
+        self.total = 0
+        self.completed = 0
+        self.failed = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    @property
+    def ready(self) -> bool:
+        # Ошибки отдельных шагов не держат инстанс вне балансировки: данные догрузятся по запросу
+        return self.status in ("disabled", "done", "timed_out")
+
+    def as_dict(self) -> Dict:
+        duration = None
+        if self.started_at is not None:
+            duration = round((self.finished_at or time.monotonic()) - self.started_at, 3)
+        return {
+            "ready": self.ready,
+            "status": self.status,
+            "total": self.total,
+            "completed": self.completed,
+            "failed": self.failed,
+            "duration_seconds": duration,
+        }
+
+
+async def _run_step(state: WarmupState, semaphore: asyncio.Semaphore, name: str, coro: Awaitable):
+    """Выполняет один шаг прогрева, не пробрасывая ошибки наружу."""
+    async with semaphore:
+        try:
+            result = await coro
+            state.completed += 1
+            return result
+        except WooCommerceServiceError as e:
+            state.failed += 1
+            logger.warning(f"Warm-up step '{name}' failed: {e.message}")
+        except Exception as e:
+            state.failed += 1
+            logger.exception(f"Unexpected error in warm-up step '{name}': {e}")
+        return None
+
+
+async def _warm_catalog(wc_service: WooCommerceService, state: WarmupState):
+    semaphore = asyncio.Semaphore(settings.WARMUP_CONCURRENCY)
+    per_page = settings.WARMUP_PER_PAGE
+
+    # Параметры совпадают с запросами фронтенда, чтобы попасть в те же ключи кэша
+    state.total += 3
+    categories, _, _ = await asyncio.gather(
+        _run_step(state, semaphore, "categories", wc_service.get_categories(hide_empty=True)),
+        _run_step(state, semaphore, "products:first_page", wc_service.get_products(page=1, per_page=per_page)),
+        _run_step(state, semaphore, "products:featured", wc_service.get_products(page=1, per_page=per_page, featured=True)),
+    )
+
+    if not isinstance(categories, list):
+        return
+
+    top_categories: List[Dict] = sorted(
+        (c for c in categories if isinstance(c, dict) and c.get("id")),
+        key=lambda c: c.get("count") or 0,
+        reverse=True,
+    )[:settings.WARMUP_TOP_CATEGORIES]
+
+    steps = []
+    for category in top_categories:
+        for page in range(1, settings.WARMUP_PAGES_PER_CATEGORY + 1):
+            steps.append(_run_step(
+                state, semaphore, f"products:category={category['id']}:page={page}",
+                wc_service.get_products(page=page, per_page=per_page, category=str(category["id"])),
+            ))
+    state.total += len(steps)
+    await asyncio.gather(*steps)
+
+
+async def run_warmup(wc_service: WooCommerceService, state: WarmupState):
+    """
+    Прогревает кэш каталога: категории, первые страницы топовых категорий и избранные товары.
+    Все запросы идут параллельно (с ограничением WARMUP_CONCURRENCY).
+    """
+    if not state.enabled:
+        return
+
+    state.status = "running"
+    state.started_at = time.monotonic()
+    logger.info("Cache warm-up started...")
+    try:
+        await asyncio.wait_for(_warm_catalog(wc_service, state), timeout=settings.WARMUP_TIMEOUT)
+        state.status = "done"
+    except asyncio.TimeoutError:
+        state.status = "timed_out"
+        logger.warning(f"Cache warm-up did not finish in {settings.WARMUP_TIMEOUT}s. Marking instance as ready anyway.")
+    finally:
+        state.finished_at = time.monotonic()
+
+    logger.info(
+        f"Cache warm-up {state.status}: {state.completed}/{state.total} steps completed, "
+        f"{state.failed} failed in {state.finished_at - state.started_at:.2f}s."
+    )
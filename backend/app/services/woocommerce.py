@@ -1,11 +1,20 @@
 # backend/app/services/woocommerce.py
+import asyncio
 import httpx
+import json
 import logging
-from typing import List, Dict, Optional, Any, Union
-from pydantic import BaseModel
+import re
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, Union
+from pydantic import BaseModel, ValidationError
 from app.core.config import settings
-from app.models.product import Product, Category
+from app.models.product import Product, Category, ProductListAdapter, CategoryListAdapter
 from app.models.order import OrderCreateWooCommerce, OrderWooCommerce
+from app.services.cache import CachedJSON, TieredCache, build_cache
+from app.utils.fast_json import dumps as json_dumps, loads as json_loads
+from app.utils.latency import HedgeBudget, LatencyTracker
 
 # Настройка логирования
 logging.basicConfig(level=settings.LOGGING_LEVEL.upper())
@@ -19,24 +28,261 @@ class WooCommerceServiceError(Exception):
         self.details = details
         super().__init__(self.message)
 
+    @property
+    def is_unavailable(self) -> bool:
+        """WooCommerce недоступен (сеть, таймаут, 5xx), а не отклонил запрос."""
+        return self.status_code is None or self.status_code >= 500
+
+# ID в пути запроса (для группировки задержек по типам запросов)
+_ENDPOINT_ID_RE = re.compile(r"/\d+(?=/|$)")
+
+BATCH_REQUEST_META_KEY = "_batch_request_id" # Метка заказа из пакета для поиска после ошибки пакета
+
+
+class OrderBatchWriter:
+    """
+    Микропакетная запись заказов: заказы, пришедшие в пределах max_delay секунд, отправляются
+    одним запросом POST orders/batch (каждый отдельный POST orders платит за загрузку WordPress).
+    Результат и ошибка каждого заказа возвращаются ожидающему его запросу.
+
+    Пакет отправляется, как только набрано max_size заказов или истекло max_delay с первого заказа,
+    поэтому добавленная задержка не превышает max_delay. Одиночный заказ идет обычным POST orders.
+
+    Ограничение: при сетевой ошибке, таймауте или 5xx на весь пакет неизвестно, какие заказы успели
+    создаться, а повторять пакет нельзя (будут дубли). Поэтому каждый заказ пакета помечается
+    meta BATCH_REQUEST_META_KEY, и после такой ошибки созданные заказы ищутся среди последних
+    по этой метке. Ненайденные заказы получают ошибку — но WooCommerce мог создать их позже,
+    уже после поиска. По этой причине пакетная запись по умолчанию выключена.
+    """
+    def __init__(self, service: "WooCommerceService", max_size: int, max_delay: float):
+        self.service = service
+        self.max_size = max(1, max_size)
+        self.max_delay = max_delay
+        self._pending: List[Tuple[Dict, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._writes: Set[asyncio.Task] = set()
+        self.stats = {"orders": 0, "requests": 0}
+
+    async def submit(self, payload: Dict) -> Dict:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((payload, future))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._write(batch))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def close(self):
+        """Отправляет накопленные заказы и дожидается начатых записей."""
+        self._flush()
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    async def _write(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        self.stats["orders"] += len(batch)
+        self.stats["requests"] += 1
+        if len(batch) == 1:
+            await self._write_single(*batch[0])
+            return
+        started_at = datetime.now(timezone.utc)
+        request_ids = []
+        for payload, _ in batch:
+            request_id = uuid.uuid4().hex
+            payload["meta_data"] = [*(payload.get("meta_data") or []), {"key": BATCH_REQUEST_META_KEY, "value": request_id}]
+            request_ids.append(request_id)
+        try:
+            response = await self.service._request("POST", "orders/batch", json_data={"create": [payload for payload, _ in batch]})
+        except WooCommerceServiceError as e:
+            if e.status_code is not None and 400 <= e.status_code < 500:
+                # Пакет отклонен целиком (ни один заказ не создан): создаем заказы по одному
+                logger.warning(f"WooCommerce rejected order batch of {len(batch)} ({e.message}). Creating orders one by one.")
+                self.stats["requests"] += len(batch)
+                await asyncio.gather(*(self._write_single(payload, future) for payload, future in batch))
+                return
+            # Сеть, таймаут или 5xx: часть заказов могла создаться, повторять нельзя (будут дубли)
+            await self._reconcile(batch, request_ids, started_at, e)
+            return
+        except Exception as e:
+            for _, future in batch:
+                _set_future(future, exception=e)
+            return
+
+        results = response.get("create") if isinstance(response, dict) else None
+        if not isinstance(results, list) or len(results) != len(batch):
+            logger.error(f"Unexpected orders/batch response for {len(batch)} orders: {str(response)[:500]}")
+            error = WooCommerceServiceError("Получен некорректный ответ от WooCommerce при пакетном создании заказов", details=response)
+            for _, future in batch:
+                _set_future(future, exception=error)
+            return
+        logger.info(f"Order batch of {len(batch)} written to WooCommerce in one request.")
+        # WooCommerce возвращает результаты в порядке элементов запроса
+        for (_, future), result in zip(batch, results):
+            error = result.get("error") if isinstance(result, dict) else None
+            if error:
+                error_message = error.get("message", "No error message in response")
+                status_code = (error.get("data") or {}).get("status") or 400
+                logger.error(f"WooCommerce API error in order batch: {status_code} {error.get('code')} - {error_message}")
+                _set_future(future, exception=WooCommerceServiceError(
+                    message=f"Ошибка WooCommerce: {error_message}", status_code=status_code, details=error,
+                ))
+            else:
+                _set_future(future, result=result)
+
+    async def _reconcile(
+        self, batch: List[Tuple[Dict, asyncio.Future]], request_ids: List[str], started_at: datetime, error: Exception,
+    ):
+        """После ошибки на весь пакет ищет уже созданные заказы по метке; остальным возвращает ошибку."""
+        created: Dict[str, Dict] = {}
+        wanted = set(request_ids)
+        after = (started_at - timedelta(seconds=60)).strftime("%Y-%m-%dT%H:%M:%S")
+        try:
+            for page in range(1, 4):
+                orders = await self.service.get_orders(
+                    page=page, per_page=100, after=after, dates_are_gmt="true", orderby="date", order="desc",
+                )
+                if not isinstance(orders, list):
+                    break
+                for order in orders:
+                    for meta in order.get("meta_data") or []:
+                        if meta.get("key") == BATCH_REQUEST_META_KEY and meta.get("value") in wanted:
+                            created[meta["value"]] = order
+                if len(orders) < 100 or len(created) == len(wanted):
+                    break
+        except Exception as e:
+            logger.error(f"Failed to look up orders of a failed batch: {e}")
+        logger.warning(
+            f"Order batch of {len(batch)} failed ({error}); {len(created)} orders found created after the failure."
+        )
+        for (_, future), request_id in zip(batch, request_ids):
+            if request_id in created:
+                _set_future(future, result=created[request_id])
+            else:
+                _set_future(future, exception=error)
+
+    async def _write_single(self, payload: Dict, future: asyncio.Future):
+        try:
+            _set_future(future, result=await self.service._request("POST", "orders", json_data=payload))
+        except Exception as e:
+            _set_future(future, exception=e)
+
+
+def _set_future(future: asyncio.Future, result: Any = None, exception: Optional[BaseException] = None):
+    # Ожидающий запрос мог быть отменен (клиент отключился) — тогда результат просто некуда отдать
+    if future.done():
+        return
+    if exception is not None:
+        future.set_exception(exception)
+    else:
+        future.set_result(result)
+
+
+def _retrieve_exception(task: asyncio.Task):
+    # Ошибка завершившейся задачи, которую никто не ждет, считается полученной
+    if not task.cancelled():
+        task.exception()
+
+
 class WooCommerceService:
     """
     Асинхронный сервис для взаимодействия с WooCommerce REST API.
     """
-    def __init__(self):
-        self.base_url = f"{settings.WOOCOMMERCE_URL.rstrip('/')}/wp-json/{settings.WOOCOMMERCE_API_VERSION}"
-        self.auth = (settings.WOOCOMMERCE_KEY, settings.WOOCOMMERCE_SECRET)
+    def __init__(
+        self,
+        cache: Optional[TieredCache] = None,
+        url: Optional[str] = None,
+        key: Optional[str] = None,
+        secret: Optional[str] = None,
+        max_connections: Optional[int] = None,
+    ):
+        """
+        По умолчанию подключается к магазину из настроек; url/key/secret задают другой магазин
+        (см. app.services.tenants), max_connections ограничивает его пул соединений.
+        """
+        self.store_url = (url or settings.WOOCOMMERCE_URL).rstrip('/')
+        self.base_url = f"{self.store_url}/wp-json/{settings.WOOCOMMERCE_API_VERSION}"
+        self.auth = (key or settings.WOOCOMMERCE_KEY, secret or settings.WOOCOMMERCE_SECRET)
         # Используем таймауты для предотвращения зависания запросов
         timeouts = httpx.Timeout(10.0, read=20.0, write=10.0, connect=5.0)
         # Используем AsyncClient для переиспользования соединений
-        self._client = httpx.AsyncClient(base_url=self.base_url, auth=self.auth, timeout=timeouts)
+        client_options = {"limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)} if max_connections else {}
+        self._client = httpx.AsyncClient(base_url=self.base_url, auth=self.auth, timeout=timeouts, **client_options)
+        # Кэш ответов каталога (L1 в процессе + опционально общий L2 между воркерами)
+        self.cache = cache or build_cache()
+        # Задержки GET по типам запросов и бюджет страховочных запросов
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._hedge_budget = HedgeBudget(settings.WOOCOMMERCE_HEDGE_BUDGET_PERCENT / 100)
+        self.hedge_stats = {"fired": 0, "won": 0}
+        # Микропакетная запись заказов через orders/batch
+        self.order_writer = OrderBatchWriter(
+            self, settings.WOOCOMMERCE_ORDER_BATCH_MAX_SIZE, settings.WOOCOMMERCE_ORDER_BATCH_MAX_DELAY,
+        ) if settings.WOOCOMMERCE_ORDER_BATCH_ENABLED else None
         logger.info(f"WooCommerceService initialized for URL: {self.base_url}")
 
     async def close_client(self):
-        """Закрывает httpx клиент."""
+        """Закрывает httpx клиент и кэш (накопленные заказы перед этим отправляются)."""
+        if getattr(self, 'order_writer', None) is not None:
+            await self.order_writer.close()
         if hasattr(self, '_client') and self._client:
             await self._client.aclose()
             logger.info("WooCommerce HTTP client closed.")
+        if hasattr(self, 'cache') and self.cache:
+            await self.cache.close()
+
+    @staticmethod
+    def _cache_key(namespace: str, params: Optional[Dict] = None) -> str:
+        """Формирует стабильный ключ кэша из пространства имен и параметров запроса."""
+        if not params:
+            return namespace
+        return f"{namespace}:{json.dumps(params, sort_keys=True, default=str)}"
+
+    async def _cached_get_entry(
+        self,
+        namespace: str,
+        endpoint: str,
+        params: Optional[Dict],
+        ttl: float,
+        validator: Optional[Callable[[Any], Any]] = None,
+    ) -> Optional[CachedJSON]:
+        """
+        GET-запрос через кэш; возвращает запись кэша с готовым JSON-телом. Ошибки WooCommerce не кэшируются.
+        Ответы отдаются как есть, без валидации по моделям. С WOOCOMMERCE_VALIDATE_RESPONSES
+        (для отладки) ответ при заполнении кэша проверяется validator, и расхождения со схемой логируются.
+        """
+        async def load():
+            data = await self._request("GET", endpoint, params=params)
+            if validator is not None and data is not None and settings.WOOCOMMERCE_VALIDATE_RESPONSES:
+                try:
+                    validator(data)
+                except ValidationError as e:
+                    # Отдаем как есть (как и раньше), но сигнализируем о расхождении схемы
+                    logger.warning(f"WooCommerce response for {endpoint} does not match the model: {e.error_count()} errors.")
+            return data
+
+        return await self.cache.get_or_load_entry(self._cache_key(namespace, params), load, ttl)
+
+    async def _cached_get(
+        self, namespace: str, endpoint: str, params: Optional[Dict], ttl: float,
+        validator: Optional[Callable[[Any], Any]] = None,
+    ) -> Optional[Any]:
+        """GET-запрос через кэш. Ошибки WooCommerce не кэшируются."""
+        entry = await self._cached_get_entry(namespace, endpoint, params, ttl, validator)
+        return entry.data if entry is not None else None
+
+    async def invalidate_product(self, product_id: int):
+        """Сбрасывает кэш карточки товара и всех списков товаров во всех воркерах."""
+        await self.cache.invalidate(self._cache_key(f"product:{product_id}"))
+        await self.cache.invalidate("products:*")
 
     async def _request(
         self,
@@ -59,7 +305,15 @@ class WooCommerceService:
 
         try:
             logger.debug(f"Requesting {method} {endpoint} | Params: {params} | Payload: {payload}")
-            response = await self._client.request(method, endpoint, params=params, json=payload)
+            if payload is not None:
+                response = await self._client.request(
+                    method, endpoint, params=params, content=json_dumps(payload),
+                    headers={"Content-Type": "application/json"},
+                )
+            elif method == "GET" and settings.WOOCOMMERCE_HEDGING_ENABLED:
+                response = await self._hedged_get(endpoint, params)
+            else:
+                response = await self._client.request(method, endpoint, params=params)
 
             # Проверяем статус ответа
             response.raise_for_status() # Выбросит HTTPStatusError для 4xx/5xx
@@ -77,7 +331,7 @@ class WooCommerceService:
                  # raise WooCommerceServiceError("Non-JSON response received", status_code=response.status_code, details=response.text)
                  return response.text # Возвращаем текст как есть
 
-            response_data = response.json()
+            response_data = json_loads(response.content)
             logger.debug(f"Received {response.status_code} response for {method} {endpoint}") # Логируем только статус успеха
 
             return response_data
@@ -117,9 +371,77 @@ class WooCommerceService:
              logger.exception(f"Unexpected error during WooCommerce request to {endpoint}: {e}")
              raise WooCommerceServiceError("Непредвиденная ошибка при работе с WooCommerce API") from e
 
+    # --- Страховочные GET-запросы ---
+
+    def _get_latency_tracker(self, endpoint: str) -> LatencyTracker:
+        # products/123 и products/456 — один тип запроса
+        key = _ENDPOINT_ID_RE.sub("/{id}", "/" + endpoint.strip("/"))
+        tracker = self._latency.get(key)
+        if tracker is None:
+            tracker = LatencyTracker(
+                window=settings.WOOCOMMERCE_HEDGE_WINDOW, percentile=settings.WOOCOMMERCE_HEDGE_PERCENTILE
+            )
+            self._latency[key] = tracker
+        return tracker
+
+    async def _hedged_get(self, endpoint: str, params: Optional[Dict]) -> httpx.Response:
+        """
+        GET с подстраховкой: если ответа нет дольше текущего перцентиля задержки этого типа запроса
+        и бюджет позволяет, отправляется второй запрос; побеждает первый ответ, проигравший отменяется.
+        GET идемпотентен, поэтому дублирование безопасно.
+        """
+        tracker = self._get_latency_tracker(endpoint)
+        self._hedge_budget.on_request()
+        started = time.monotonic()
+        primary = asyncio.create_task(self._client.get(endpoint, params=params))
+
+        def record_primary(task: asyncio.Task):
+            # Учитывается только собственная задержка завершившегося основного запроса: победы страховки
+            # и отмены тянули бы перцентиль вниз, и страховка срабатывала бы все раньше
+            if not task.cancelled():
+                tracker.record(time.monotonic() - started)
+
+        primary.add_done_callback(record_primary)
+        hedge_delay = tracker.value() if len(tracker) >= settings.WOOCOMMERCE_HEDGE_MIN_SAMPLES else None
+        tasks = {primary}
+        started_tasks = [primary]
+        try:
+            if hedge_delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=max(hedge_delay, settings.WOOCOMMERCE_HEDGE_MIN_DELAY))
+                if not done and self._hedge_budget.try_spend():
+                    self.hedge_stats["fired"] += 1
+                    logger.debug(f"Hedging GET {endpoint} after {time.monotonic() - started:.3f}s")
+                    hedge = asyncio.create_task(self._client.get(endpoint, params=params))
+                    tasks.add(hedge)
+                    started_tasks.append(hedge)
+
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedge_stats["won"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Ошибки проигравших запросов забираем, чтобы asyncio не писал "exception was never retrieved"
+            for task in started_tasks:
+                if task.done():
+                    _retrieve_exception(task)
+                else:
+                    task.cancel()
+                    task.add_done_callback(_retrieve_exception)
+
     # --- Методы для получения данных ---
 
-    async def get_products(
+    async def get_products(self, *args, **kwargs) -> Optional[List[Dict]]:
+        """Получает список товаров из WooCommerce (параметры — как у get_products_entry)."""
+        entry = await self.get_products_entry(*args, **kwargs)
+        return entry.data if entry is not None else None
+
+    async def get_products_entry(
         self,
         page: int = 1,
         per_page: int = 10,
@@ -131,8 +453,8 @@ class WooCommerceService:
         orderby: str = 'date',
         order: str = 'desc',
         **kwargs # Дополнительные параметры API WC
-    ) -> Optional[List[Dict]]: # Пока возвращаем Dict для гибкости
-        """Получает список товаров из WooCommerce."""
+    ) -> Optional[CachedJSON]:
+        """Получает список товаров из WooCommerce как запись кэша (данные + готовое JSON-тело)."""
         params = {
             'page': page,
             'per_page': per_page,
@@ -151,14 +473,53 @@ class WooCommerceService:
         logger.info(f"Fetching products with params: {params}")
         # Тут можно обернуть в try/except и вернуть None или пустой список при ошибке,
         # либо пробросить исключение WooCommerceServiceError наверх (в эндпоинт)
-        return await self._request("GET", "products", params=params)
+        return await self._cached_get_entry(
+            "products", "products", params, settings.CACHE_TTL_PRODUCTS, ProductListAdapter.validate_python
+        )
 
     async def get_product(self, product_id: int) -> Optional[Dict]:
         """Получает детальную информацию о товаре по ID."""
+        entry = await self.get_product_entry(product_id)
+        return entry.data if entry is not None else None
+
+    async def get_product_entry(self, product_id: int) -> Optional[CachedJSON]:
+        """Карточка товара как запись кэша (данные + готовое JSON-тело)."""
         logger.info(f"Fetching product with ID: {product_id}")
-        return await self._request("GET", f"products/{product_id}")
+        return await self._cached_get_entry(
+            f"product:{product_id}", f"products/{product_id}", None, settings.CACHE_TTL_PRODUCT, Product.model_validate
+        )
+
+    async def get_stock_levels(self, product_ids: List[int]) -> Optional[List[Dict]]:
+        """
+        Получает только остатки товаров одним запросом (без кэша, ограниченный набор полей).
+        :param product_ids: до 100 ID товаров.
+        """
+        params = {
+            'include': ','.join(str(pid) for pid in product_ids),
+            'per_page': len(product_ids),
+            '_fields': 'id,type,stock_status,stock_quantity,variations',
+        }
+        logger.debug(f"Fetching stock levels for {len(product_ids)} products")
+        return await self._request("GET", "products", params=params)
 
-    async def get_categories(
+    async def get_products_page(self, page: int = 1, per_page: int = 100, **kwargs) -> Optional[List[Dict]]:
+        """Получает страницу товаров без кэша (для полной загрузки каталога). kwargs — параметры API WC."""
+        params = {'page': page, 'per_page': per_page, **kwargs}
+        params = {k: v for k, v in params.items() if v is not None}
+        logger.debug(f"Fetching products page with params: {params}")
+        return await self._request("GET", "products", params=params)
+
+    async def get_variation_stock_levels(self, product_id: int) -> Optional[List[Dict]]:
+        """Получает остатки всех вариаций товара (без кэша, ограниченный набор полей)."""
+        params = {'per_page': 100, '_fields': 'id,stock_status,stock_quantity'}
+        return await self._request("GET", f"products/{product_id}/variations", params=params)
+
+    async def get_categories(self, *args, **kwargs) -> Optional[List[Dict]]:
+        """Получает список категорий товаров (параметры — как у get_categories_entry)."""
+        entry = await self.get_categories_entry(*args, **kwargs)
+        return entry.data if entry is not None else None
+
+    async def get_categories_entry(
         self,
         per_page: int = 100,
         parent: Optional[int] = None,
@@ -166,8 +527,8 @@ class WooCommerceService:
         order: str = 'asc',
         hide_empty: bool = True, # Скрывать пустые категории
         **kwargs
-    ) -> Optional[List[Dict]]:
-        """Получает список категорий товаров."""
+    ) -> Optional[CachedJSON]:
+        """Получает список категорий товаров как запись кэша (данные + готовое JSON-тело)."""
         params = {
             'per_page': per_page,
             'parent': parent,
@@ -178,7 +539,16 @@ class WooCommerceService:
         }
         params = {k: v for k, v in params.items() if v is not None}
         logger.info(f"Fetching categories with params: {params}")
-        return await self._request("GET", "products/categories", params=params)
+        return await self._cached_get_entry(
+            "categories", "products/categories", params, settings.CACHE_TTL_CATEGORIES, CategoryListAdapter.validate_python
+        )
+
+    async def get_orders(self, page: int = 1, per_page: int = 100, **kwargs) -> Optional[List[Dict]]:
+        """Получает страницу заказов (без кэша). kwargs передаются как параметры API WC."""
+        params = {'page': page, 'per_page': per_page, **kwargs}
+        params = {k: v for k, v in params.items() if v is not None}
+        logger.debug(f"Fetching orders with params: {params}")
+        return await self._request("GET", "orders", params=params)
 
     # --- Метод для создания заказа ---
 
@@ -191,8 +561,12 @@ class WooCommerceService:
         logger.info(f"Attempting to create order...")
         # Валидация данных через Pydantic модель уже произошла при ее создании
 
-        # Используем _request для отправки данных, он обработает ошибки
-        created_order_data = await self._request("POST", "orders", json_data=order_data)
+        # Используем _request для отправки данных, он обработает ошибки.
+        # При включенной пакетной записи заказ уходит вместе с соседними в orders/batch
+        if self.order_writer is not None:
+            created_order_data = await self.order_writer.submit(order_data.model_dump(exclude_unset=True, by_alias=True))
+        else:
+            created_order_data = await self._request("POST", "orders", json_data=order_data)
 
         if created_order_data and isinstance(created_order_data, dict):
             order_id = created_order_data.get('id')
@@ -0,0 +1,272 @@
+# backend/app/utils/admission.py
+"""
+Приоритетный допуск запросов к API (admission control).
+
+Все маршруты делят один event loop и один пул соединений к WooCommerce, поэтому при всплеске
+просмотров каталога оформление заказа не должно ждать за сотнями анонимных GET. Запросы делятся
+на классы по убыванию приоритета; одновременно обрабатывается не больше max_concurrent запросов,
+остальные ждут в ограниченных очередях своих классов, и освободившееся место получает
+самый приоритетный ожидающий. Запрос, для которого нет места в очереди или который прождал
+дольше допустимого, сразу получает 503 — это дешевле, чем таймаут после долгого ожидания.
+
+Если приоритетный запрос не уложился в цель по задержке, анонимные запросы и вебхуки на время
+перестают ждать в очереди и получают только часть мест.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict
+
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.config import settings
+from app.utils.fast_json import dumps as json_dumps
+from app.utils.telegram_auth import validate_request_init_data
+
+logger = logging.getLogger(__name__)
+
+CRITICAL = "critical" # Оформление заказа
+AUTHENTICATED = "authenticated" # Запросы с валидной initData
+ANONYMOUS = "anonymous" # Анонимное чтение каталога
+WEBHOOK = "webhook" # Вебхуки WooCommerce: подпись проверяется только в эндпоинте, поэтому приоритета нет
+PRIORITY_ORDER = (CRITICAL, AUTHENTICATED, ANONYMOUS, WEBHOOK)
+# Классы, которые ограничиваются в режиме перегрузки и сами его не включают
+LOW_PRIORITY = (ANONYMOUS, WEBHOOK)
+
+SHED_RETRY_AFTER = 2 # Retry-After (сек) в ответе 503
+
+
+class AdmissionController:
+    """Счетчик занятых мест и очереди ожидания по классам приоритета. Рассчитан на один event loop."""
+    def __init__(
+        self,
+        max_concurrent: int,
+        queue_sizes: Dict[str, int],
+        max_waits: Dict[str, float],
+        latency_target: float,
+        degraded_hold: float,
+        degraded_anonymous_share: float,
+    ):
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_sizes = queue_sizes
+        self.max_waits = max_waits
+        self.latency_target = latency_target
+        self.degraded_hold = degraded_hold
+        self.degraded_anonymous_capacity = max(1, int(self.max_concurrent * degraded_anonymous_share))
+        self.in_flight = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITY_ORDER}
+        self._waiting: Dict[str, int] = {priority: 0 for priority in PRIORITY_ORDER}
+        self._degraded_until = 0.0
+        self.counters: Dict[str, Dict[str, int]] = {
+            priority: {"admitted": 0, "queued": 0, "shed_queue_full": 0, "shed_timeout": 0, "shed_overload": 0, "slow": 0}
+            for priority in PRIORITY_ORDER
+        }
+
+    @classmethod
+    def from_settings(cls) -> "AdmissionController":
+        return cls(
+            max_concurrent=settings.ADMISSION_MAX_CONCURRENT,
+            queue_sizes={
+                CRITICAL: settings.ADMISSION_QUEUE_CRITICAL,
+                AUTHENTICATED: settings.ADMISSION_QUEUE_AUTHENTICATED,
+                ANONYMOUS: settings.ADMISSION_QUEUE_ANONYMOUS,
+                WEBHOOK: settings.ADMISSION_QUEUE_WEBHOOK,
+            },
+            max_waits={
+                CRITICAL: settings.ADMISSION_WAIT_CRITICAL,
+                AUTHENTICATED: settings.ADMISSION_WAIT_AUTHENTICATED,
+                ANONYMOUS: settings.ADMISSION_WAIT_ANONYMOUS,
+                WEBHOOK: settings.ADMISSION_WAIT_WEBHOOK,
+            },
+            latency_target=settings.ADMISSION_LATENCY_TARGET,
+            degraded_hold=settings.ADMISSION_DEGRADED_HOLD,
+            degraded_anonymous_share=settings.ADMISSION_DEGRADED_ANONYMOUS_SHARE,
+        )
+
+    @property
+    def degraded(self) -> bool:
+        """Недавно приоритетный запрос не уложился в цель по задержке."""
+        return time.monotonic() < self._degraded_until
+
+    def _capacity(self, priority: str) -> int:
+        if priority in LOW_PRIORITY and self.degraded:
+            return self.degraded_anonymous_capacity
+        return self.max_concurrent
+
+    def _can_start(self, priority: str) -> bool:
+        if self.in_flight >= self._capacity(priority):
+            return False
+        # Не обгоняем ожидающих того же или более высокого приоритета
+        for other in PRIORITY_ORDER:
+            if self._waiting[other]:
+                return False
+            if other == priority:
+                break
+        return True
+
+    async def acquire(self, priority: str) -> bool:
+        """Занимает место для запроса. False — запрос нужно отклонить (503)."""
+        counters = self.counters[priority]
+        if self._can_start(priority):
+            self.in_flight += 1
+            counters["admitted"] += 1
+            return True
+        if priority in LOW_PRIORITY and self.degraded:
+            counters["shed_overload"] += 1
+            return False
+        if self._waiting[priority] >= self.queue_sizes[priority]:
+            counters["shed_queue_full"] += 1
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(future)
+        self._waiting[priority] += 1
+        counters["queued"] += 1
+        try:
+            await asyncio.wait({future}, timeout=self.max_waits[priority])
+        except asyncio.CancelledError:
+            # Клиент ушел, пока запрос ждал
+            self._abandon(priority, future)
+            raise
+        if future.done():
+            counters["admitted"] += 1
+            return True
+        self._abandon(priority, future)
+        counters["shed_timeout"] += 1
+        return False
+
+    def _abandon(self, priority: str, future: asyncio.Future):
+        if future.done():
+            # Место уже было передано этому запросу: возвращаем его следующему
+            self.release()
+        else:
+            # Отмененное ожидание остается в очереди и пропускается при следующей передаче места
+            future.cancel()
+            self._waiting[priority] -= 1
+
+    def release(self):
+        """Освобождает место и передает его самому приоритетному ожидающему."""
+        self.in_flight -= 1
+        for priority in PRIORITY_ORDER:
+            waiters = self._waiters[priority]
+            while waiters and self.in_flight < self._capacity(priority):
+                future = waiters.popleft()
+                if future.done():
+                    continue
+                self._waiting[priority] -= 1
+                self.in_flight += 1
+                future.set_result(True)
+            if self.in_flight >= self.max_concurrent:
+                return
+
+    def record_latency(self, priority: str, seconds: float):
+        """Учитывает задержку запроса до начала ответа (с ожиданием в очереди)."""
+        if priority not in LOW_PRIORITY and seconds > self.latency_target:
+            self.counters[priority]["slow"] += 1
+            if not self.degraded:
+                logger.warning(
+                    f"{priority} request took {seconds:.2f}s (target {self.latency_target:.2f}s). "
+                    f"Limiting anonymous requests and webhooks for {self.degraded_hold:.0f}s."
+                )
+            self._degraded_until = time.monotonic() + self.degraded_hold
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "degraded": self.degraded,
+            "waiting": dict(self._waiting),
+            "classes": {priority: dict(counters) for priority, counters in self.counters.items()},
+        }
+
+
+class AdmissionMiddleware:
+    """ASGI middleware: классифицирует запросы к API и пропускает их через AdmissionController."""
+    def __init__(self, app: ASGIApp, controller: AdmissionController, path_prefix: str):
+        self.app = app
+        self.controller = controller
+        self.path_prefix = path_prefix
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        # Health check, /ready и документация не ограничиваются
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefix):
+            await self.app(scope, receive, send)
+            return
+
+        priority = self._classify(scope)
+        started = time.monotonic()
+        if not await self.controller.acquire(priority):
+            await self._reject(send)
+            return
+
+        released = False
+
+        def finish():
+            # Место освобождается и задержка учитывается по началу ответа: отдача тела (например,
+            # потоковая выгрузка заказов) не держит место и не включает режим перегрузки
+            nonlocal released
+            if not released:
+                released = True
+                self.controller.release()
+                self.controller.record_latency(priority, time.monotonic() - started)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                finish()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish()
+
+    def _classify(self, scope: Scope) -> str:
+        path = scope["path"].rstrip("/")
+        # Подпись вебхука проверяется только в эндпоинте: до нее запрос не должен обгонять покупателей
+        if path.startswith(f"{self.path_prefix}/webhooks"):
+            return WEBHOOK
+        headers = Headers(scope=scope)
+        if not self._is_authenticated(scope, headers):
+            return ANONYMOUS
+        if scope["method"] == "POST" and path == f"{self.path_prefix}/orders":
+            return CRITICAL
+        return AUTHENTICATED
+
+    @staticmethod
+    def _is_authenticated(scope: Scope, headers: Headers) -> bool:
+        """
+        Приоритет дает только валидная initData: сам заголовок подделать легко, подпись — нельзя.
+        Для дополнительного магазина подпись проверяется токеном его бота. Результат сохраняется
+        в состоянии запроса, и зависимости повторно HMAC не считают.
+        """
+        init_data = headers.get("x-telegram-init-data")
+        if not init_data:
+            return False
+        bot_token = settings.TELEGRAM_BOT_TOKEN
+        app = scope.get("app")
+        tenant_registry = getattr(app.state, "tenant_registry", None) if app is not None else None
+        if tenant_registry is not None:
+            try:
+                shop = tenant_registry.resolve(headers.get("x-shop-id"), headers.get("host"))
+            except KeyError:
+                return False
+            if shop is not None:
+                bot_token = shop.telegram_bot_token
+        is_valid, _ = validate_request_init_data(scope.setdefault("state", {}), init_data=init_data, bot_token=bot_token)
+        return is_valid
+
+    @staticmethod
+    async def _reject(send: Send):
+        body = json_dumps({"detail": "Сервер перегружен. Попробуйте позже."})
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(SHED_RETRY_AFTER).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
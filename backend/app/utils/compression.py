@@ -0,0 +1,108 @@
+# backend/app/utils/compression.py
+"""
+Сжатие ответов заранее: кэшируемые тела сжимаются один раз при заполнении кэша,
+а выбор варианта по Accept-Encoding — просто поиск в словаре готовых тел.
+
+gzip есть всегда; brotli — из пакета brotli (есть в requirements.txt). Если пакет не установлен,
+отдается только gzip, и об этом пишется предупреждение при старте.
+"""
+import gzip
+import logging
+from typing import Dict, Optional
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError: # pragma: no cover - установка без brotli
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+if brotli is None and settings.COMPRESSION_ENABLED:
+    logger.warning("Package 'brotli' is not installed: responses will be compressed with gzip only.")
+
+
+def available_encodings() -> tuple:
+    """Поддерживаемые кодировки в порядке предпочтения (лучшее сжатие первым)."""
+    if not settings.COMPRESSION_ENABLED:
+        return ()
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0: одинаковое тело дает одинаковые байты (удобно для ETag и кэшей прокси)
+        return gzip.compress(body, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def precompress(body: bytes) -> Dict[str, bytes]:
+    """Все доступные сжатые варианты тела; маленькие тела не сжимаются (выигрыш меньше накладных расходов)."""
+    if len(body) < settings.COMPRESSION_MIN_SIZE:
+        return {}
+    variants = {}
+    for encoding in available_encodings():
+        compressed = compress(body, encoding)
+        if len(compressed) < len(body):
+            variants[encoding] = compressed
+    return variants
+
+
+def negotiate(accept_encoding: Optional[str], variants: Dict[str, bytes]) -> Optional[str]:
+    """
+    Выбирает кодировку из готовых вариантов по заголовку Accept-Encoding (с учетом q-значений).
+    При равных q побеждает порядок available_encodings (br лучше gzip). None — отдавать без сжатия.
+    """
+    if not accept_encoding or not variants:
+        return None
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        weights[name] = quality
+    wildcard = weights.get("*", 0.0)
+    best, best_quality = None, 0.0
+    for encoding in available_encodings():
+        if encoding not in variants:
+            continue
+        quality = weights.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class PrecompressedJSONResponse(Response):
+    """
+    JSON-ответ из готового тела и его заранее сжатых вариантов.
+    Vary: Accept-Encoding выставляется всегда, чтобы прокси не отдали сжатый вариант клиенту без поддержки.
+    """
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        request: Request,
+        body: bytes,
+        variants: Optional[Dict[str, bytes]] = None,
+        status_code: int = 200,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        headers = dict(headers or {})
+        headers["Vary"] = "Accept-Encoding"
+        encoding = negotiate(request.headers.get("accept-encoding"), variants or {})
+        if encoding is not None:
+            body = variants[encoding]
+            headers["Content-Encoding"] = encoding
+        super().__init__(content=body, status_code=status_code, headers=headers)
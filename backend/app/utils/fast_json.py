@@ -0,0 +1,47 @@
+# backend/app/utils/fast_json.py
+"""
+Быстрая сериализация JSON: orjson, если установлен, иначе стандартный json.
+Оба варианта отдают/принимают bytes в UTF-8.
+"""
+import json
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError: # pragma: no cover - orjson необязателен
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    # Decimal, datetime и т.п., которые не умеет стандартный json
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSON-ответ, сериализуемый через dumps().
+    Возвращая его из эндпоинта, мы минуем jsonable_encoder FastAPI — рекурсивный обход
+    больших ответов WooCommerce на Python, который и был основной статьей расходов CPU.
+    """
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+class RawJSONResponse(JSONResponse):
+    """Ответ из уже сериализованного JSON (bytes), например тела из кэша."""
+    def render(self, content: bytes) -> bytes:
+        return content
@@ -0,0 +1,55 @@
+# backend/app/utils/latency.py
+from collections import deque
+from typing import Deque, Optional
+
+
+class LatencyTracker:
+    """
+    Скользящее окно последних задержек и их перцентиль.
+    Перцентиль пересчитывается не на каждый замер, а раз в recompute_every замеров.
+    """
+    def __init__(self, window: int = 500, percentile: float = 95.0, recompute_every: int = 20):
+        self.percentile = percentile
+        self.recompute_every = recompute_every
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._since_recompute = 0
+        self._cached: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+        self._since_recompute += 1
+        if self._cached is None or self._since_recompute >= self.recompute_every:
+            self._recompute()
+
+    def _recompute(self):
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(self.percentile / 100 * len(ordered))) - 1))
+        self._cached = ordered[index]
+        self._since_recompute = 0
+
+    def value(self) -> Optional[float]:
+        """Текущий перцентиль в секундах или None, если замеров еще нет."""
+        return self._cached
+
+
+class HedgeBudget:
+    """
+    Бюджет повторных (страховочных) запросов: каждый основной запрос добавляет ratio кредита,
+    страховочный запрос тратит единицу. Так доля дополнительных запросов не превышает ratio.
+    """
+    def __init__(self, ratio: float, max_credit: float = 10.0):
+        self.ratio = ratio
+        self.max_credit = max_credit
+        self._credit = 0.0
+
+    def on_request(self):
+        self._credit = min(self.max_credit, self._credit + self.ratio)
+
+    def try_spend(self) -> bool:
+        if self._credit >= 1.0:
+            self._credit -= 1.0
+            return True
+        return False
@@ -0,0 +1,82 @@
+# backend/app/utils/rate_limit.py
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Token bucket: пополняется со скоростью rate токенов в секунду до емкости capacity.
+    Не потокобезопасен, рассчитан на использование внутри одного event loop.
+    """
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1.0) -> float:
+        """
+        Пытается взять токены без ожидания.
+        Возвращает 0, если удалось, иначе — сколько секунд ждать до появления нужного количества.
+        """
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        return (tokens - self.tokens) / self.rate
+
+    async def acquire(self, tokens: float = 1.0):
+        """Ждет, пока в корзине появятся токены, и забирает их."""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class KeyedRateLimiter:
+    """
+    Ограничение частоты по ключу (пользователь или IP) с общим лимитом на всех.
+    Корзины ключей хранятся в LRU ограниченного размера: давно не появлявшиеся ключи вытесняются.
+    """
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        global_rate: Optional[float] = None,
+        global_burst: Optional[float] = None,
+        max_keys: int = 10000,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._global = TokenBucket(global_rate, global_burst) if global_rate else None
+
+    def hit(self, key: str) -> float:
+        """Учитывает запрос. Возвращает 0, если он разрешен, иначе — через сколько секунд повторить."""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.burst)
+            self._buckets[key] = bucket
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+
+        wait = bucket.try_acquire()
+        if wait > 0:
+            return wait
+        if self._global is not None:
+            wait = self._global.try_acquire()
+            if wait > 0:
+                bucket.tokens += 1 # Запрос отклонен общим лимитом — не списываем его с клиента
+                return wait
+        return 0.0
@@ -121,4 +121,24 @@ def validate_init_data(
         return False, parsed_data if 'parsed_data' in locals() else None # Возвращаем распарсенные данные, если есть
     except Exception as e:
         logger.exception(f"Unexpected error during initData validation: {e}") # Логируем с traceback
-        return False, None
\ No newline at end of file
+        return False, None
+
+# Ключ результата проверки initData в состоянии запроса (scope["state"])
+INIT_DATA_STATE_KEY = "telegram_init_data"
+
+def validate_request_init_data(
+    state: Dict[str, Any],
+    init_data: str,
+    bot_token: str,
+) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    validate_init_data с запоминанием результата в состоянии запроса: admission middleware,
+    лимиты частоты и validate_telegram_data проверяют подпись одной и той же initData, а HMAC
+    считается один раз. Результат привязан к строке initData и токену бота.
+    """
+    cached = state.get(INIT_DATA_STATE_KEY)
+    if cached is not None and cached[0] == init_data and cached[1] == bot_token:
+        return cached[2]
+    result = validate_init_data(init_data=init_data, bot_token=bot_token)
+    state[INIT_DATA_STATE_KEY] = (init_data, bot_token, result)
+    return result
@@ -0,0 +1,140 @@
+# backend/benchmarks/bench_serialization.py
+"""
+Бенчмарк CPU на сериализацию ответов каталога и заказа.
+
+Сравнивает прежний путь (jsonable_encoder FastAPI + json.dumps, валидация заказа дважды)
+с новым (готовое JSON-тело из кэша, orjson, одна валидация заказа).
+
+Запуск из каталога backend:
+    python -m benchmarks.bench_serialization [--products 100] [--repeat 200]
+"""
+import argparse
+import json
+import time
+from typing import Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+
+from app.models.order import OrderWooCommerce
+from app.models.product import ProductListAdapter
+from app.services.cache import CachedJSON
+from app.utils.fast_json import dumps, orjson
+
+
+def make_product(product_id: int) -> Dict:
+    """Товар в форме, близкой к ответу WooCommerce REST API."""
+    return {
+        "id": product_id,
+        "name": f"Кроссовки беговые модель {product_id}",
+        "slug": f"krossovki-{product_id}",
+        "permalink": f"https://shop.example.com/product/krossovki-{product_id}/",
+        "date_created": "2025-03-01T10:00:00",
+        "type": "variable",
+        "status": "publish",
+        "featured": False,
+        "description": "<p>" + "Легкие и удобные кроссовки для бега по асфальту. " * 12 + "</p>",
+        "short_description": "<p>Легкие кроссовки для бега.</p>",
+        "sku": f"SKU-{product_id:05d}",
+        "price": "4990",
+        "regular_price": "5990",
+        "sale_price": "4990",
+        "on_sale": True,
+        "total_sales": product_id * 3,
+        "stock_quantity": None,
+        "stock_status": "instock",
+        "average_rating": "4.50",
+        "rating_count": 12,
+        "categories": [{"id": 15, "name": "Обувь", "slug": "obuv"}, {"id": 21, "name": "Бег", "slug": "beg"}],
+        "tags": [{"id": 3, "name": "Новинка", "slug": "new"}],
+        "images": [
+            {"id": product_id * 10 + i, "src": f"https://shop.example.com/img/{product_id}-{i}.jpg",
+             "name": f"{product_id}-{i}", "alt": ""}
+            for i in range(4)
+        ],
+        "attributes": [
+            {"id": 1, "name": "Размер", "position": 0, "visible": True, "variation": True,
+             "options": [str(size) for size in range(36, 46)]},
+            {"id": 2, "name": "Цвет", "position": 1, "visible": True, "variation": True,
+             "options": ["Черный", "Белый", "Синий"]},
+        ],
+        "variations": list(range(product_id * 100, product_id * 100 + 30)),
+        "meta_data": [{"id": i, "key": f"_meta_{i}", "value": f"value {i}"} for i in range(5)],
+    }
+
+
+def make_order() -> Dict:
+    return {
+        "id": 1001, "parent_id": 0, "status": "on-hold", "currency": "RUB", "total": "9980.00",
+        "customer_id": 0, "order_key": "wc_order_abc", "payment_method": "cod",
+        "payment_method_title": "Согласование с менеджером (Telegram)", "transaction_id": "",
+        "customer_note": "", "date_created": "2025-03-01T10:00:00",
+        "billing": {"first_name": "Иван", "last_name": "Иванов", "email": None, "phone": ""},
+        "shipping": {"first_name": "", "last_name": "", "phone": ""},
+        "line_items": [
+            {"id": i, "name": f"Товар {i}", "product_id": i, "variation_id": 0, "quantity": 1,
+             "subtotal": "4990.00", "total": "4990.00", "sku": f"SKU-{i}", "price": 4990,
+             "meta_data": [], "image": {"id": i, "src": f"https://shop.example.com/img/{i}.jpg"}}
+            for i in range(5)
+        ],
+        "meta_data": [{"id": 1, "key": "_telegram_user_id", "value": "123"}],
+    }
+
+
+def measure(func: Callable[[], object], repeat: int) -> float:
+    """Среднее процессорное время одного вызова, мкс."""
+    func()  # прогрев
+    started = time.process_time()
+    for _ in range(repeat):
+        func()
+    return (time.process_time() - started) / repeat * 1_000_000
+
+
+def report(title: str, results: List[tuple]):
+    print(f"\n{title}")
+    baseline = results[0][1]
+    for name, value in results:
+        speedup = baseline / value if value else float("inf")
+        print(f"  {name:<52} {value:>10.1f} µs  x{speedup:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100, help="Товаров в ответе списка")
+    parser.add_argument("--repeat", type=int, default=200, help="Повторов на замер")
+    args = parser.parse_args()
+
+    products = [make_product(i) for i in range(1, args.products + 1)]
+    entry = CachedJSON(products)
+    entry.body  # тело сериализуется один раз при заполнении кэша
+
+    print(f"JSON encoder: {'orjson' if orjson is not None else 'stdlib json (orjson не установлен)'}")
+    print(f"Список товаров: {args.products} шт., {len(entry.body) / 1024:.0f} KiB")
+
+    report("Список товаров (на запрос):", [
+        ("прежний путь: jsonable_encoder + json.dumps",
+         measure(lambda: json.dumps(jsonable_encoder(products), ensure_ascii=False).encode("utf-8"), args.repeat)),
+        ("с response_model: валидация + jsonable_encoder",
+         measure(lambda: json.dumps(jsonable_encoder(ProductListAdapter.validate_python(products))).encode(), args.repeat)),
+        ("промах кэша: fast_json.dumps", measure(lambda: dumps(products), args.repeat)),
+        ("попадание в кэш: готовое тело", measure(lambda: entry.body, args.repeat)),
+    ])
+
+    order = make_order()
+
+    def old_order_path():
+        # model_validate в эндпоинте + повторная валидация по response_model + jsonable_encoder
+        model = OrderWooCommerce.model_validate(order)
+        validated = OrderWooCommerce.model_validate(model.model_dump())
+        return json.dumps(jsonable_encoder(validated), ensure_ascii=False).encode("utf-8")
+
+    def new_order_path():
+        return OrderWooCommerce.model_validate(order).model_dump_json().encode("utf-8")
+
+    report("Ответ на создание заказа:", [
+        ("прежний путь: двойная валидация + jsonable_encoder", measure(old_order_path, args.repeat * 10)),
+        ("одна валидация + model_dump_json", measure(new_order_path, args.repeat * 10)),
+    ])
+
+
+if __name__ == "__main__":
+    main()
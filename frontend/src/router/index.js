@@ -7,6 +7,7 @@ import ProductView from '../views/ProductView.vue';
 import CartView from '../views/CartView.vue';
 import CheckoutSuccessView from '../views/CheckoutSuccessView.vue';
 import NotFoundView from '../views/NotFoundView.vue'; // Компонент для 404
+import { getStartParam } from '../utils/telegram';
 
 const routes = [
   {
@@ -60,6 +61,19 @@ const router = createRouter({
   },
 });
 
+// Прямая ссылка на товар (startapp=product_<id>, например из inline-режима бота):
+// при первом открытии сразу переходим на страницу товара
+let startParamHandled = false;
+router.beforeEach((to) => {
+  if (startParamHandled) return true;
+  startParamHandled = true;
+  const match = /^product_(\d+)$/.exec(getStartParam());
+  if (match && to.name === 'Catalog') {
+    return { name: 'Product', params: { id: match[1] } };
+  }
+  return true;
+});
+
 // (Опционально) Глобальный хук для обновления заголовка страницы
 // router.beforeEach((to, from, next) => {
 //   document.title = `${to.meta.title || 'Магазин'} | My Shop`;
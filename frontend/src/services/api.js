@@ -12,11 +12,16 @@ if (!API_BASE_URL) {
   // throw new Error("API Base URL is not configured.");
 }
 
+// Магазин, к которому относится Mini App (бэкенд обслуживает несколько магазинов).
+// Не задан — основной магазин (или магазин определяется по домену бэкенда)
+const SHOP_ID = import.meta.env.VITE_SHOP_ID;
+
 // Создаем экземпляр Axios
 const apiClient = axios.create({
   baseURL: API_BASE_URL,
   headers: {
     'Content-Type': 'application/json',
+    ...(SHOP_ID ? { 'X-Shop-Id': SHOP_ID } : {}),
     // Можно добавить другие общие заголовки, если нужно
   },
   timeout: 15000, // Таймаут запроса 15 секунд
@@ -20,6 +20,37 @@ export const fetchProductById = (productId) => {
   return apiClient.get(`/products/${productId}`);
 };
 
+/**
+ * Получает товары, которые покупают вместе с данным ("С этим покупают").
+ * @param {number|string} productId ID товара
+ * @param {number} limit Количество товаров
+ * @returns {Promise<Array>} Массив товаров (компактное представление: image вместо images)
+ */
+export const fetchRelatedProducts = (productId, limit = 8) => {
+  if (!productId) return Promise.reject(new Error("Product ID is required"));
+  return apiClient.get(`/products/${productId}/related`, { params: { limit } });
+};
+
+/**
+ * Получает подсказки поиска по мере ввода.
+ * @param {string} query Введенный текст
+ * @param {number} limit Количество товаров в подсказках
+ * @returns {Promise<object>} Объект { products: [...], categories: [...] }
+ */
+export const fetchSuggestions = (query, limit = 8) => {
+  return apiClient.get('/products/suggest', { params: { q: query, limit } });
+};
+
+/**
+ * Получает одним запросом все данные для первого экрана: категории, первую страницу товаров
+ * и остатки товаров корзины (сервер собирает их параллельно).
+ * @param {object} params { per_page, category?, cart? (ID товаров корзины через запятую) }
+ * @returns {Promise<object>} Объект { categories, products, stock, errors } (неполученный раздел равен null)
+ */
+export const fetchBootstrap = (params = {}) => {
+  return apiClient.get('/bootstrap', { params });
+};
+
 /**
  * Получает список категорий.
  * @param {object} params Параметры запроса (parent, hide_empty, etc.)
@@ -51,4 +82,14 @@ export const createOrder = (payload, initData) => {
   };
 
   return apiClient.post('/orders', payload, config);
-};
\ No newline at end of file
+};
+
+/**
+ * Получает актуальные остатки товаров (дешевый запрос, подходит для периодического опроса).
+ * @param {Array<number>} productIds Массив ID товаров
+ * @returns {Promise<object>} Объект { [productId]: { stock_status, stock_quantity, variations? } }
+ */
+export const fetchStock = (productIds = []) => {
+  if (!productIds.length) return Promise.resolve({});
+  return apiClient.get('/stock', { params: { ids: productIds.join(',') } });
+};
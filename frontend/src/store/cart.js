@@ -1,6 +1,7 @@
 // frontend/src/store/cart.js
 import { defineStore } from 'pinia';
 import { ref, computed, watch } from 'vue';
+import { fetchStock } from '@/services';
 
 // Ключ для localStorage
 const CART_STORAGE_KEY = 'my_woocommerce_cart';
@@ -24,6 +25,8 @@ export const useCartStore = defineStore('cart', () => {
   // --- State ---
   // Загружаем начальное состояние из localStorage
   const items = ref(loadCartFromStorage()); // Array of { product_id, name, price, quantity, image, variation_id? }
+  // Актуальные остатки по товарам корзины (не сохраняются в localStorage)
+  const stockLevels = ref({}); // { [product_id]: { stock_status, stock_quantity, variations? } }
 
   // --- Getters ---
   const totalItems = computed(() => {
@@ -40,6 +43,16 @@ export const useCartStore = defineStore('cart', () => {
 
   const isEmpty = computed(() => items.value.length === 0);
 
+  // Остаток для позиции корзины (с учетом вариации), null - если данных еще нет
+  const getItemStock = (item) => {
+    const productStock = stockLevels.value[item.product_id];
+    if (!productStock) return null;
+    if (item.variation_id && productStock.variations) {
+      return productStock.variations[item.variation_id] || null;
+    }
+    return productStock;
+  };
+
   // --- Actions ---
   const findItemIndex = (productId, variationId = null) => {
     return items.value.findIndex(item =>
@@ -94,6 +107,17 @@ export const useCartStore = defineStore('cart', () => {
     items.value = [];
   };
 
+  const refreshStock = async () => {
+    const productIds = [...new Set(items.value.map(item => item.product_id))];
+    if (!productIds.length) return;
+    try {
+      stockLevels.value = await fetchStock(productIds);
+    } catch (e) {
+      // Остатки - вспомогательная информация, ошибку только логируем
+      console.error("Failed to refresh stock levels", e);
+    }
+  };
+
   // --- Persistence ---
   // Сохраняем корзину в localStorage при любом изменении
   watch(items, (newCartItems) => {
@@ -106,9 +130,12 @@ export const useCartStore = defineStore('cart', () => {
     totalItems,
     totalPrice,
     isEmpty,
+    stockLevels,
+    getItemStock,
     addToCart,
     updateQuantity,
     removeFromCart,
     clearCart,
+    refreshStock,
   };
 });
\ No newline at end of file
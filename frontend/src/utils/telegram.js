@@ -48,6 +48,14 @@ const isTelegramWebAppAvailable = () => {
     return getInitDataUnsafe()?.user || null;
   };
   
+  /**
+   * Параметр запуска Mini App (startapp из прямой ссылки), например "product_123".
+   * @returns {string} start_param or empty string.
+   */
+  export const getStartParam = () => {
+    return getInitDataUnsafe()?.start_param || '';
+  };
+
   /**
    * Закрывает Mini App.
    */